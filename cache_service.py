@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+统一缓存服务
+所有分析器共用一个线程安全的缓存，按命名空间划分数据并从配置读取过期时间。
+本地内存作为一级缓存（有内存上限），可选Redis或本地SQLite文件作为二级缓存，
+使多个gunicorn worker之间共享已获取的数据；
+同一个键同一时间只由一个线程/进程加载（get_or_set），其余请求等待结果，避免缓存失效时并发重复加载
+"""
+# cache_service.py
+import os
+import time
+import uuid
+import zlib
+import pickle
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from memory_cache import BoundedCache, key_suffix_type
+from stock_config import DATA_CACHE_CONFIG
+from fundamental_config import CACHE_CONFIG
+
+_MISSING = object()
+
+# zlib压缩数据的前缀；未压缩的pickle数据以协议头 b'\x80' 开头，旧数据仍可读取
+_ZLIB_MARKER = b'Z'
+
+
+class PayloadSerializer:
+    """
+    二级缓存的序列化
+    使用pickle最高协议，DataFrame/ndarray 的数据块按原始字节写出，不逐个元素转换；
+    超过 compress_min_bytes 的数据再用zlib快速压缩（技术指标数据和JSON响应通常可压缩到1/3左右），
+    减少Redis的网络传输和内存占用
+
+    参数:
+        compress_min_bytes: 压缩阈值（字节），为None时不压缩
+        level: zlib压缩级别，默认1（速度优先）
+    """
+
+    def __init__(self, compress_min_bytes=16384, level=1):
+        self.compress_min_bytes = compress_min_bytes
+        self.level = level
+
+    def dumps(self, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.compress_min_bytes is not None and len(data) >= self.compress_min_bytes:
+            compressed = zlib.compress(data, self.level)
+            if len(compressed) < len(data):
+                return _ZLIB_MARKER + compressed
+        return data
+
+    @staticmethod
+    def loads(data):
+        data = bytes(data)
+        if data[:1] == _ZLIB_MARKER:
+            data = zlib.decompress(data[1:])
+        return pickle.loads(data)
+
+
+class RedisBackend:
+    """
+    Redis二级缓存
+
+    参数:
+        url: Redis地址
+        prefix: 键前缀
+        serializer: PayloadSerializer，默认不压缩阈值16KB
+        client: 已创建的Redis客户端（兼容redis-py接口即可），默认按url创建
+    """
+
+    def __init__(self, url, prefix, serializer=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.serializer = serializer or PayloadSerializer()
+
+    def get(self, key):
+        """返回 (值, 剩余秒数)，不存在时返回None"""
+        pipe = self.client.pipeline()
+        pipe.get(self.prefix + key)
+        pipe.pttl(self.prefix + key)
+        data, pttl = pipe.execute()
+        if data is None:
+            return None
+        return self.serializer.loads(data), (pttl / 1000.0 if pttl and pttl > 0 else None)
+
+    def set(self, key, value, ttl):
+        data = self.serializer.dumps(value)
+        if ttl is not None:
+            self.client.set(self.prefix + key, data, px=max(int(ttl * 1000), 1))
+        else:
+            self.client.set(self.prefix + key, data)
+
+    def add(self, key, value, ttl):
+        """键不存在时写入，返回是否写入（用于加载锁）"""
+        data = self.serializer.dumps(value)
+        return bool(self.client.set(self.prefix + key, data, px=max(int(ttl * 1000), 1), nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self, key_prefix=''):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}{key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class DiskBackend:
+    """本地SQLite文件二级缓存，同一台机器上的多个进程共享"""
+
+    def __init__(self, path, serializer=None):
+        db_dir = os.path.dirname(path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.path = path
+        self.serializer = serializer or PayloadSerializer()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        """打开数据库连接，正常结束时提交，最后关闭连接"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """返回 (值, 剩余秒数)，不存在或已过期时返回None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT value, expires_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= time.time():
+                conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                return None
+        return self.serializer.loads(row[0]), (row[1] - time.time() if row[1] is not None else None)
+
+    def set(self, key, value, ttl):
+        data = self.serializer.dumps(value)
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                         (key, sqlite3.Binary(data), expires_at))
+
+    def add(self, key, value, ttl):
+        """键不存在或已过期时写入，返回是否写入（用于加载锁）"""
+        data = self.serializer.dumps(value)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = conn.execute('INSERT OR IGNORE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                                  (key, sqlite3.Binary(data), now + ttl))
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+
+    def clear(self, key_prefix=''):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key LIKE ? ESCAPE '\\'",
+                         (key_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%',))
+
+
+class CacheNamespace:
+    """
+    命名空间视图，接口兼容dict（in / [] / get / pop / clear），
+    分析器直接用它替换原来的 self.data_cache 字典
+    """
+
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+
+    def get(self, key, default=None):
+        return self.service.get(self.name, key, default)
+
+    def set(self, key, value, ttl=None):
+        self.service.set(self.name, key, value, ttl)
+
+    def get_or_set(self, key, loader, ttl=None):
+        return self.service.get_or_set(self.name, key, loader, ttl)
+
+    def pop(self, key, default=None):
+        value = self.service.get(self.name, key, default)
+        self.service.delete(self.name, key)
+        return value
+
+    def clear(self):
+        self.service.clear(self.name)
+
+    def __contains__(self, key):
+        return self.service.get(self.name, key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.service.get(self.name, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.service.set(self.name, key, value)
+
+    def __delitem__(self, key):
+        self.service.delete(self.name, key)
+
+
+class CacheService:
+    """
+    统一缓存服务
+
+    参数:
+        config: 缓存配置，默认使用 stock_config.DATA_CACHE_CONFIG
+    """
+
+    def __init__(self, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or DATA_CACHE_CONFIG
+
+        # 命名空间过期时间：基本面分析沿用 fundamental_config.CACHE_CONFIG
+        self.ttl = dict(CACHE_CONFIG)
+        self.ttl.update(self.config.get('namespaces', {}))
+        self.default_ttl = self.config.get('default_ttl')
+
+        self.local = BoundedCache(max_bytes=self.config['max_bytes'])
+        self.serializer = PayloadSerializer(self.config.get('compress_min_bytes', 16384),
+                                            self.config.get('compress_level', 1))
+        self.backend = self._create_backend()
+        self.backend_hits = 0
+        self.backend_errors = 0
+        self.fill_waits = 0
+        self._lock = threading.Lock()
+
+        # 加载锁：本进程内正在加载的键 -> Event，跨进程通过二级缓存中的锁键协调
+        self.fill_timeout = self.config.get('fill_lock_timeout', 30)
+        self.fill_poll_interval = self.config.get('fill_poll_interval', 0.05)
+        self._fills = {}
+        self._token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _create_backend(self):
+        """按配置创建二级缓存，不可用时只使用本地内存"""
+        backend = (self.config.get('backend') or 'memory').lower()
+        try:
+            if backend == 'redis':
+                if not self.config.get('redis_url'):
+                    self.logger.warning("未配置REDIS_URL，统一缓存只使用本地内存")
+                    return None
+                self.logger.info("统一缓存使用Redis二级缓存")
+                return RedisBackend(self.config['redis_url'], self.config.get('key_prefix', 'stockanal:'),
+                                    serializer=self.serializer)
+            if backend == 'disk':
+                self.logger.info(f"统一缓存使用磁盘二级缓存: {self.config['disk_path']}")
+                return DiskBackend(self.config['disk_path'], serializer=self.serializer)
+        except Exception as e:
+            self.logger.warning(f"二级缓存 {backend} 初始化失败，只使用本地内存: {str(e)}")
+        return None
+
+    def namespace(self, name):
+        """获取命名空间视图"""
+        return CacheNamespace(self, name)
+
+    def ttl_for(self, namespace, key):
+        """
+        获取过期时间（秒）。命名空间配置为字典时，按缓存键后缀区分数据类型，
+        例如 stock 命名空间下的 price / news / info
+        """
+        ttl = self.ttl.get(namespace, self.default_ttl)
+        if isinstance(ttl, dict):
+            ttl = ttl.get(key_suffix_type(key), self.default_ttl)
+        return ttl
+
+    @staticmethod
+    def _full_key(namespace, key):
+        return f"{namespace}:{key}"
+
+    def get(self, namespace, key, default=None):
+        full_key = self._full_key(namespace, key)
+        value = self.local.get(full_key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.backend is None:
+            return default
+
+        try:
+            entry = self.backend.get(full_key)
+        except Exception as e:
+            self._backend_error('读取', e)
+            return default
+        if entry is None:
+            return default
+
+        value, remaining = entry
+        with self._lock:
+            self.backend_hits += 1
+        # 回填一级缓存，过期时间不超过二级缓存中的剩余时间
+        self.local.set(full_key, value, ttl=remaining if remaining is not None else self.ttl_for(namespace, key))
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        full_key = self._full_key(namespace, key)
+        ttl = ttl if ttl is not None else self.ttl_for(namespace, key)
+        self.local.set(full_key, value, ttl=ttl)
+        if self.backend is not None:
+            try:
+                self.backend.set(full_key, value, ttl)
+            except Exception as e:
+                self._backend_error('写入', e)
+
+    def delete(self, namespace, key):
+        full_key = self._full_key(namespace, key)
+        self.local.pop(full_key)
+        if self.backend is not None:
+            try:
+                self.backend.delete(full_key)
+            except Exception as e:
+                self._backend_error('删除', e)
+
+    def clear(self, namespace=None):
+        """清空指定命名空间，namespace为None时清空全部缓存"""
+        if namespace is None:
+            self.local.clear()
+            prefix = ''
+        else:
+            prefix = self._full_key(namespace, '')
+            for full_key in self.local.keys():
+                if full_key.startswith(prefix):
+                    self.local.pop(full_key)
+        if self.backend is not None:
+            try:
+                self.backend.clear(prefix)
+            except Exception as e:
+                self._backend_error('清理', e)
+
+    @staticmethod
+    def _lock_key(full_key):
+        return f"fill-lock:{full_key}"
+
+    def acquire_fill(self, namespace, key):
+        """
+        获取键的加载权：同一时间只有一个线程（跨进程时通过二级缓存协调）加载同一个键
+        返回True时调用方加载数据、set 后调用 release_fill；返回False时调用 wait_fill 等待结果
+        """
+        full_key = self._full_key(namespace, key)
+        with self._lock:
+            if full_key in self._fills:
+                return False
+            event = self._fills[full_key] = threading.Event()
+
+        if self.backend is not None:
+            try:
+                acquired = self.backend.add(self._lock_key(full_key), self._token, self.fill_timeout)
+            except Exception as e:
+                # 二级缓存不可用时只在本进程内防止重复加载
+                self._backend_error('加锁', e)
+                acquired = True
+            if not acquired:
+                with self._lock:
+                    self._fills.pop(full_key, None)
+                event.set()
+                return False
+        return True
+
+    def release_fill(self, namespace, key):
+        """释放加载权并唤醒等待的线程"""
+        full_key = self._full_key(namespace, key)
+        with self._lock:
+            event = self._fills.pop(full_key, None)
+        if event is None:
+            return
+        event.set()
+        if self.backend is not None:
+            lock_key = self._lock_key(full_key)
+            try:
+                entry = self.backend.get(lock_key)
+                if entry is not None and entry[0] == self._token:
+                    self.backend.delete(lock_key)
+            except Exception as e:
+                self._backend_error('解锁', e)
+
+    def wait_fill(self, namespace, key, default=None):
+        """
+        等待其他线程/进程加载的结果，最多等待 fill_lock_timeout 秒；
+        加载方失败或超时时返回 default，由调用方自行加载
+        """
+        full_key = self._full_key(namespace, key)
+        deadline = time.time() + self.fill_timeout
+        with self._lock:
+            self.fill_waits += 1
+            event = self._fills.get(full_key)
+        if event is not None:
+            event.wait(self.fill_timeout)
+            # 本进程的加载方可能因其他进程已持有锁而放弃，此时继续等待其他进程的结果
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING or self.backend is None:
+                return default if value is _MISSING else value
+
+        # 其他进程正在加载：轮询二级缓存，直到写入结果或锁释放（过期）
+        while time.time() < deadline:
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                return value
+            try:
+                if self.backend is None or self.backend.get(self._lock_key(full_key)) is None:
+                    break
+            except Exception as e:
+                self._backend_error('读取', e)
+                break
+            time.sleep(self.fill_poll_interval)
+        return self.get(namespace, key, default)
+
+    def get_or_set(self, namespace, key, loader, ttl=None):
+        """
+        读取缓存，不存在时调用 loader() 加载并写入；
+        同一个键的并发请求只有一个执行 loader，其余等待其结果（防止缓存击穿）
+        """
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        if self.acquire_fill(namespace, key):
+            try:
+                # 获取加载权前其他线程可能刚写入
+                value = self.get(namespace, key, _MISSING)
+                if value is _MISSING:
+                    value = loader()
+                    self.set(namespace, key, value, ttl)
+                return value
+            finally:
+                self.release_fill(namespace, key)
+
+        value = self.wait_fill(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(namespace, key, value, ttl)
+        return value
+
+    def _backend_error(self, action, error):
+        with self._lock:
+            self.backend_errors += 1
+        self.logger.warning(f"二级缓存{action}失败: {str(error)}")
+
+    def stats(self):
+        """返回缓存统计信息"""
+        stats = self.local.stats()
+        stats.update({
+            'backend': type(self.backend).__name__ if self.backend is not None else None,
+            'backend_hits': self.backend_hits,
+            'backend_errors': self.backend_errors,
+            'fill_waits': self.fill_waits
+        })
+        return stats
+
+
+# 全局实例
+cache_service = CacheService()
@@ -5,17 +5,20 @@ import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from cache_service import cache_service
+from single_flight import coalesce
 
 
 class CapitalFlowAnalyzer:
     def __init__(self):
-        self.data_cache = {}
+        self.data_cache = cache_service.namespace('capital_flow')
 
         # 设置日志记录
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
+    @coalesce()
     def get_concept_fund_flow(self, period="10日排行"):
         """获取概念/行业资金流向数据"""
         try:
@@ -23,11 +26,9 @@ class CapitalFlowAnalyzer:
 
             # 检查缓存
             cache_key = f"concept_fund_flow_{period}"
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果在最近一小时内有缓存数据，则返回缓存数据
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    return cached_data
+            cached_data = self.data_cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
 
             # 从akshare获取数据
             concept_data = ak.stock_fund_flow_concept(symbol=period)
@@ -53,7 +54,7 @@ class CapitalFlowAnalyzer:
                     continue
 
             # 缓存结果
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.data_cache[cache_key] = result
 
             return result
         except Exception as e:
@@ -62,6 +63,7 @@ class CapitalFlowAnalyzer:
             # 如果API调用失败则返回模拟数据
             return self._generate_mock_concept_fund_flow(period)
 
+    @coalesce()
     def get_individual_fund_flow_rank(self, period="10日"):
         """获取个股资金流向排名"""
         try:
@@ -69,11 +71,9 @@ class CapitalFlowAnalyzer:
 
             # 检查缓存
             cache_key = f"individual_fund_flow_rank_{period}"
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果在最近一小时内有缓存数据，则返回缓存数据
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    return cached_data
+            cached_data = self.data_cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
 
             # 从akshare获取数据
             stock_data = ak.stock_individual_fund_flow_rank(indicator=period)
@@ -108,7 +108,7 @@ class CapitalFlowAnalyzer:
                     continue
 
             # 缓存结果
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.data_cache[cache_key] = result
 
             return result
         except Exception as e:
@@ -117,6 +117,7 @@ class CapitalFlowAnalyzer:
             # 如果API调用失败则返回模拟数据
             return self._generate_mock_individual_fund_flow_rank(period)
 
+    @coalesce()
     def get_individual_fund_flow(self, stock_code, market_type="", re_date="10日"):
         """获取个股资金流向数据"""
         try:
@@ -124,11 +125,9 @@ class CapitalFlowAnalyzer:
 
             # 检查缓存
             cache_key = f"individual_fund_flow_{stock_code}_{market_type}"
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果在一小时内有缓存数据，则返回缓存数据
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    return cached_data
+            cached_data = self.data_cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
 
             # 如果未提供市场类型，则根据股票代码判断
             if not market_type:
@@ -185,7 +184,7 @@ class CapitalFlowAnalyzer:
                 }
 
             # Cache the result
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.data_cache[cache_key] = result
 
             return result
         except Exception as e:
@@ -194,6 +193,7 @@ class CapitalFlowAnalyzer:
             # 如果API调用失败则返回模拟数据
             return self._generate_mock_individual_fund_flow(stock_code, market_type)
 
+    @coalesce()
     def get_sector_stocks(self, sector):
         """获取特定行业的股票"""
         try:
@@ -201,11 +201,9 @@ class CapitalFlowAnalyzer:
 
             # 检查缓存
             cache_key = f"sector_stocks_{sector}"
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果在一小时内有缓存数据，则返回缓存数据
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    return cached_data
+            cached_data = self.data_cache.get(cache_key)
+            if cached_data is not None:
+                return cached_data
 
             # 尝试从akshare获取数据
             try:
@@ -231,7 +229,7 @@ class CapitalFlowAnalyzer:
                             continue
 
                     # 缓存结果
-                    self.data_cache[cache_key] = (datetime.now(), result)
+                    self.data_cache[cache_key] = result
                     return result
             except Exception as e:
                 self.logger.warning(f"Failed to get sector stocks from API: {str(e)}")
@@ -239,7 +237,7 @@ class CapitalFlowAnalyzer:
 
             # 如果到达这里，说明无法从API获取数据，返回模拟数据
             result = self._generate_mock_sector_stocks(sector)
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.data_cache[cache_key] = result
             return result
 
         except Exception as e:
@@ -1,4 +1,7 @@
 import os
+import json
+import logging
+import traceback
 from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -8,6 +11,8 @@ from datetime import datetime
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///data/stock_analyzer.db')
 USE_DATABASE = os.getenv('USE_DATABASE', 'False').lower() == 'true'
 
+logger = logging.getLogger(__name__)
+
 # 创建引擎
 engine = create_engine(DATABASE_URL)
 Base = declarative_base()
@@ -96,6 +101,61 @@ def get_session():
     return Session()
 
 
+# 保存分析结果（Web进程和任务工作进程共用）
+def save_analysis_result_to_db(stock_code, market_type, analysis_result):
+    """保存分析结果到数据库"""
+    if not USE_DATABASE:
+        logger.info("数据库功能未启用，跳过保存")
+        return
+    
+    logger.info(f"开始保存分析结果到数据库: {stock_code}, {market_type}")
+    
+    session = get_session()
+    try:
+        # 提取基本信息
+        scores = analysis_result.get('scores', {})
+        # 兼容两种字段名：total_score 和 total
+        total_score = scores.get('total_score', scores.get('total', 0))
+        recommendation = analysis_result.get('recommendation', {}).get('action', '')
+        
+        logger.info(f"提取的信息 - 评分: {total_score}, 建议: {recommendation}")
+        
+        # 删除同一只股票的旧记录，只保留最新的
+        existing_records = session.query(AnalysisResult).filter(
+            AnalysisResult.stock_code == stock_code,
+            AnalysisResult.market_type == market_type
+        ).all()
+        
+        if existing_records:
+            logger.info(f"删除股票 {stock_code} 的 {len(existing_records)} 条旧记录")
+            for record in existing_records:
+                session.delete(record)
+            session.flush()  # 立即执行删除，但不提交
+        
+        # 创建新的分析记录
+        analysis_record = AnalysisResult(
+            stock_code=stock_code,
+            market_type=market_type,
+            total_score=total_score,
+            recommendation=recommendation,
+            analysis_data=json.dumps(analysis_result, ensure_ascii=False, default=str),
+            analysis_date=datetime.now()
+        )
+        
+        session.add(analysis_record)
+        session.commit()
+        
+        logger.info(f"分析结果已成功保存到数据库: {stock_code}, ID: {analysis_record.id}")
+        
+    except Exception as e:
+        session.rollback()
+        logger.error(f"保存分析结果到数据库失败: {str(e)}")
+        logger.error(f"错误详情: {traceback.format_exc()}")
+        raise
+    finally:
+        session.close()
+
+
 # 如果启用数据库，则初始化
 if USE_DATABASE:
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+收盘后分析结果预计算
+每天收盘后（run_task_cleaner 在16:30左右清理缓存后提交 eod_materialize 任务，由任务工作进程执行），
+对常用股票批量计算技术指标、技术面评分、支撑压力位和风险指标并保存到SQLite；
+个股分析、风险分析和K线数据接口在非交易时段优先读取预计算结果（下一次收盘前有效）；
+交易时段内最新价和指标随盘中行情变化，与未覆盖的股票一样实时计算
+"""
+# eod_analytics.py
+import os
+import json
+import time
+import itertools
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import fast_json
+from cache_service import PayloadSerializer
+from kline_store import last_market_close, in_trading_session
+from stock_config import EOD_CONFIG, SCAN_CONFIG
+
+
+class EODStore:
+    """
+    预计算结果存储，每只股票保留最近一次的结果
+
+    参数:
+        db_path: SQLite数据库文件路径，默认读取 EOD_CONFIG['db_path']
+        config: 配置，默认使用 EOD_CONFIG
+    """
+
+    def __init__(self, db_path=None, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or EOD_CONFIG
+        self.db_path = db_path or self.config['db_path']
+        self.serializer = PayloadSerializer()
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """打开数据库连接，正常结束时提交，最后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """创建数据表"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS eod_analytics (
+                    market TEXT NOT NULL,
+                    code TEXT NOT NULL,
+                    trade_date TEXT,
+                    materialized_at TEXT NOT NULL,
+                    indicators BLOB,
+                    technical_score TEXT,
+                    support_resistance TEXT,
+                    risk TEXT,
+                    PRIMARY KEY (market, code)
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS eod_runs (
+                    market TEXT NOT NULL,
+                    run_date TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    total INTEGER,
+                    succeeded INTEGER,
+                    PRIMARY KEY (market, run_date)
+                )
+            ''')
+
+    @staticmethod
+    def _to_json(value):
+        return None if value is None else fast_json.dumps(value).decode('utf-8')
+
+    def save(self, stock_code, market_type, indicators, technical_score, support_resistance, risk=None,
+             materialized_at=None):
+        """保存一只股票的预计算结果"""
+        materialized_at = materialized_at or datetime.now()
+        trade_date = None
+        if indicators is not None and not indicators.empty and 'date' in indicators.columns:
+            trade_date = str(indicators['date'].iloc[-1])[:10]
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO eod_analytics (market, code, trade_date, materialized_at, indicators, '
+                'technical_score, support_resistance, risk) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (market_type, str(stock_code), trade_date, materialized_at.isoformat(),
+                 sqlite3.Binary(self.serializer.dumps(indicators)), self._to_json(technical_score),
+                 self._to_json(support_resistance), self._to_json(risk)))
+
+    def get(self, stock_code, market_type='A', now=None):
+        """
+        读取预计算结果
+
+        返回:
+            {'trade_date', 'materialized_at', 'indicators', 'technical_score', 'support_resistance', 'risk'}，
+            没有结果、结果早于最近一次收盘（已有新的K线）或当前处于交易时段时返回None
+        """
+        if in_trading_session(market_type, now):
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT trade_date, materialized_at, indicators, technical_score, support_resistance, risk '
+                'FROM eod_analytics WHERE market = ? AND code = ?', (market_type, str(stock_code))).fetchone()
+        if row is None:
+            return None
+
+        materialized_at = datetime.fromisoformat(row[1])
+        if materialized_at < last_market_close(market_type, now):
+            return None
+
+        return {
+            'trade_date': row[0],
+            'materialized_at': materialized_at,
+            'indicators': self.serializer.loads(row[2]),
+            'technical_score': json.loads(row[3]) if row[3] else None,
+            'support_resistance': json.loads(row[4]) if row[4] else None,
+            'risk': json.loads(row[5]) if row[5] else None
+        }
+
+    def has_run(self, run_date, market_type='A'):
+        """指定交易日的预计算是否已完成"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT finished_at FROM eod_runs WHERE market = ? AND run_date = ?',
+                               (market_type, run_date)).fetchone()
+        return row is not None and row[0] is not None
+
+    def record_run(self, run_date, market_type, started_at, total, succeeded):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO eod_runs (market, run_date, started_at, finished_at, total, succeeded) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (market_type, run_date, started_at.isoformat(), datetime.now().isoformat(), total, succeeded))
+
+    def prune(self, retention_days=None):
+        """删除超过保留天数的结果，返回删除数量"""
+        retention_days = retention_days if retention_days is not None else self.config.get('retention_days', 7)
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        with self._connect() as conn:
+            deleted = conn.execute('DELETE FROM eod_analytics WHERE materialized_at < ?', (cutoff,)).rowcount
+            conn.execute('DELETE FROM eod_runs WHERE started_at < ?', (cutoff,))
+        return deleted
+
+    def stats(self):
+        """返回统计信息：结果数量和最近一次预计算"""
+        with self._connect() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM eod_analytics').fetchone()[0]
+            last_run = conn.execute('SELECT market, run_date, started_at, finished_at, total, succeeded FROM eod_runs '
+                                    'ORDER BY started_at DESC LIMIT 1').fetchone()
+        stats = {'count': count, 'last_run': None}
+        if last_run:
+            stats['last_run'] = dict(zip(['market', 'run_date', 'started_at', 'finished_at', 'total', 'succeeded'],
+                                         last_run))
+        return stats
+
+
+class EODMaterializer:
+    """
+    收盘后预计算任务
+
+    参数:
+        analyzer: StockAnalyzer 实例
+        risk_monitor: RiskMonitor 实例，为None时不计算风险指标
+        store: EODStore，默认使用全局 eod_store
+        config: 配置，默认使用 EOD_CONFIG
+    """
+
+    def __init__(self, analyzer, risk_monitor=None, store=None, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.analyzer = analyzer
+        self.risk_monitor = risk_monitor
+        self.store = store or eod_store
+        self.config = config or EOD_CONFIG
+
+    def resolve_universe(self, market_type='A'):
+        """预计算的股票范围：配置的股票、指数成分股和最近分析过的股票，去重后不超过 max_stocks"""
+        stocks = list(self.config.get('stocks', []))
+
+        for index_code in self.config.get('indices', []):
+            try:
+                import akshare as ak
+                cons = ak.index_stock_cons_weight_csindex(symbol=index_code)
+                if '成分券代码' in cons.columns:
+                    stocks.extend(cons['成分券代码'].astype(str).tolist())
+            except Exception as e:
+                self.logger.warning(f"获取指数 {index_code} 成分股失败: {str(e)}")
+
+        if self.config.get('recent_days'):
+            stocks.extend(self._recent_stocks(market_type))
+
+        universe = list(dict.fromkeys(str(code) for code in stocks))
+        return universe[:self.config.get('max_stocks') or None]
+
+    def _recent_stocks(self, market_type):
+        """最近几天有分析记录的股票"""
+        from database import USE_DATABASE, get_session, AnalysisResult
+        if not USE_DATABASE:
+            return []
+        cutoff = datetime.now() - timedelta(days=self.config['recent_days'])
+        session = get_session()
+        try:
+            rows = session.query(AnalysisResult.stock_code).filter(
+                AnalysisResult.market_type == market_type,
+                AnalysisResult.analysis_date >= cutoff
+            ).distinct().all()
+            return [row[0] for row in rows]
+        except Exception as e:
+            self.logger.warning(f"读取最近分析过的股票失败: {str(e)}")
+            return []
+        finally:
+            session.close()
+
+    def materialize_stock(self, stock_code, market_type='A'):
+        """计算并保存一只股票的技术指标、技术面评分、支撑压力位和风险指标"""
+        df = self.analyzer.get_indicator_data(stock_code, market_type)
+        if df is None or len(df) < 2:
+            raise ValueError(f"股票 {stock_code} 的数据不足")
+
+        technical_score = self.analyzer.calculate_technical_score(df)
+        support_resistance = self.analyzer.identify_support_resistance(df)
+        risk = None
+        if self.risk_monitor is not None:
+            risk = self.risk_monitor.analyze_stock_risk(stock_code, market_type, use_materialized=False)
+            if 'error' in risk:
+                risk = None
+        self.store.save(stock_code, market_type, df, technical_score, support_resistance, risk)
+
+    def run(self, stock_list=None, market_type=None, force=False, progress_callback=None, should_stop=None):
+        """
+        执行预计算
+
+        参数:
+            stock_list: 股票代码列表，默认按 resolve_universe 确定
+            market_type: 市场类型，默认读取配置
+            force: 为False时同一交易日只执行一次
+            progress_callback: 进度回调 callback(processed, total)
+            should_stop: 返回True时停止（用于任务取消）
+
+        返回:
+            {'run_date', 'total', 'succeeded', 'failed', 'elapsed'}，已执行过时包含 'skipped': True
+        """
+        from scan_engine import get_shared_executor
+
+        market_type = market_type or self.config.get('market_type', 'A')
+        run_date = last_market_close(market_type).strftime('%Y-%m-%d')
+        if not force and self.store.has_run(run_date, market_type):
+            self.logger.info(f"{run_date} 的收盘后预计算已完成，跳过")
+            return {'run_date': run_date, 'skipped': True}
+
+        started_at = datetime.now()
+        start_time = time.time()
+        stock_list = list(stock_list) if stock_list is not None else self.resolve_universe(market_type)
+        total = len(stock_list)
+        self.logger.info(f"开始收盘后预计算 {run_date}，共 {total} 只股票")
+
+        processed = 0
+        failed = 0
+        cancelled = False
+        chunk_size = SCAN_CONFIG.get('prefetch_chunk') or total or 1
+
+        def iter_stocks():
+            """按块批量预取K线后逐只产出，预取前检查取消"""
+            nonlocal cancelled
+            for offset in range(0, total, chunk_size):
+                if should_stop is not None and should_stop():
+                    cancelled = True
+                    return
+                chunk = stock_list[offset:offset + chunk_size]
+                # 批量预取K线，逐只计算时直接读取本地数据
+                try:
+                    self.analyzer.prefetch_stock_data(chunk, market_type)
+                except Exception as e:
+                    self.logger.warning(f"批量预取K线失败，逐只获取数据: {str(e)}")
+                yield from chunk
+
+        # 与市场扫描共用线程池，同一时间最多提交 window 个任务，不阻塞同一进程中的其他分析
+        executor = get_shared_executor()
+        window = SCAN_CONFIG.get('submit_window') or 2 * SCAN_CONFIG['max_workers']
+        queued = iter_stocks()
+        futures = {}
+        pending = set()
+
+        def submit(count):
+            for stock_code in itertools.islice(queued, count):
+                future = executor.submit(self.materialize_stock, stock_code, market_type)
+                futures[future] = stock_code
+                pending.add(future)
+
+        try:
+            submit(window)
+            while pending:
+                if should_stop is not None and should_stop():
+                    cancelled = True
+                    break
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    processed += 1
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.logger.warning(f"预计算股票 {futures[future]} 失败: {str(e)}")
+                if done and progress_callback is not None:
+                    progress_callback(processed, total)
+                submit(window - len(pending))
+        finally:
+            for future in pending:
+                future.cancel()
+
+        if cancelled:
+            self.logger.info(f"收盘后预计算被取消，已处理 {processed}/{total} 只股票")
+
+        succeeded = processed - failed
+        if not cancelled:
+            self.store.record_run(run_date, market_type, started_at, total, succeeded)
+        pruned = self.store.prune()
+
+        elapsed = time.time() - start_time
+        self.logger.info(f"收盘后预计算完成 {run_date}：成功 {succeeded}，失败 {failed}，"
+                         f"清理过期结果 {pruned} 条，耗时 {elapsed:.1f}秒")
+        return {'run_date': run_date, 'total': total, 'succeeded': succeeded, 'failed': failed,
+                'elapsed': round(elapsed, 2)}
+
+
+# 全局实例
+eod_store = EODStore() if EOD_CONFIG.get('enabled', True) else None
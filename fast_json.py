@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+快速JSON序列化
+安装了 orjson 时直接由 orjson 编码，NumPy 标量/数组、日期和 DataFrame 只在遇到时转换，
+不再先用Python递归遍历整个结果；未安装时回退到标准库 json
+NaN、Inf 和日期的输出与原 custom_jsonify 相同：NaN/-Inf 输出 null，NumPy 的 +Inf 输出 1e308，
+Python 的 +Inf 输出 null，日期输出 ISO 格式
+"""
+# fast_json.py
+import json
+import math
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+# DataFrame/Series 中日期时间列的默认格式
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def _numpy_float(value):
+    value = float(value)
+    if math.isnan(value) or value == -math.inf:
+        return None
+    if value == math.inf:
+        return 1e308
+    return value
+
+
+def _column_values(series, date_format=DATETIME_FORMAT, precision=None):
+    """单列转换为Python列表，日期时间列按 date_format 格式化，缺失日期为None；precision 为浮点列保留的小数位"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.strftime(date_format)
+        return values.where(series.notna(), None).tolist()
+    if precision is not None and pd.api.types.is_float_dtype(series):
+        return np.round(series.to_numpy(), precision).tolist()
+    return series.tolist()
+
+
+def frame_columns(df, date_format=DATETIME_FORMAT, precision=None):
+    """
+    DataFrame 按列转换为 {列名: 值列表}，逐列调用 tolist，不逐个单元格转换
+
+    参数:
+        date_format: 日期时间列的格式
+        precision: 浮点列保留的小数位，默认不处理
+    """
+    return {str(name): _column_values(df[name], date_format, precision) for name in df.columns}
+
+
+def frame_records(df, date_format=DATETIME_FORMAT):
+    """DataFrame 转换为记录列表，结果与 df.to_dict('records') 相同（NaN/Inf 由编码器输出为 null）"""
+    columns = frame_columns(df, date_format)
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def _default(obj):
+    """orjson / json 无法直接编码的类型"""
+    if isinstance(obj, np.floating):
+        return _numpy_float(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.datetime64):
+        return None if np.isnat(obj) else pd.Timestamp(obj).isoformat()
+    if isinstance(obj, pd.DataFrame):
+        return frame_records(obj)
+    if isinstance(obj, pd.Series):
+        return _column_values(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _sanitize(obj):
+    """标准库 json 的预处理：替换 NaN/Inf（json.dumps 会输出非法的 NaN/Infinity）"""
+    if isinstance(obj, dict):
+        return {key: _sanitize(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(item) for item in obj]
+    if isinstance(obj, np.floating):
+        return _numpy_float(obj)
+    if isinstance(obj, float):
+        return None if math.isnan(obj) or math.isinf(obj) else obj
+    if isinstance(obj, (np.generic, np.ndarray, pd.DataFrame, pd.Series)):
+        return _sanitize(_default(obj))
+    return obj
+
+
+def dumps(data):
+    """
+    序列化为JSON
+
+    返回:
+        UTF-8 编码的 bytes
+    """
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson 不支持的情况（如超过64位的整数），使用标准库
+            pass
+    return json.dumps(_sanitize(data), default=_default, ensure_ascii=False).encode('utf-8')
@@ -13,6 +13,8 @@ import requests
 import json
 import time
 import warnings
+from cache_service import cache_service
+from single_flight import coalesce
 warnings.filterwarnings('ignore')
 
 try:
@@ -25,7 +27,11 @@ except ImportError:
 class FundamentalAnalyzer:
     def __init__(self, config=None):
         """初始化基础分析类"""
-        self.data_cache = {}
+        # 按数据类型使用统一缓存的不同命名空间，过期时间见 fundamental_config.CACHE_CONFIG
+        self.indicator_cache = cache_service.namespace('financial_indicators')
+        self.growth_cache = cache_service.namespace('growth_data')
+        self.hk_cache = cache_service.namespace('hk_data')
+        self.us_cache = cache_service.namespace('us_data')
         
         # 默认配置
         self.data_sources = {
@@ -39,6 +45,7 @@ class FundamentalAnalyzer:
             'timeout': 10
         }
     
+    @coalesce()
     def get_financial_indicators(self, stock_code, market_type='A'):
         """获取财务指标数据"""
         try:
@@ -55,6 +62,7 @@ class FundamentalAnalyzer:
             print(f"获取财务指标出错: {str(e)}")
             return self._get_default_indicators_structure(f'获取财务指标出错: {str(e)}')
     
+    @coalesce()
     def get_growth_data(self, stock_code, market_type='A'):
         """获取成长性数据"""
         try:
@@ -234,10 +242,9 @@ class FundamentalAnalyzer:
     def _get_a_share_financial_indicators(self, stock_code):
         """获取A股财务指标"""
         cache_key = f"a_indicators_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 600:
-                return cached_data
+        cached_data = self.indicator_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         indicators = {}
         
@@ -340,7 +347,7 @@ class FundamentalAnalyzer:
         else:
             indicators = self._get_default_indicators_structure('A股财务数据获取失败')
         
-        self.data_cache[cache_key] = (time.time(), indicators)
+        self.indicator_cache[cache_key] = indicators
         return indicators
     
     def _get_hk_financial_indicators(self, stock_code):
@@ -349,10 +356,9 @@ class FundamentalAnalyzer:
             return self._get_default_indicators_structure('yfinance未安装，港股功能不可用')
         
         cache_key = f"hk_indicators_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 300:
-                return cached_data
+        cached_data = self.hk_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         try:
             hk_code = stock_code.zfill(5)
@@ -392,13 +398,13 @@ class FundamentalAnalyzer:
                 if indicators:
                     indicators['data_available'] = True
                     indicators['data_source'] = 'yfinance'
-                    self.data_cache[cache_key] = (time.time(), indicators)
+                    self.hk_cache[cache_key] = indicators
                     return indicators
         except Exception as e:
             print(f"港股数据获取失败: {str(e)}")
         
         result = self._get_default_indicators_structure('港股财务数据获取失败')
-        self.data_cache[cache_key] = (time.time(), result)
+        self.hk_cache[cache_key] = result
         return result
     
     def _get_us_financial_indicators(self, stock_code):
@@ -407,10 +413,9 @@ class FundamentalAnalyzer:
             return self._get_default_indicators_structure('yfinance未安装，美股功能不可用')
         
         cache_key = f"us_indicators_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 600:
-                return cached_data
+        cached_data = self.us_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         try:
             stock = yf.Ticker(stock_code)
@@ -447,22 +452,21 @@ class FundamentalAnalyzer:
                 if indicators:
                     indicators['data_available'] = True
                     indicators['data_source'] = 'yfinance'
-                    self.data_cache[cache_key] = (time.time(), indicators)
+                    self.us_cache[cache_key] = indicators
                     return indicators
         except Exception as e:
             print(f"美股数据获取失败: {str(e)}")
         
         result = self._get_default_indicators_structure('美股财务数据获取失败')
-        self.data_cache[cache_key] = (time.time(), result)
+        self.us_cache[cache_key] = result
         return result
     
     def _get_a_share_growth_data(self, stock_code):
         """获取A股成长数据"""
         cache_key = f"a_growth_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 900:
-                return cached_data
+        cached_data = self.growth_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         try:
             financial_data = ak.stock_financial_abstract(symbol=stock_code)
@@ -525,7 +529,7 @@ class FundamentalAnalyzer:
                 if growth_data:
                     growth_data['data_available'] = True
                     growth_data['data_source'] = 'akshare'
-                    self.data_cache[cache_key] = (time.time(), growth_data)
+                    self.growth_cache[cache_key] = growth_data
                     return growth_data
         except Exception as e:
             print(f"A股成长数据获取失败: {str(e)}")
@@ -538,7 +542,7 @@ class FundamentalAnalyzer:
             'data_available': False,
             'message': 'A股成长性数据获取失败'
         }
-        self.data_cache[cache_key] = (time.time(), result)
+        self.growth_cache[cache_key] = result
         return result
     
     def _get_hk_growth_data(self, stock_code):
@@ -554,10 +558,9 @@ class FundamentalAnalyzer:
             }
         
         cache_key = f"hk_growth_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 900:
-                return cached_data
+        cached_data = self.growth_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         try:
             hk_code = stock_code.zfill(5)
@@ -594,7 +597,7 @@ class FundamentalAnalyzer:
                 if growth_data:
                     growth_data['data_available'] = True
                     growth_data['data_source'] = 'yfinance'
-                    self.data_cache[cache_key] = (time.time(), growth_data)
+                    self.growth_cache[cache_key] = growth_data
                     return growth_data
         except Exception as e:
             print(f"港股成长数据获取失败: {str(e)}")
@@ -607,7 +610,7 @@ class FundamentalAnalyzer:
             'data_available': False,
             'message': '港股成长性数据获取失败'
         }
-        self.data_cache[cache_key] = (time.time(), result)
+        self.growth_cache[cache_key] = result
         return result
     
     def _get_us_growth_data(self, stock_code):
@@ -623,10 +626,9 @@ class FundamentalAnalyzer:
             }
         
         cache_key = f"us_growth_{stock_code}"
-        if cache_key in self.data_cache:
-            cache_time, cached_data = self.data_cache[cache_key]
-            if time.time() - cache_time < 900:
-                return cached_data
+        cached_data = self.growth_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
         
         try:
             stock = yf.Ticker(stock_code)
@@ -660,7 +662,7 @@ class FundamentalAnalyzer:
                 if growth_data:
                     growth_data['data_available'] = True
                     growth_data['data_source'] = 'yfinance'
-                    self.data_cache[cache_key] = (time.time(), growth_data)
+                    self.growth_cache[cache_key] = growth_data
                     return growth_data
         except Exception as e:
             print(f"美股成长数据获取失败: {str(e)}")
@@ -673,7 +675,7 @@ class FundamentalAnalyzer:
             'data_available': False,
             'message': '美股成长性数据获取失败'
         }
-        self.data_cache[cache_key] = (time.time(), result)
+        self.growth_cache[cache_key] = result
         return result
     
     def _calculate_cagr(self, series, years):
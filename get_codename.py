@@ -4,6 +4,7 @@ import requests
 import json
 import os
 import time
+import threading
 from datetime import datetime
 import logging
 from stock_config import API_CONFIG, API_ENDPOINTS, MARKET_MAPPING, DATA_CONFIG, LOG_CONFIG
@@ -23,20 +24,81 @@ logger = logging.getLogger(__name__)
 # 数据文件路径
 DATA_FILE = DATA_CONFIG['file_path']
 
+class StockSymbolIndex:
+    """
+    股票代码表内存索引
+
+    启动时从静态数据文件构建一次，按代码和名称O(1)查找，
+    同时保留市场和行业字段，供get_codename、get_stock_info、search_stocks共用
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.names = {}      # 代码 -> 名称（即原codename字典）
+        self.by_code = {}    # 代码 -> 完整记录
+        self.by_name = {}    # 名称 -> 完整记录（同名保留首条）
+        self._search_keys = []  # 预先转小写的(代码, 名称, 记录)，用于模糊搜索
+
+    def add(self, code, name, market='CN', industry='未知'):
+        """添加或更新一条股票记录"""
+        code = str(code)
+        name = str(name)
+        if industry is None or (isinstance(industry, float) and industry != industry):
+            industry = '未知'
+        record = {
+            'code': code,
+            'name': name,
+            'market': str(market),
+            'Industry': str(industry)
+        }
+        with self._lock:
+            is_new = code not in self.by_code
+            self.names[code] = name
+            self.by_code[code] = record
+            self.by_name.setdefault(name, record)
+            if is_new:
+                self._search_keys.append((code.lower(), name.lower(), record))
+        return record
+
+    def get(self, query):
+        """按代码或名称精确查找，返回记录字典或None"""
+        query = str(query)
+        return self.by_code.get(query) or self.by_name.get(query)
+
+    def search(self, keyword, limit=10):
+        """按代码或名称子串模糊搜索"""
+        keyword = str(keyword).lower()
+        results = []
+        for code_key, name_key, record in self._search_keys:
+            if keyword in code_key or keyword in name_key:
+                results.append(record)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def __len__(self):
+        return len(self.by_code)
+
+
 # 加载静态数据
 def load_static_data():
-    """加载静态股票数据"""
+    """加载静态股票数据，返回构建好的代码表索引"""
+    index = StockSymbolIndex()
     try:
         if os.path.exists(DATA_FILE):
             allstockinfo = pd.read_csv(
                 DATA_FILE, 
                 sep=DATA_CONFIG['separator'], 
-                encoding=DATA_CONFIG['encoding']
+                encoding=DATA_CONFIG['encoding'],
+                dtype=str
             )
-            # 确保代码和名称都是字符串类型
-            allstockinfo['code'] = allstockinfo['code'].astype(str)
-            allstockinfo['name'] = allstockinfo['name'].astype(str)
-            return dict(zip(allstockinfo['code'].to_list(), allstockinfo['name'].to_list()))
+            allstockinfo = allstockinfo.fillna({'market': 'CN', 'Industry': '未知'})
+            for code, name, market, industry in zip(
+                    allstockinfo['code'].to_list(),
+                    allstockinfo['name'].to_list(),
+                    allstockinfo['market'].to_list(),
+                    allstockinfo['Industry'].to_list()):
+                index.add(code, name, market, industry)
         else:
             logger.warning(f"静态数据文件不存在: {DATA_FILE}")
             # 创建空的数据文件
@@ -44,13 +106,13 @@ def load_static_data():
             empty_df = pd.DataFrame(columns=DATA_CONFIG['columns'])
             empty_df.to_csv(DATA_FILE, sep=DATA_CONFIG['separator'], 
                           encoding=DATA_CONFIG['encoding'], index=False)
-            return {}
     except Exception as e:
         logger.error(f"加载静态数据失败: {e}")
-        return {}
+    return index
 
 # 初始化静态数据
-codename = load_static_data()
+symbol_index = load_static_data()
+codename = symbol_index.names
 
 def validate_stock_query(query):
     """验证股票查询输入"""
@@ -300,9 +362,8 @@ def update_static_data(code, name, market='CN', industry='未知'):
                 index=False
             )
             
-            # 更新内存中的数据
-            global codename
-            codename[code] = name
+            # 更新内存中的索引
+            symbol_index.add(code, name, market, industry)
             
             logger.info(f"已添加新股票: {code} - {name} ({market})")
             return True
@@ -337,28 +398,12 @@ def get_codename(data, *kwords, enable_realtime=True):
     
     data = validated_data
     
-    # 首先在静态数据中查找
-    def search_in_static(query, return_type=None):
-        for key, value in codename.items():
-            if str(query) == str(key) or str(query) == str(value):
-                if return_type == 'name':
-                    return str(value)
-                elif return_type == 'code':
-                    return str(key)
-                else:
-                    return str(key)  # 默认返回代码
-        return None
-    
-    # 在静态数据中查找
-    if len(kwords) > 0:
-        retname = kwords[0]
-        result = search_in_static(data, retname)
-        if result:
-            return result
-    else:
-        result = search_in_static(data)
-        if result:
-            return result
+    # 在静态数据索引中查找
+    record = symbol_index.get(data)
+    if record:
+        if len(kwords) > 0 and kwords[0] == 'name':
+            return record['name']
+        return record['code']  # 默认返回代码
     
     # 如果静态数据中找不到且启用实时查询，进行实时查询
     if enable_realtime:
@@ -396,13 +441,25 @@ def get_codename(data, *kwords, enable_realtime=True):
         return None
 def reload_static_data():
     """重新加载静态数据"""
-    global codename
-    codename = load_static_data()
+    global symbol_index, codename
+    symbol_index = load_static_data()
+    codename = symbol_index.names
     logger.info("静态数据已重新加载")
 
 def get_stock_count():
     """获取当前股票数量"""
-    return len(codename)
+    return len(symbol_index)
+
+def get_stock_record(query):
+    """
+    按代码或名称获取股票完整记录（仅查静态数据索引）
+    
+    Returns:
+        {'code', 'name', 'market', 'Industry'} 字典，找不到返回None
+    """
+    if query is None:
+        return None
+    return symbol_index.get(str(query).strip())
 
 def search_stocks(keyword, limit=10):
     """
@@ -415,23 +472,8 @@ def search_stocks(keyword, limit=10):
     Returns:
         匹配的股票列表
     """
-    results = []
-    keyword = str(keyword).lower()
-    
-    for code, name in codename.items():
-        try:
-            code_str = str(code).lower()
-            name_str = str(name).lower()
-            
-            if (keyword in code_str or keyword in name_str):
-                results.append({'code': str(code), 'name': str(name)})
-                if len(results) >= limit:
-                    break
-        except Exception as e:
-            logger.debug(f"搜索时跳过异常数据: {code}, {name}, 错误: {e}")
-            continue
-    
-    return results
+    return [{'code': record['code'], 'name': record['name']}
+            for record in symbol_index.search(keyword, limit)]
 
 if __name__ == '__main__':
     # 测试现有股票
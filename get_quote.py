@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import requests as req
+from http_client import http_session
 import pandas as pd
 
 def get_A_kline(stockcode):
@@ -23,7 +23,7 @@ def get_A_kline(stockcode):
     url =f'https://push2his.eastmoney.com/api/qt/stock/kline/get?cb=&secid={market}.{stockcode}&ut=&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5%2Cf6&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61&klt=101&fqt=1&end=20500101&lmt=550&_='
     # url = f'https://push2his.eastmoney.com/api/qt/stock/kline/get?cb=&secid={market}.{stockcode}&ut=&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5%2Cf6&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61&klt=101&fqt=1&end=20500101&lmt={nday}&_='
     try:
-        response = req.get(url=url, timeout=5)
+        response = http_session.get(url=url, timeout=5)
     except BaseException as b:
         count = 0
         while True:
@@ -31,7 +31,7 @@ def get_A_kline(stockcode):
             if count >= 3:
                 break
             try:
-                response = req.get(url=url, timeout=5)
+                response = http_session.get(url=url, timeout=5)
                 if response.status_code != 200:
                     continue
                 else:
@@ -130,7 +130,7 @@ def getHK_kline(stockcode, start_date=None, end_date=None):
     url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={market}{stockcode},day,{start_date},{end_date},550,qfq'
     # print(url)
     try:
-        result = req.get(url)
+        result = http_session.get(url)
         # print(result.json())
     except BaseException as b:
         print(f'从腾讯获取{stockcode}日线数据异常', b)
@@ -196,7 +196,7 @@ def getUSA_kline(stockcode, start_date=None, end_date=None):
     url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={market}{stockcode}.OQ,day,{start_date},{end_date},550,qfq'
     # print(url)
     try:
-        result = req.get(url)
+        result = http_session.get(url)
         # print(result.json())
     except BaseException as b:
         print(f'从腾讯获取{stockcode}日线数据异常', b)
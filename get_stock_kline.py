@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-import requests as req
+from http_client import http_session
 import pandas as pd
 import time
 import concurrent.futures
@@ -31,7 +31,7 @@ def getHK_kline(stockcode, days=500):
     url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={market}{stockcode},day,{beginday},{lastday},{days},qfq'
     # print(url)
     try:
-        result = req.get(url)
+        result = http_session.get(url)
         # print(result.json())
     except BaseException as b:
         print(f'从腾讯获取{stockcode}日线数据异常', b)
@@ -114,7 +114,7 @@ def getA_kline(stockcode, days=500,**kwargs):
     url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={market}{stockcode},day,{beginday},{lastday},{days},qfq'
     # print(url)
     try:
-        result = req.get(url)
+        result = http_session.get(url)
         # print(result.json())
     except BaseException as b:
         print(f'从腾讯获取{stockcode}日线数据异常', b)
@@ -186,7 +186,7 @@ def getUSA_kline(stockcode, days=500):
     url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={market}{stockcode}.OQ,day,{beginday},{lastday},{days},qfq'
     print(url)
     try:
-        result = req.get(url)
+        result = http_session.get(url)
         # print(result.json())
     except BaseException as b:
         print(f'从腾讯获取{stockcode}日线数据异常', b)
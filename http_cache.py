@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+API响应的协商缓存和压缩
+- not_modified / set_version：按数据版本（最后一根K线、新闻文件修改时间等）生成ETag，
+  客户端持有的ETag未变化时直接返回304，不再查询和序列化响应内容
+- finalize_response（after_request）：未按版本设置ETag的JSON响应按内容哈希设置ETag，
+  处理 If-None-Match，并按 Accept-Encoding 进行 brotli/gzip 压缩
+流式响应（SSE）和静态文件不做处理
+"""
+# http_cache.py
+import gzip
+import hashlib
+import logging
+
+from flask import current_app, request
+
+from stock_config import RESPONSE_CONFIG
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    brotli = None
+    HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+# 需要压缩的响应类型
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/javascript',
+    'text/html',
+    'text/css',
+    'text/plain'
+}
+
+
+def make_etag(*parts):
+    """由任意可 repr 的值生成ETag"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def frame_version(df, date_column='date'):
+    """
+    K线数据的版本：行数和最后一根K线（日期、收盘价、成交量），
+    盘中最后一根K线更新或新增K线时版本变化
+    """
+    if df is None or df.empty:
+        return None
+    last = df.iloc[-1]
+    return (len(df),) + tuple(str(last[column]) for column in (date_column, 'close', 'volume')
+                              if column in df.columns)
+
+
+def _set_validators(response, etag, last_modified=None):
+    # 弱ETag：压缩与否内容等价，同一ETag可对应不同的 Content-Encoding
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # 允许浏览器缓存，但每次使用前都要带 If-None-Match 重新验证
+    response.headers.setdefault('Cache-Control', 'no-cache')
+
+
+def _version_etag(version):
+    return make_etag(request.path, sorted(request.args.items(multi=True)), version)
+
+
+def not_modified(version, last_modified=None):
+    """
+    客户端持有的ETag与当前数据版本一致时返回304响应，否则返回None，
+    视图在查询和序列化响应内容之前调用
+
+    参数:
+        version: 数据版本，与请求路径和查询参数一起生成ETag
+        last_modified: 数据的最后修改时间（带时区的datetime），可选
+    """
+    if not RESPONSE_CONFIG['etag']:
+        return None
+    etag = _version_etag(version)
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = current_app.response_class(status=304)
+    _set_validators(response, etag, last_modified)
+    return response
+
+
+def set_version(rv, version, last_modified=None):
+    """
+    为视图的返回值设置按数据版本生成的ETag（只对200响应设置）
+
+    返回:
+        Response
+    """
+    response = current_app.make_response(rv)
+    if RESPONSE_CONFIG['etag'] and response.status_code == 200:
+        _set_validators(response, _version_etag(version), last_modified)
+    return response
+
+
+def is_cacheable(rv):
+    """Flask-Caching 的 response_filter：只缓存200响应，错误和304不进入缓存"""
+    status = 200
+    if isinstance(rv, tuple):
+        rv, status = rv[0], (rv[1] if len(rv) > 1 and isinstance(rv[1], int) else 200)
+    return status == 200 and getattr(rv, 'status_code', 200) == 200
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if HAS_BROTLI and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """按客户端的 Accept-Encoding 压缩响应内容"""
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < RESPONSE_CONFIG['compress_min_size']:
+        return response
+
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=RESPONSE_CONFIG['brotli_quality'])
+    else:
+        # mtime=0：相同内容的压缩结果相同
+        compressed = gzip.compress(data, compresslevel=RESPONSE_CONFIG['gzip_level'], mtime=0)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def finalize_response(response):
+    """
+    after_request 钩子：JSON响应补充内容哈希ETag，处理 If-None-Match，最后压缩
+    """
+    # 流式响应（SSE）和直接传递的文件不读取内容
+    if response.is_streamed or response.direct_passthrough:
+        return response
+
+    if (RESPONSE_CONFIG['etag'] and request.method in ('GET', 'HEAD') and response.status_code == 200
+            and response.mimetype == 'application/json'):
+        etag, _ = response.get_etag()
+        if etag is None:
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+            _set_validators(response, etag)
+        if request.if_none_match.contains_weak(etag):
+            response.status_code = 304
+            response.set_data(b'')
+            return response
+
+    if RESPONSE_CONFIG['compress']:
+        compress_response(response)
+    return response
+
+
+def init_app(app):
+    """为Flask应用注册协商缓存和压缩"""
+    app.after_request(finalize_response)
+    logger.info(f"API响应压缩: {'brotli/gzip' if HAS_BROTLI else 'gzip'}，ETag: {RESPONSE_CONFIG['etag']}")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP连接池
+同步请求共用一个带连接池的 requests.Session，复用keep-alive连接；
+异步请求使用 httpx.AsyncClient，在后台事件循环中并发执行，安装h2时启用HTTP/2
+"""
+# http_client.py
+import asyncio
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from stock_config import HTTP_CONFIG
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  httpx启用HTTP/2需要h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def create_session(config=None):
+    """创建带连接池的同步会话"""
+    config = config or HTTP_CONFIG
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=config['pool_connections'], pool_maxsize=config['pool_maxsize'])
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class AsyncHttpClient:
+    """
+    异步HTTP客户端
+    在独立线程中运行事件循环，同步代码通过 run() 提交协程，
+    所有请求共用一个连接池，按主机复用连接
+    """
+
+    def __init__(self, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or HTTP_CONFIG
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        """首次使用时启动后台事件循环"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='async-http', daemon=True)
+                thread.start()
+                self._loop = loop
+        return self._loop
+
+    async def _get_client(self):
+        if self._client is None:
+            self._semaphore = asyncio.Semaphore(self.config['max_concurrency'])
+            if HTTPX_AVAILABLE:
+                http2 = self.config.get('http2', True) and HTTP2_AVAILABLE
+                self._client = httpx.AsyncClient(
+                    http2=http2,
+                    timeout=self.config['timeout'],
+                    limits=httpx.Limits(max_connections=self.config['max_concurrency'],
+                                        max_keepalive_connections=self.config['pool_maxsize'])
+                )
+                self.logger.info(f"异步HTTP客户端已创建，HTTP/2: {'启用' if http2 else '未启用'}")
+            else:
+                # 未安装httpx时在线程池中使用同步连接池
+                self._client = http_session
+                self.logger.warning("未安装httpx，异步请求退化为线程池中的同步请求")
+        return self._client
+
+    async def get_json(self, url, headers=None, timeout=None):
+        """异步GET请求并解析JSON"""
+        client = await self._get_client()
+        timeout = timeout or self.config['timeout']
+        async with self._semaphore:
+            if HTTPX_AVAILABLE:
+                response = await client.get(url, headers=headers, timeout=timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    None, lambda: client.get(url, headers=headers, timeout=timeout))
+            response.raise_for_status()
+            return response.json()
+
+    def run(self, coro, timeout=None):
+        """在后台事件循环中执行协程并等待结果"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+# 全局实例
+http_session = create_session()
+async_http_client = AsyncHttpClient()
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+增量技术指标
+每只股票保存一份指标状态（EMA累加器、滚动窗口），新K线到达时以 O(1) 的代价更新，
+不再对整段历史重新计算；结果与 StockAnalyzer.calculate_indicators 的批量计算一致
+"""
+# incremental_indicators.py
+import math
+import threading
+from collections import deque, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from indicator_engine import DEFAULT_PARAMS, INDICATOR_COLUMNS
+from stock_config import INDICATOR_STATE_CONFIG
+
+NAN = float('nan')
+
+
+def _div(a, b):
+    """与pandas一致的除法：除以0得到inf/nan而不是抛出异常"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / np.float64(b))
+
+
+class _EMA:
+    """指数移动平均（adjust=False），递推公式与 pandas ewm 相同"""
+
+    def __init__(self, span):
+        com = (span - 1) / 2.0
+        alpha = 1.0 / (1.0 + com)
+        self.old_wt = 1.0 - alpha
+        self.new_wt = alpha
+        self.value = None
+
+    def update(self, x):
+        if self.value is None:
+            self.value = x
+        elif self.value != x:
+            self.value = (self.old_wt * self.value + self.new_wt * x) / (self.old_wt + self.new_wt)
+        return self.value
+
+    def copy(self):
+        other = _EMA.__new__(_EMA)
+        other.__dict__.update(self.__dict__)
+        return other
+
+
+class _RollingWindow:
+    """
+    固定长度滚动窗口，维护和与离差平方和（Welford），均值和样本标准差均为 O(1)
+    每滑过一整个窗口重新精确求和一次，避免浮点误差随时间累积
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.total = 0.0
+        self.nonzero = 0
+        self._since_resync = 0
+
+    def append(self, x):
+        if len(self.values) == self.window:
+            old = self.values[0]
+            self.values.append(x)
+            new_mean = self.mean + (x - old) / self.window
+            self.m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.mean = new_mean
+            self.total += x - old
+            self.nonzero += (x != 0) - (old != 0)
+        else:
+            self.values.append(x)
+            n = len(self.values)
+            delta = x - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (x - self.mean)
+            self.total += x
+            self.nonzero += x != 0
+
+        self._since_resync += 1
+        if self._since_resync >= self.window:
+            self._resync()
+
+    def _resync(self):
+        self._since_resync = 0
+        self.total = math.fsum(self.values)
+        self.mean = self.total / len(self.values)
+        self.m2 = math.fsum((v - self.mean) ** 2 for v in self.values)
+
+    def rolling_mean(self):
+        """窗口未满时返回NaN，与 rolling(window).mean() 相同"""
+        if len(self.values) < self.window:
+            return NAN
+        if self.nonzero == 0:
+            return 0.0
+        return self.total / self.window
+
+    def rolling_std(self):
+        if len(self.values) < self.window:
+            return NAN
+        if self.window == 1:
+            return NAN
+        return math.sqrt(max(self.m2, 0.0) / (self.window - 1))
+
+    def copy(self):
+        other = _RollingWindow.__new__(_RollingWindow)
+        other.__dict__.update(self.__dict__)
+        other.values = self.values.copy()
+        return other
+
+
+class IndicatorState:
+    """
+    单只股票的增量指标状态
+
+    参数:
+        params: 指标参数，默认使用 DEFAULT_PARAMS（与 StockAnalyzer.params 相同）
+
+    用法:
+        state = IndicatorState.from_frame(history_df, analyzer.params)
+        row = state.update({'date': ..., 'open': ..., 'close': ..., 'high': ..., 'low': ..., 'volume': ...})
+        # 盘中同一根K线多次刷新时日期相同，自动替换最后一根K线
+        row = state.update(bar)
+
+    多个线程共用同一个状态时，用 state.lock 保护 update 和 latest_row 的组合操作
+    """
+
+    def __init__(self, params=None):
+        self.params = params or DEFAULT_PARAMS
+        ma = self.params['ma_periods']
+        self.ma_short = _EMA(ma['short'])
+        self.ma_medium = _EMA(ma['medium'])
+        self.ma_long = _EMA(ma['long'])
+        self.ema_fast = _EMA(12)
+        self.ema_slow = _EMA(26)
+        self.signal = _EMA(9)
+        self.gain = _RollingWindow(self.params['rsi_period'])
+        self.loss = _RollingWindow(self.params['rsi_period'])
+        self.bollinger = _RollingWindow(self.params['bollinger_period'])
+        self.volume = _RollingWindow(self.params['volume_ma_period'])
+        self.true_range = _RollingWindow(self.params['atr_period'])
+        self.closes = deque(maxlen=11)  # ROC回看10根K线
+        self.bar_count = 0
+        self.last_bar = None
+        self.last_date = None
+        self.latest = None
+        self.lock = threading.RLock()
+        self._previous = None
+
+    @classmethod
+    def from_frame(cls, df, params=None):
+        """用历史K线初始化状态（一次性 O(N)），之后每根新K线 O(1)"""
+        state = cls(params)
+        columns = [c for c in ['date', 'open', 'close', 'high', 'low', 'volume'] if c in df.columns]
+        for bar in df[columns].itertuples(index=False):
+            state.update(bar._asdict())
+        return state
+
+    def _snapshot(self):
+        snapshot = dict(self.__dict__)
+        snapshot.pop('_previous')
+        snapshot.pop('lock')
+        for name, value in snapshot.items():
+            if isinstance(value, (_EMA, _RollingWindow)):
+                snapshot[name] = value.copy()
+        snapshot['closes'] = self.closes.copy()
+        return snapshot
+
+    def update(self, bar, replace_last=False):
+        """
+        追加一根K线并返回最新一行指标（未做小数位格式化）
+
+        参数:
+            bar: 包含 open/close/high/low/volume 的字典；状态由带日期的K线建立时必须包含 date
+            replace_last: 为True时替换最后一根K线（盘中未收盘的K线刷新）；
+                          bar 的 date 与最后一根K线相同时自动替换
+        """
+        with self.lock:
+            return self._update(bar, replace_last)
+
+    def _update(self, bar, replace_last):
+        date = bar.get('date')
+        if date is not None:
+            date = pd.Timestamp(date)
+            if date == self.last_date:
+                replace_last = True
+        elif self.last_date is not None and not replace_last:
+            # 无法判断是新K线还是最后一根K线的刷新，重复追加会使MA/EMA/RSI失真
+            raise ValueError("指标状态按日期建立，新K线需要包含 date")
+        if replace_last and self._previous is not None:
+            self.__dict__.update(self._previous)
+        self._previous = self._snapshot()
+
+        close = float(bar['close'])
+        high = float(bar['high'])
+        low = float(bar['low'])
+        volume = float(bar['volume'])
+        prev_close = self.closes[-1] if self.closes else None
+
+        row = {}
+        row['MA5'] = self.ma_short.update(close)
+        row['MA20'] = self.ma_medium.update(close)
+        row['MA60'] = self.ma_long.update(close)
+
+        # RSI：首根K线的涨跌幅按0计入窗口，与 delta.where(...) 的结果一致
+        delta = close - prev_close if prev_close is not None else NAN
+        self.gain.append(delta if delta > 0 else 0.0)
+        self.loss.append(-delta if delta < 0 else 0.0)
+        row['RSI'] = 100 - _div(100, 1 + _div(self.gain.rolling_mean(), self.loss.rolling_mean()))
+
+        macd = self.ema_fast.update(close) - self.ema_slow.update(close)
+        signal = self.signal.update(macd)
+        row['MACD'] = macd
+        row['Signal'] = signal
+        row['MACD_hist'] = macd - signal
+
+        self.bollinger.append(close)
+        middle = self.bollinger.rolling_mean()
+        std = self.bollinger.rolling_std()
+        row['BB_upper'] = middle + std * self.params['bollinger_std']
+        row['BB_middle'] = middle
+        row['BB_lower'] = middle - std * self.params['bollinger_std']
+
+        self.volume.append(volume)
+        row['Volume_MA'] = self.volume.rolling_mean()
+        row['Volume_Ratio'] = _div(volume, row['Volume_MA'])
+
+        if prev_close is None:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        self.true_range.append(true_range)
+        row['ATR'] = self.true_range.rolling_mean()
+        row['Volatility'] = _div(row['ATR'], close) * 100
+
+        self.closes.append(close)
+        if len(self.closes) == self.closes.maxlen:
+            row['ROC'] = (_div(close, self.closes[0]) - 1) * 100
+        else:
+            row['ROC'] = NAN
+
+        self.bar_count += 1
+        self.last_bar = {'open': float(bar['open']), 'close': close, 'high': high, 'low': low, 'volume': volume}
+        self.last_date = date
+        self.latest = row
+        return row
+
+    def latest_row(self):
+        """最新一行（行情字段 + 指标字段）"""
+        if self.latest is None:
+            return None
+        row = dict(self.last_bar)
+        row.update({name: self.latest[name] for name in INDICATOR_COLUMNS})
+        return row
+
+
+class IndicatorStateStore:
+    """
+    按 (股票代码, 市场类型, 参数摘要) 保存增量指标状态，超过 max_states 时淘汰最近最少使用的状态
+
+    参数:
+        max_states: 最多保存的状态数量，默认读取 INDICATOR_STATE_CONFIG
+    """
+
+    def __init__(self, max_states=None):
+        self.max_states = max_states or INDICATOR_STATE_CONFIG['max_states']
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+            return state
+
+    def set(self, key, state):
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._states.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def __len__(self):
+        return len(self._states)
+
+
+# 全局实例
+indicator_state_store = IndicatorStateStore()
@@ -2,23 +2,23 @@
 import akshare as ak
 import pandas as pd
 import numpy as np
-import threading
+from cache_service import cache_service
+from scan_engine import ScanEngine
 
 
 class IndexIndustryAnalyzer:
     def __init__(self, analyzer):
         self.analyzer = analyzer
-        self.data_cache = {}
+        self.data_cache = cache_service.namespace('index_industry')
+        self.scan_engine = ScanEngine(analyzer)
 
     def analyze_index(self, index_code, limit=30):
         """分析指数整体情况"""
         try:
             cache_key = f"index_{index_code}"
-            if cache_key in self.data_cache:
-                cache_time, cached_result = self.data_cache[cache_key]
-                # 如果缓存时间在1小时内，直接返回
-                if (pd.Timestamp.now() - cache_time).total_seconds() < 3600:
-                    return cached_result
+            cached_result = self.data_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
 
             # 获取指数成分股
             if index_code == '000300':
@@ -56,32 +56,12 @@ class IndexIndustryAnalyzer:
                 stock_list = [s[0] for s in stock_weights[:limit]]
                 weights = [s[1] for s in stock_weights[:limit]]
 
-            # 多线程分析股票
-            results = []
-            threads = []
-            results_lock = threading.Lock()
-
-            def analyze_stock(stock_code, weight):
-                try:
-                    # 分析股票
-                    result = self.analyzer.quick_analyze_stock(stock_code)
-                    result['weight'] = weight
-
-                    with results_lock:
-                        results.append(result)
-                except Exception as e:
-                    print(f"分析股票 {stock_code} 时出错: {str(e)}")
-
-            # 创建并启动线程
-            for i, stock_code in enumerate(stock_list):
-                weight = weights[i] if i < len(weights) else 1
-                thread = threading.Thread(target=analyze_stock, args=(stock_code, weight))
-                threads.append(thread)
-                thread.start()
-
-            # 等待所有线程完成
-            for thread in threads:
-                thread.join()
+            # 在共享线程池中分析成分股，线程数有上限
+            weight_map = {stock_code: (weights[i] if i < len(weights) else 1)
+                          for i, stock_code in enumerate(stock_list)}
+            results = self.scan_engine.scan(stock_list, min_score=0)
+            for result in results:
+                result['weight'] = weight_map.get(result['stock_code'], 1)
 
             # 计算指数整体情况
             total_weight = sum([r.get('weight', 1) for r in results])
@@ -123,7 +103,7 @@ class IndexIndustryAnalyzer:
             }
 
             # 缓存结果
-            self.data_cache[cache_key] = (pd.Timestamp.now(), index_analysis)
+            self.data_cache[cache_key] = index_analysis
 
             return index_analysis
 
@@ -135,11 +115,9 @@ class IndexIndustryAnalyzer:
         """分析行业整体情况"""
         try:
             cache_key = f"industry_{industry}"
-            if cache_key in self.data_cache:
-                cache_time, cached_result = self.data_cache[cache_key]
-                # 如果缓存时间在1小时内，直接返回
-                if (pd.Timestamp.now() - cache_time).total_seconds() < 3600:
-                    return cached_result
+            cached_result = self.data_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
 
             # 获取行业成分股
             stocks = ak.stock_board_industry_cons_em(symbol=industry)
@@ -154,30 +132,8 @@ class IndexIndustryAnalyzer:
             if limit and len(stock_list) > limit:
                 stock_list = stock_list[:limit]
 
-            # 多线程分析股票
-            results = []
-            threads = []
-            results_lock = threading.Lock()
-
-            def analyze_stock(stock_code):
-                try:
-                    # 分析股票
-                    result = self.analyzer.quick_analyze_stock(stock_code)
-
-                    with results_lock:
-                        results.append(result)
-                except Exception as e:
-                    print(f"分析股票 {stock_code} 时出错: {str(e)}")
-
-            # 创建并启动线程
-            for stock_code in stock_list:
-                thread = threading.Thread(target=analyze_stock, args=(stock_code,))
-                threads.append(thread)
-                thread.start()
-
-            # 等待所有线程完成
-            for thread in threads:
-                thread.join()
+            # 在共享线程池中分析成分股，线程数有上限
+            results = self.scan_engine.scan(stock_list, min_score=0)
 
             # 计算行业整体情况
             if not results:
@@ -215,7 +171,7 @@ class IndexIndustryAnalyzer:
             }
 
             # 缓存结果
-            self.data_cache[cache_key] = (pd.Timestamp.now(), industry_analysis)
+            self.data_cache[cache_key] = industry_analysis
 
             return industry_analysis
 
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+批量技术指标与评分引擎
+对多只股票的面板数据（日期 × 股票）一次性计算技术指标和评分，
+结果与 StockAnalyzer.calculate_indicators / calculate_score 逐只计算的结果一致
+"""
+# indicator_engine.py
+import numpy as np
+import pandas as pd
+
+# 与 StockAnalyzer.params 保持一致的默认参数
+DEFAULT_PARAMS = {
+    'ma_periods': {'short': 5, 'medium': 20, 'long': 60},
+    'rsi_period': 14,
+    'bollinger_period': 20,
+    'bollinger_std': 2,
+    'volume_ma_period': 20,
+    'atr_period': 14
+}
+
+# 计算指标所需的行情字段
+PRICE_FIELDS = ['open', 'close', 'high', 'low', 'volume']
+
+# 引擎输出的指标列（顺序与 calculate_indicators 一致）
+INDICATOR_COLUMNS = ['MA5', 'MA20', 'MA60', 'RSI', 'MACD', 'Signal', 'MACD_hist',
+                     'BB_upper', 'BB_middle', 'BB_lower', 'Volume_MA', 'Volume_Ratio',
+                     'ATR', 'Volatility', 'ROC']
+
+
+def panel_to_long(panel, symbol_col='stock_code'):
+    """
+    将面板数据统一转换为长表格式
+
+    参数:
+        panel: 长表 DataFrame（包含 date、symbol_col 和行情字段），
+               或宽表字典 {字段名: DataFrame(index=日期, columns=股票代码)}
+        symbol_col: 股票代码列名
+
+    返回:
+        按 (股票代码, 日期) 排序的长表 DataFrame
+    """
+    if isinstance(panel, dict):
+        frames = []
+        for field, wide in panel.items():
+            series = wide.stack()
+            series.name = field
+            frames.append(series)
+        long_df = pd.concat(frames, axis=1)
+        long_df.index.names = ['date', symbol_col]
+        long_df = long_df.reset_index()
+        if 'volume' not in long_df.columns and 'vol' in long_df.columns:
+            long_df['volume'] = long_df['vol']
+        long_df = long_df.dropna(subset=[c for c in PRICE_FIELDS if c in long_df.columns])
+    else:
+        long_df = panel.copy()
+        if symbol_col not in long_df.columns:
+            raise ValueError(f"面板数据缺少股票代码列: {symbol_col}")
+        if 'volume' not in long_df.columns and 'vol' in long_df.columns:
+            long_df['volume'] = long_df['vol']
+
+    return long_df.sort_values([symbol_col, 'date'], kind='mergesort').reset_index(drop=True)
+
+
+def _to_ragged(values, rows, cols, shape):
+    """把长表中的一列放入 (K线序号 × 股票) 的二维数组，不足的位置用NaN填充"""
+    arr = np.full(shape, np.nan)
+    arr[rows, cols] = values
+    return pd.DataFrame(arr)
+
+
+def calculate_indicators_batch(panel, params=None, symbol_col='stock_code'):
+    """
+    批量计算技术指标
+
+    各股票按自身K线序号左对齐成二维矩阵（行=第N根K线，列=股票），
+    这样每一列都是一只股票连续无缺口的序列，ewm/rolling 等二维运算
+    与逐只计算完全等价，不同股票的上市日期、停牌缺口互不影响
+
+    参数:
+        panel: 长表或宽表字典，见 panel_to_long
+        params: 指标参数，默认使用 DEFAULT_PARAMS
+        symbol_col: 股票代码列名
+
+    返回:
+        长表 DataFrame，包含原始行情列和指标列（未做小数位格式化）
+    """
+    params = params or DEFAULT_PARAMS
+    long_df = panel_to_long(panel, symbol_col)
+    if long_df.empty:
+        return long_df
+
+    cols, symbols = pd.factorize(long_df[symbol_col], sort=False)
+    rows = long_df.groupby(symbol_col, sort=False).cumcount().to_numpy()
+    shape = (int(rows.max()) + 1, len(symbols))
+
+    close = _to_ragged(pd.to_numeric(long_df['close'], errors='coerce').to_numpy(dtype=float), rows, cols, shape)
+    high = _to_ragged(pd.to_numeric(long_df['high'], errors='coerce').to_numpy(dtype=float), rows, cols, shape)
+    low = _to_ragged(pd.to_numeric(long_df['low'], errors='coerce').to_numpy(dtype=float), rows, cols, shape)
+    volume = _to_ragged(pd.to_numeric(long_df['volume'], errors='coerce').to_numpy(dtype=float), rows, cols, shape)
+
+    out = {}
+
+    # 移动平均线（EMA）
+    out['MA5'] = close.ewm(span=params['ma_periods']['short'], adjust=False).mean()
+    out['MA20'] = close.ewm(span=params['ma_periods']['medium'], adjust=False).mean()
+    out['MA60'] = close.ewm(span=params['ma_periods']['long'], adjust=False).mean()
+
+    # RSI
+    delta = close.diff()
+    rsi_period = params['rsi_period']
+    gain = delta.where(delta > 0, 0).rolling(window=rsi_period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=rsi_period).mean()
+    out['RSI'] = 100 - (100 / (1 + gain / loss))
+
+    # MACD
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal = macd.ewm(span=9, adjust=False).mean()
+    out['MACD'] = macd
+    out['Signal'] = signal
+    out['MACD_hist'] = macd - signal
+
+    # 布林带
+    bb_rolling = close.rolling(window=params['bollinger_period'])
+    middle = bb_rolling.mean()
+    std = bb_rolling.std()
+    out['BB_upper'] = middle + std * params['bollinger_std']
+    out['BB_middle'] = middle
+    out['BB_lower'] = middle - std * params['bollinger_std']
+
+    # 成交量
+    out['Volume_MA'] = volume.rolling(window=params['volume_ma_period']).mean()
+    out['Volume_Ratio'] = volume / out['Volume_MA']
+
+    # ATR和波动率
+    prev_close = close.shift(1)
+    tr = np.fmax(high - low, np.fmax((high - prev_close).abs(), (low - prev_close).abs()))
+    out['ATR'] = tr.rolling(window=params['atr_period']).mean()
+    out['Volatility'] = out['ATR'] / close * 100
+
+    # 动量
+    out['ROC'] = close.pct_change(periods=10) * 100
+
+    # 还原为长表
+    result = long_df
+    for name in INDICATOR_COLUMNS:
+        result[name] = out[name].to_numpy()[rows, cols]
+
+    return result
+
+
+def latest_score_inputs(indicators, symbol_col='stock_code'):
+    """
+    从批量指标长表中提取评分所需的每只股票最新一行
+
+    除最新一行的指标外，额外附加 calculate_score 需要回看的字段:
+        prev_close: 前一根K线收盘价
+        prev_MACD_hist: 前一根K线MACD柱
+        avg_Volume_Ratio: 最近 min(5, N-1) 根K线量比均值（与逐只计算的求和顺序一致）
+        bar_count: K线数量
+
+    参数:
+        indicators: calculate_indicators_batch 的输出（已按股票、日期排序）
+        symbol_col: 股票代码列名
+    """
+    if indicators.empty:
+        return indicators
+
+    grouped = indicators.groupby(symbol_col, sort=False)
+    back = grouped.cumcount(ascending=False).to_numpy()  # 0 表示最新一根K线
+    bar_count = grouped[symbol_col].transform('size').to_numpy()
+
+    latest = indicators[back == 0].reset_index(drop=True)
+    symbols = latest[symbol_col]
+
+    def back_values(column, offset):
+        rows = indicators[back == offset]
+        return rows.set_index(symbol_col)[column].reindex(symbols).to_numpy(dtype=float)
+
+    latest['prev_close'] = back_values('close', 1)
+    latest['prev_MACD_hist'] = back_values('MACD_hist', 1)
+
+    # 与 sum([df.iloc[-i]['Volume_Ratio'] for i in range(1, min(6, len(df)))]) 相同的累加顺序
+    latest_bar_count = bar_count[back == 0]
+    counts = np.minimum(5, latest_bar_count - 1)
+    total = np.zeros(len(latest))
+    for offset in range(5):
+        values = back_values('Volume_Ratio', offset)
+        total = np.where(offset < counts, total + values, total)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        latest['avg_Volume_Ratio'] = np.where(counts > 0, total / np.maximum(counts, 1), np.nan)
+    latest['bar_count'] = latest_bar_count
+
+    return latest
+
+
+# 评分权重（与 StockAnalyzer.calculate_score 相同）
+SCORE_WEIGHTS = {
+    'A': {'trend': 0.30, 'volatility': 0.15, 'technical': 0.25, 'volume': 0.20, 'momentum': 0.10},
+    'US': {'trend': 0.35, 'volatility': 0.10, 'technical': 0.25, 'volume': 0.20, 'momentum': 0.15},
+    'HK': {'trend': 0.30, 'volatility': 0.20, 'technical': 0.25, 'volume': 0.25, 'momentum': 0.10}
+}
+
+
+def _column(latest, name):
+    return latest[name].to_numpy(dtype=float)
+
+
+def _trend_score(latest):
+    """趋势评分（最高30分）"""
+    close, ma5, ma20, ma60 = (_column(latest, name) for name in ['close', 'MA5', 'MA20', 'MA60'])
+    trend = np.select(
+        [(ma5 > ma20) & (ma20 > ma60), ma5 > ma20, ma20 > ma60],
+        [15, 10, 5], default=0)
+    trend = trend + 5 * (close > ma5) + 5 * (close > ma20) + 5 * (close > ma60)
+    return np.minimum(30, trend)
+
+
+def _volume_score(latest):
+    """成交量评分（最高20分）"""
+    close, prev_close = _column(latest, 'close'), _column(latest, 'prev_close')
+    avg_vol_ratio = _column(latest, 'avg_Volume_Ratio')
+    price_up = close > prev_close
+    price_down = close < prev_close
+    return np.select(
+        [(avg_vol_ratio > 1.5) & price_up,
+         (avg_vol_ratio > 1.2) & price_up,
+         (avg_vol_ratio < 0.8) & price_down,
+         (avg_vol_ratio > 1.2) & price_down],
+        [20, 15, 10, 0], default=8)
+
+
+def _momentum_score(latest):
+    """动量评分（最高10分）"""
+    roc = _column(latest, 'ROC')
+    return np.select(
+        [roc > 5, (roc >= 2) & (roc <= 5), (roc >= 0) & (roc < 2), (roc >= -2) & (roc < 0)],
+        [10, 8, 5, 3], default=0)
+
+
+def score_upper_bound(latest, market_type='A'):
+    """
+    评分上限：趋势、成交量、动量三项按实际数据计算，波动率和技术指标两项按满分计，
+    市场调整取对评分最有利的情况。上限低于最低评分的股票不可能通过完整评分，可以直接跳过
+
+    参数:
+        latest: 每只股票最新一行指标，需包含 latest_score_inputs 附加的回看字段
+        market_type: 市场类型 (A/HK/US)
+
+    返回:
+        整数数组，与 calculate_score_batch 的 total 使用相同的取整和截断
+    """
+    with np.errstate(invalid='ignore'):
+        trend = _trend_score(latest)
+        volume_score = _volume_score(latest)
+        momentum = _momentum_score(latest)
+
+    weights = SCORE_WEIGHTS.get(market_type, SCORE_WEIGHTS['A'])
+    final = (
+            trend * weights['trend'] / 0.30 +
+            15 * weights['volatility'] / 0.15 +
+            25 * weights['technical'] / 0.25 +
+            volume_score * weights['volume'] / 0.20 +
+            momentum * weights['momentum'] / 0.10
+    )
+    if market_type == 'US':
+        final = np.maximum(final, 0.9 * final + 5)
+    elif market_type == 'HK':
+        final = final + 5
+
+    total = np.clip(np.round(final), 0, 100).astype(int)
+    return np.where(latest['bar_count'].to_numpy() < 2, 50, total)
+
+
+def calculate_score_batch(latest, market_type='A', earnings_season=False, score_offset=0):
+    """
+    按列批量计算评分
+
+    参数:
+        latest: 每只股票最新一行指标，需包含 latest_score_inputs 附加的回看字段
+        market_type: 市场类型 (A/HK/US)
+        earnings_season: 美股是否处于财报季（对应 _is_earnings_season）
+        score_offset: 港股大陆情绪调整分值（对应 calculate_score 中的联动调整）
+
+    返回:
+        DataFrame，列为 trend/volatility/technical/volume/momentum/total，
+        索引与 latest 一致；K线不足2根的股票与逐只计算一样返回中性分50
+    """
+    def col(name):
+        return latest[name].to_numpy(dtype=float)
+
+    close = col('close')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 1. 趋势评分（最高30分）
+        trend = _trend_score(latest)
+
+        # 2. 波动率评分（最高15分）
+        volatility = col('Volatility')
+        volatility_score = np.select(
+            [(volatility >= 1.0) & (volatility <= 2.5),
+             (volatility > 2.5) & (volatility <= 4.0),
+             volatility < 1.0],
+            [15, 10, 5], default=0)
+
+        # 3. 技术指标评分（最高25分）
+        rsi = col('RSI')
+        rsi_score = np.select(
+            [(rsi >= 40) & (rsi <= 60),
+             ((rsi >= 30) & (rsi < 40)) | ((rsi > 60) & (rsi <= 70)),
+             rsi < 30,
+             rsi > 70],
+            [7, 10, 8, 2], default=0)
+
+        macd, signal, hist = col('MACD'), col('Signal'), col('MACD_hist')
+        macd_score = np.select(
+            [(macd > signal) & (hist > 0),
+             macd > signal,
+             (macd < signal) & (hist < 0),
+             hist > col('prev_MACD_hist')],
+            [10, 8, 0, 5], default=0)
+
+        bb_position = (close - col('BB_lower')) / (col('BB_upper') - col('BB_lower'))
+        bb_score = np.select(
+            [(bb_position >= 0.3) & (bb_position <= 0.7), bb_position < 0.2, bb_position > 0.8],
+            [3, 5, 1], default=0)
+
+        technical = np.minimum(25, rsi_score + macd_score + bb_score)
+
+        # 4. 成交量评分（最高20分）
+        volume_score = _volume_score(latest)
+
+        # 5. 动量评分（最高10分）
+        momentum = _momentum_score(latest)
+
+    weights = SCORE_WEIGHTS.get(market_type, SCORE_WEIGHTS['A'])
+    final = (
+            trend * weights['trend'] / 0.30 +
+            volatility_score * weights['volatility'] / 0.15 +
+            technical * weights['technical'] / 0.25 +
+            volume_score * weights['volume'] / 0.20 +
+            momentum * weights['momentum'] / 0.10
+    )
+    if market_type == 'US' and earnings_season:
+        final = 0.9 * final + 5
+    elif market_type == 'HK':
+        final = final + score_offset
+
+    total = np.clip(np.round(final), 0, 100).astype(int)
+
+    # K线不足时逐只计算会出错并返回中性分
+    insufficient = latest['bar_count'].to_numpy() < 2
+    total = np.where(insufficient, 50, total)
+
+    return pd.DataFrame({
+        'trend': trend,
+        'volatility': volatility_score,
+        'technical': technical,
+        'volume': volume_score,
+        'momentum': momentum,
+        'total': total
+    }, index=latest.index)
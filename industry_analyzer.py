@@ -12,12 +12,15 @@ import akshare as ak
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from cache_service import cache_service
+from single_flight import coalesce
 
 
 class IndustryAnalyzer:
     def __init__(self):
         """初始化行业分析类"""
-        self.data_cache = {}
+        self.data_cache = cache_service.namespace('industry_stocks')
+        self.fund_flow_cache = cache_service.namespace('industry_fund_flow')
         self.industry_code_map = {}  # 缓存行业名称到代码的映射
 
         # 设置日志记录
@@ -25,6 +28,7 @@ class IndustryAnalyzer:
                             format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
+    @coalesce()
     def get_industry_fund_flow(self, symbol="即时"):
         """获取行业资金流向数据"""
         try:
@@ -32,12 +36,10 @@ class IndustryAnalyzer:
             cache_key = f"industry_fund_flow_{symbol}"
 
             # 检查缓存
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果缓存时间在30分钟内，直接返回
-                if (datetime.now() - cache_time).total_seconds() < 1800:
-                    self.logger.info(f"从缓存获取行业资金流向数据: {symbol}")
-                    return cached_data
+            cached_data = self.fund_flow_cache.get(cache_key)
+            if cached_data is not None:
+                self.logger.info(f"从缓存获取行业资金流向数据: {symbol}")
+                return cached_data
 
             # 获取行业资金流向数据
             self.logger.info(f"从API获取行业资金流向数据: {symbol}")
@@ -95,7 +97,7 @@ class IndustryAnalyzer:
                         continue
 
             # 缓存结果
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.fund_flow_cache[cache_key] = result
 
             return result
 
@@ -176,6 +178,7 @@ class IndustryAnalyzer:
             self.logger.error(traceback.format_exc())
             return None
 
+    @coalesce()
     def get_industry_stocks(self, industry):
         """获取行业成分股"""
         try:
@@ -183,12 +186,10 @@ class IndustryAnalyzer:
             cache_key = f"industry_stocks_{industry}"
 
             # 检查缓存
-            if cache_key in self.data_cache:
-                cache_time, cached_data = self.data_cache[cache_key]
-                # 如果缓存时间在1小时内，直接返回
-                if (datetime.now() - cache_time).total_seconds() < 3600:
-                    self.logger.info(f"从缓存获取行业成分股: {industry}")
-                    return cached_data
+            cached_data = self.data_cache.get(cache_key)
+            if cached_data is not None:
+                self.logger.info(f"从缓存获取行业成分股: {industry}")
+                return cached_data
 
             # 获取行业成分股
             self.logger.info(f"获取 {industry} 行业成分股")
@@ -239,7 +240,7 @@ class IndustryAnalyzer:
                 result = self._generate_mock_industry_stocks(industry)
 
             # 缓存结果
-            self.data_cache[cache_key] = (datetime.now(), result)
+            self.data_cache[cache_key] = result
 
             return result
 
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+本地K线存储
+使用SQLite按 (市场, 代码, 日期) 持久化日线数据，分析时优先读取本地数据，
+只从数据源补齐缺失的最新交易日，重启后无需重新下载全部历史
+"""
+# kline_store.py
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from stock_config import KLINE_STORE_CONFIG
+
+# 存储的行情字段
+KLINE_COLUMNS = ['date', 'open', 'close', 'high', 'low', 'vol', 'zdf']
+
+
+def last_market_close(market_type='A', now=None, config=None):
+    """计算最近一次收盘时间，收盘时间和交易日读取 KLINE_STORE_CONFIG"""
+    config = config or KLINE_STORE_CONFIG
+    now = now or datetime.now()
+    close_time = datetime.strptime(config['market_close'].get(market_type, '15:30'), '%H:%M').time()
+    weekdays = config['close_weekdays'].get(market_type, [0, 1, 2, 3, 4])
+
+    candidate = datetime.combine(now.date(), close_time)
+    if candidate > now:
+        candidate -= timedelta(days=1)
+    while candidate.weekday() not in weekdays:
+        candidate -= timedelta(days=1)
+    return candidate
+
+
+def in_trading_session(market_type='A', now=None, config=None):
+    """
+    当前是否处于交易时段（开盘到收盘之间，收盘时间和交易日读取 KLINE_STORE_CONFIG），
+    美股交易时段跨越北京时间午夜，按下一次收盘往前推算开盘时间
+    """
+    config = config or KLINE_STORE_CONFIG
+    now = now or datetime.now()
+    close_time = datetime.strptime(config['market_close'].get(market_type, '15:30'), '%H:%M').time()
+    open_time = datetime.strptime(config.get('market_open', {}).get(market_type, '09:15'), '%H:%M').time()
+    weekdays = config['close_weekdays'].get(market_type, [0, 1, 2, 3, 4])
+
+    next_close = datetime.combine(now.date(), close_time)
+    if next_close <= now:
+        next_close += timedelta(days=1)
+    while next_close.weekday() not in weekdays:
+        next_close += timedelta(days=1)
+    session_open = datetime.combine(next_close.date(), open_time)
+    if session_open >= next_close:
+        session_open -= timedelta(days=1)
+    return session_open <= now < next_close
+
+
+def last_closed_bar_date(market_type='A', now=None, config=None):
+    """
+    最近一个已收盘交易日的K线日期（'YYYY-MM-DD'），晚于该日期的K线属于未收盘的交易日
+
+    美股收盘时间为北京时间次日凌晨，K线日期按 KLINE_STORE_CONFIG['bar_date_offset'] 回推
+    """
+    config = config or KLINE_STORE_CONFIG
+    close = last_market_close(market_type, now, config)
+    offset = config.get('bar_date_offset', {}).get(market_type, 0)
+    return (close + timedelta(days=offset)).strftime('%Y-%m-%d')
+
+
+class KlineStore:
+    """本地K线存储"""
+
+    def __init__(self, db_path=None, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or KLINE_STORE_CONFIG
+        self.db_path = db_path or self.config['db_path']
+        self._write_lock = threading.Lock()
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """打开数据库连接，正常结束时提交，最后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        """创建数据表"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS klines (
+                    market TEXT NOT NULL,
+                    code TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL, close REAL, high REAL, low REAL, vol REAL, zdf REAL,
+                    provisional INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (market, code, date)
+                )
+            ''')
+            # 盘中同步的K线标记为临时数据，收盘后再次同步时覆盖
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(klines)')}
+            if 'provisional' not in columns:
+                conn.execute('ALTER TABLE klines ADD COLUMN provisional INTEGER NOT NULL DEFAULT 0')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS kline_sync (
+                    market TEXT NOT NULL,
+                    code TEXT NOT NULL,
+                    history_start TEXT,
+                    synced_at TEXT,
+                    PRIMARY KEY (market, code)
+                )
+            ''')
+
+    def load(self, stock_code, market_type='A', start_date=None, end_date=None):
+        """读取本地K线，返回按日期排序的DataFrame"""
+        sql = 'SELECT date, open, close, high, low, vol, zdf FROM klines WHERE market = ? AND code = ?'
+        params = [market_type, str(stock_code)]
+        if start_date:
+            sql += ' AND date >= ?'
+            params.append(start_date)
+        if end_date:
+            sql += ' AND date <= ?'
+            params.append(end_date)
+        sql += ' ORDER BY date'
+
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        if not df.empty:
+            df['date'] = pd.to_datetime(df['date'])
+            df['volume'] = df['vol']
+        return df
+
+    def load_many(self, stock_codes, market_type='A', start_date=None, end_date=None):
+        """一次查询读取多只股票的本地K线，返回带 code 列、按 (code, date) 排序的长表"""
+        stock_codes = [str(code) for code in stock_codes]
+        if not stock_codes:
+            return pd.DataFrame(columns=['code'] + KLINE_COLUMNS)
+
+        frames = []
+        # SQLite 单条语句的参数数量有限，分批查询
+        for i in range(0, len(stock_codes), 500):
+            batch = stock_codes[i:i + 500]
+            sql = (f'SELECT code, date, open, close, high, low, vol, zdf FROM klines '
+                   f'WHERE market = ? AND code IN ({",".join("?" * len(batch))})')
+            params = [market_type] + batch
+            if start_date:
+                sql += ' AND date >= ?'
+                params.append(start_date)
+            if end_date:
+                sql += ' AND date <= ?'
+                params.append(end_date)
+            with self._connect() as conn:
+                frames.append(pd.read_sql_query(sql, conn, params=params))
+
+        df = pd.concat(frames, ignore_index=True)
+        if not df.empty:
+            df['date'] = pd.to_datetime(df['date'])
+            df['volume'] = df['vol']
+            df = df.sort_values(['code', 'date'], kind='stable').reset_index(drop=True)
+        return df
+
+    def get_sync_info(self, stock_code, market_type='A'):
+        """
+        获取同步信息: 已覆盖的历史起点、上次同步时间、最新已收盘K线的日期和收盘价，
+        以及是否存在未收盘交易日的临时K线
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT history_start, synced_at FROM kline_sync WHERE market = ? AND code = ?',
+                (market_type, str(stock_code))
+            ).fetchone()
+            if row is None:
+                return None
+            # 增量同步和复权校验只以已收盘的K线为准
+            last = conn.execute(
+                'SELECT date, close FROM klines WHERE market = ? AND code = ? AND provisional = 0 '
+                'ORDER BY date DESC LIMIT 1',
+                (market_type, str(stock_code))
+            ).fetchone()
+            provisional = conn.execute(
+                'SELECT 1 FROM klines WHERE market = ? AND code = ? AND provisional = 1 LIMIT 1',
+                (market_type, str(stock_code))
+            ).fetchone()
+        return {
+            'history_start': row[0],
+            'synced_at': datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S') if row[1] else None,
+            'last_date': last[0] if last else None,
+            'last_close': last[1] if last else None,
+            'provisional': provisional is not None
+        }
+
+    def save(self, stock_code, market_type, df, history_start=None, replace=False):
+        """
+        写入K线数据
+
+        参数:
+            df: 包含 KLINE_COLUMNS 的DataFrame
+            history_start: 本次同步覆盖的历史起点，为None时保留原值
+            replace: 为True时先删除该股票的全部旧数据（复权数据变化时使用）
+
+        晚于最近一个已收盘交易日的K线（盘中的当日K线）标记为临时数据，
+        不作为增量同步的起点，收盘后的同步会覆盖
+        """
+        closed_date = last_closed_bar_date(market_type, config=self.config)
+        rows = [row + (int(row[0] > closed_date),) for row in self._to_rows(df)]
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        code = str(stock_code)
+
+        with self._write_lock, self._connect() as conn:
+            if replace:
+                conn.execute('DELETE FROM klines WHERE market = ? AND code = ?', (market_type, code))
+            conn.executemany(
+                'INSERT OR REPLACE INTO klines (market, code, date, open, close, high, low, vol, zdf, provisional) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(market_type, code) + row for row in rows]
+            )
+            conn.execute(
+                'INSERT INTO kline_sync (market, code, history_start, synced_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(market, code) DO UPDATE SET '
+                'history_start = COALESCE(excluded.history_start, kline_sync.history_start), '
+                'synced_at = excluded.synced_at',
+                (market_type, code, history_start, now)
+            )
+        self.logger.info(f"K线存储已写入 {market_type}:{code} {len(rows)} 条数据")
+
+    def _to_rows(self, df):
+        """将DataFrame转换为写库的元组列表"""
+        data = df.copy()
+        if 'vol' not in data.columns and 'volume' in data.columns:
+            data['vol'] = data['volume']
+        if 'zdf' not in data.columns:
+            data['zdf'] = data['close'].pct_change() * 100
+        data['date'] = pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d')
+        data = data[KLINE_COLUMNS].dropna(subset=['date', 'close'])
+        data = data.astype(object).where(pd.notna(data), None)
+        return [tuple(row) for row in data.itertuples(index=False, name=None)]
+
+    def last_market_close(self, market_type='A', now=None):
+        """计算最近一次收盘时间"""
+        return last_market_close(market_type, now, self.config)
+
+    def is_fresh(self, sync_info, market_type='A', now=None):
+        """上次同步晚于最近一次收盘且没有盘中临时K线时，本地数据即为最新"""
+        if not sync_info or not sync_info.get('synced_at') or not sync_info.get('last_date'):
+            return False
+        if sync_info.get('provisional'):
+            return False
+        return sync_info['synced_at'] >= self.last_market_close(market_type, now)
+
+    def get_stock_data(self, stock_code, market_type, start_date, end_date, fetch_func):
+        """
+        读取K线，本地缺失时增量补齐
+
+        参数:
+            stock_code: 股票代码
+            market_type: 市场类型 (A/HK/US)
+            start_date, end_date: 'YYYY-MM-DD' 格式日期
+            fetch_func: 数据源函数，签名同 get_reliable_stock_data
+
+        返回:
+            DataFrame，数据源不可用且本地无数据时返回空DataFrame
+        """
+        info = self.get_sync_info(stock_code, market_type)
+        covered = info is not None and info['history_start'] is not None and info['history_start'] <= start_date
+
+        if covered and self.is_fresh(info, market_type):
+            self.logger.info(f"从本地K线存储读取 {market_type}:{stock_code}")
+            return self.load(stock_code, market_type, start_date, end_date)
+
+        try:
+            if covered and info['last_date']:
+                self._append_missing(stock_code, market_type, info, end_date, fetch_func)
+            else:
+                df = fetch_func(stock_code, market_type, start_date, end_date)
+                if df is not None and not df.empty:
+                    history_start = start_date
+                    if info and info['history_start']:
+                        history_start = min(start_date, info['history_start'])
+                    self.save(stock_code, market_type, df, history_start=history_start, replace=True)
+        except Exception as e:
+            self.logger.warning(f"同步 {market_type}:{stock_code} K线失败，使用本地已有数据: {str(e)}")
+
+        return self.load(stock_code, market_type, start_date, end_date)
+
+    def sync_many(self, stock_codes, market_type, start_date, end_date, batch_fetch_func):
+        """
+        批量同步多只股票，只下载本地缺失或过期的股票
+
+        参数:
+            batch_fetch_func: 批量数据源函数，签名同 fetch_klines，返回 {股票代码: DataFrame}
+
+        返回:
+            本次实际下载的股票数量
+        """
+        stale = {}
+        for stock_code in stock_codes:
+            info = self.get_sync_info(stock_code, market_type)
+            covered = info is not None and info['history_start'] is not None and info['history_start'] <= start_date
+            if not (covered and self.is_fresh(info, market_type)):
+                stale[stock_code] = info if covered else None
+        if not stale:
+            return 0
+
+        self.logger.info(f"批量同步 {market_type} 市场 {len(stale)} 只股票的K线")
+        frames = batch_fetch_func(list(stale), market_type, start_date, end_date)
+        for stock_code, df in frames.items():
+            if df is None or df.empty:
+                continue
+            info = stale.get(stock_code)
+            try:
+                if info is None or not info['last_date']:
+                    self.save(stock_code, market_type, df, history_start=start_date, replace=True)
+                    continue
+
+                df = df.copy()
+                df['date'] = pd.to_datetime(df['date'])
+                last_date = pd.Timestamp(info['last_date'])
+                overlap = df[df['date'] == last_date]
+                if not overlap.empty and info['last_close'] is not None and not np.isclose(
+                        float(overlap['close'].iloc[-1]), info['last_close'], rtol=1e-3, atol=0.01):
+                    # 复权价格变化，本次下载的区间即为新的历史起点
+                    self.save(stock_code, market_type, df, history_start=start_date, replace=True)
+                else:
+                    self.save(stock_code, market_type, df[df['date'] >= last_date])
+            except Exception as e:
+                self.logger.warning(f"批量同步 {market_type}:{stock_code} 写入失败: {str(e)}")
+        return len(stale)
+
+    def _append_missing(self, stock_code, market_type, info, end_date, fetch_func):
+        """只获取最新K线之后的数据并追加，复权价格变化时整体刷新"""
+        last_date = info['last_date']
+        self.logger.info(f"增量同步 {market_type}:{stock_code}，本地最新日期 {last_date}")
+        df = fetch_func(stock_code, market_type, last_date, end_date)
+        if df is None or df.empty:
+            self.logger.warning(f"增量同步 {market_type}:{stock_code} 未获取到数据")
+            return
+
+        df = df.copy()
+        df['date'] = pd.to_datetime(df['date'])
+        overlap = df[df['date'] == pd.Timestamp(last_date)]
+
+        # 前复权数据在除权除息后整体变化，重叠K线对不上时重新获取全部历史
+        if not overlap.empty and info['last_close'] is not None and not np.isclose(
+                float(overlap['close'].iloc[-1]), info['last_close'], rtol=1e-3, atol=0.01):
+            self.logger.info(f"{market_type}:{stock_code} 复权价格发生变化，重新同步全部历史")
+            full = fetch_func(stock_code, market_type, info['history_start'], end_date)
+            if full is not None and not full.empty:
+                self.save(stock_code, market_type, full, replace=True)
+            return
+
+        self.save(stock_code, market_type, df[df['date'] >= pd.Timestamp(last_date)])
+
+
+# 全局实例
+kline_store = KlineStore() if KLINE_STORE_CONFIG.get('enabled', True) else None
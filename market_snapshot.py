@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+全市场行情快照
+一次请求获取整个市场的实时行情（akshare stock_zh_a_spot_em / stock_hk_spot_em / stock_us_spot_em），
+按流动性、涨跌幅、换手率预筛选股票池，并把快照作为当天的K线与本地K线存储中的历史合并，
+筛选时不再逐只下载一年的历史数据
+"""
+# market_snapshot.py
+import logging
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cache_service import cache_service
+from kline_store import kline_store
+from single_flight import coalesce
+from stock_config import SNAPSHOT_CONFIG
+
+# 各市场的全市场行情接口
+SPOT_FUNCTIONS = {
+    'A': 'stock_zh_a_spot_em',
+    'HK': 'stock_hk_spot_em',
+    'US': 'stock_us_spot_em'
+}
+
+# 快照列名统一为英文
+SPOT_COLUMNS = {
+    '代码': 'code',
+    '名称': 'name',
+    '最新价': 'price',
+    '涨跌幅': 'change_pct',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '换手率': 'turnover_rate',
+    '今开': 'open',
+    '开盘价': 'open',
+    '最高': 'high',
+    '最高价': 'high',
+    '最低': 'low',
+    '最低价': 'low',
+    '昨收': 'prev_close',
+    '昨收价': 'prev_close',
+    '总市值': 'market_value'
+}
+
+NUMERIC_COLUMNS = ['price', 'change_pct', 'volume', 'amount', 'turnover_rate', 'open', 'high', 'low',
+                   'prev_close', 'market_value']
+
+
+def session_date(market_type='A', now=None):
+    """
+    快照对应的交易日：周末取上一个周五；美股按北京时间回退12小时对应到美国当地交易日
+    （节假日不做处理，当天无新K线时快照价格与上一交易日相同）
+    """
+    now = now or datetime.now()
+    if market_type == 'US':
+        now = now - timedelta(hours=12)
+    day = now.date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return pd.Timestamp(day)
+
+
+class MarketSnapshot:
+    """
+    全市场行情快照
+
+    参数:
+        config: 配置，默认使用 SNAPSHOT_CONFIG
+    """
+
+    def __init__(self, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or SNAPSHOT_CONFIG
+        self.data_cache = cache_service.namespace('market_snapshot')
+
+    @coalesce()
+    def get_spot(self, market_type='A'):
+        """
+        获取全市场实时行情，一次请求返回所有股票
+
+        返回:
+            DataFrame，列为 code/name/price/change_pct/volume/amount/turnover_rate/open/high/low/prev_close 等
+        """
+        cache_key = f"spot_{market_type}"
+        cached = self.data_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        import akshare as ak
+        if market_type not in SPOT_FUNCTIONS:
+            raise ValueError(f"不支持的市场类型: {market_type}")
+
+        df = getattr(ak, SPOT_FUNCTIONS[market_type])()
+        df = df.rename(columns=SPOT_COLUMNS)
+        df = df[[c for c in dict.fromkeys(SPOT_COLUMNS.values()) if c in df.columns]].copy()
+        for col in NUMERIC_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # 美股代码形如 105.AAPL，去掉交易所前缀
+        df['code'] = df['code'].astype(str).str.split('.').str[-1]
+        df = df.dropna(subset=['price']).reset_index(drop=True)
+
+        self.logger.info(f"获取 {market_type} 市场行情快照，共 {len(df)} 只股票")
+        self.data_cache.set(cache_key, df, ttl=self.config['ttl'])
+        return df
+
+    def prefilter(self, spot, market_type='A', min_amount=None, min_price=None, max_abs_change=None,
+                  min_turnover=None, exclude_st=None, limit=None):
+        """
+        按流动性、价格、涨跌幅、换手率预筛选股票池，未指定的条件使用 SNAPSHOT_CONFIG['prefilter'] 中该市场的默认值
+
+        参数:
+            spot: get_spot 返回的快照
+            market_type: 市场类型，决定默认条件和成交额的货币单位
+            min_amount: 最低成交额（该市场的交易货币）
+            min_price: 最低股价
+            max_abs_change: 涨跌幅绝对值上限（%），用于排除涨跌停等无法交易的股票
+            min_turnover: 最低换手率（%）
+            exclude_st: 是否排除ST股票（名称以ST或*ST开头），只对A股生效
+            limit: 最多保留的股票数量，按成交额从高到低保留
+
+        返回:
+            筛选后的快照，按成交额从高到低排序
+        """
+        defaults = self.config['prefilter'].get(market_type, {})
+        min_amount = defaults.get('min_amount') if min_amount is None else min_amount
+        min_price = defaults.get('min_price') if min_price is None else min_price
+        max_abs_change = defaults.get('max_abs_change') if max_abs_change is None else max_abs_change
+        min_turnover = defaults.get('min_turnover') if min_turnover is None else min_turnover
+        exclude_st = defaults.get('exclude_st', True) if exclude_st is None else exclude_st
+
+        mask = np.ones(len(spot), dtype=bool)
+        if min_amount is not None and 'amount' in spot.columns:
+            mask &= (spot['amount'] >= min_amount).to_numpy()
+        if min_price is not None:
+            mask &= (spot['price'] >= min_price).to_numpy()
+        if max_abs_change is not None and 'change_pct' in spot.columns:
+            mask &= (spot['change_pct'].abs() <= max_abs_change).to_numpy()
+        if min_turnover is not None and 'turnover_rate' in spot.columns:
+            mask &= (spot['turnover_rate'] >= min_turnover).to_numpy()
+        if exclude_st and market_type == 'A' and 'name' in spot.columns:
+            mask &= ~spot['name'].astype(str).str.contains(r'^\*?ST', na=False).to_numpy()
+
+        result = spot[mask]
+        if 'amount' in result.columns:
+            result = result.sort_values('amount', ascending=False, kind='stable')
+        if limit:
+            result = result.head(limit)
+
+        self.logger.info(f"预筛选后剩余 {len(result)}/{len(spot)} 只股票")
+        return result.reset_index(drop=True)
+
+    def merge_history(self, spot, market_type='A', history_days=None, sync_func=None):
+        """
+        将快照作为当天的K线与本地历史K线合并
+
+        参数:
+            spot: 快照（通常是 prefilter 的结果）
+            market_type: 市场类型
+            history_days: 读取的历史天数（自然日），默认使用配置
+            sync_func: sync_func(stock_codes, market_type) 补齐本地缺失或过期的历史，
+                       例如 StockAnalyzer.prefetch_stock_data
+
+        返回:
+            长表 DataFrame（stock_code/date/open/close/high/low/volume），可直接用于 calculate_indicators_batch
+        """
+        stock_codes = spot['code'].tolist()
+        if not stock_codes or kline_store is None:
+            return pd.DataFrame()
+
+        if sync_func is not None:
+            try:
+                sync_func(stock_codes, market_type)
+            except Exception as e:
+                self.logger.warning(f"同步本地K线失败，使用已有数据: {str(e)}")
+
+        history_days = history_days or self.config['history_days']
+        start_date = (datetime.now() - timedelta(days=history_days)).strftime('%Y-%m-%d')
+        history = kline_store.load_many(stock_codes, market_type, start_date)
+
+        today = session_date(market_type)
+        spot_bars = pd.DataFrame({
+            'code': spot['code'].astype(str),
+            'date': today,
+            'open': spot['open'] if 'open' in spot.columns else spot['price'],
+            'close': spot['price'],
+            'high': spot['high'] if 'high' in spot.columns else spot['price'],
+            'low': spot['low'] if 'low' in spot.columns else spot['price'],
+            'volume': spot['volume'] if 'volume' in spot.columns else np.nan
+        }).dropna(subset=['open', 'high', 'low', 'volume'])
+
+        columns = ['code', 'date', 'open', 'close', 'high', 'low', 'volume']
+        history = history[columns] if not history.empty else pd.DataFrame(columns=columns)
+        # 本地已有快照当天的K线（收盘后已同步）时以快照为准
+        history = history[history['date'] < today]
+        panel = pd.concat([history, spot_bars], ignore_index=True)
+        panel = panel.sort_values(['code', 'date'], kind='stable').reset_index(drop=True)
+        return panel.rename(columns={'code': 'stock_code'})
+
+
+# 全局实例
+market_snapshot = MarketSnapshot()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+有界内存缓存
+按字节预算做LRU淘汰，按数据类型设置过期时间，并统计命中率，
+接口兼容普通dict（in / [] / get / pop / clear），可直接替换原有的 data_cache 字典
+"""
+# memory_cache.py
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# get 未命中时的哨兵值
+_MISSING = object()
+
+
+def estimate_size(obj, _depth=0):
+    """估算对象占用的内存字节数"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.memory_usage(deep=True).sum()) if isinstance(obj, pd.DataFrame) \
+            else int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if _depth > 4:
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return sys.getsizeof(obj) + sum(estimate_size(v, _depth + 1) for v in obj)
+    return sys.getsizeof(obj)
+
+
+# pandas 3 始终启用写时复制，pandas 2 需要显式开启 mode.copy_on_write
+PANDAS_MAJOR = int(pd.__version__.split('.')[0])
+
+
+def copy_on_write_enabled():
+    """当前是否启用写时复制（pandas 2 的 'warn' 模式不算启用）"""
+    return PANDAS_MAJOR >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
+def enable_copy_on_write():
+    """
+    在进程启动时开启写时复制（pandas 2），之后 share_frame 不再深拷贝缓存中的DataFrame；
+    pandas 3 已始终启用，不再设置已废弃的选项
+    """
+    if not copy_on_write_enabled():
+        pd.set_option('mode.copy_on_write', True)
+    return copy_on_write_enabled()
+
+
+def share_frame(df):
+    """
+    返回缓存DataFrame给调用方使用的视图
+    写时复制可用时返回浅拷贝，与缓存共用底层数组，调用方新增或修改列时只复制被修改的列，
+    缓存中的数据保持不变；否则退回深拷贝
+    """
+    if df is None:
+        return None
+    return df.copy(deep=not copy_on_write_enabled())
+
+
+def key_suffix_type(key):
+    """按缓存键后缀识别数据类型，例如 '600519_A_None_None_price' -> 'price'"""
+    return str(key).rsplit('_', 1)[-1]
+
+
+class BoundedCache:
+    """
+    线程安全的LRU + TTL缓存
+
+    参数:
+        max_bytes: 内存预算（字节），超出时按最近最少使用淘汰
+        ttl: {数据类型: 过期秒数}，未列出的类型使用 default_ttl
+        default_ttl: 默认过期秒数，None表示不过期
+        type_func: 由缓存键得到数据类型的函数
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=None, default_ttl=None, type_func=key_suffix_type):
+        self.max_bytes = max_bytes
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.type_func = type_func
+
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _ttl_for(self, key):
+        return self.ttl.get(self.type_func(key), self.default_ttl)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _lookup(self, key):
+        """返回未过期的条目，并更新LRU顺序；不存在或已过期返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] is not None and entry[2] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """写入缓存，ttl为None时使用该数据类型的默认过期时间"""
+        size = estimate_size(value)
+        ttl = ttl if ttl is not None else self._ttl_for(key)
+        expires_at = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                # 单个对象超过预算，不缓存
+                self.evictions += 1
+                return
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                value = self._entries[key][0]
+                self._remove(key)
+                return value
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_expired(self):
+        """主动清理所有已过期条目，返回清理数量"""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, _, exp) in self._entries.items() if exp is not None and exp <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    # dict 兼容接口
+    def __contains__(self, key):
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            self._remove(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
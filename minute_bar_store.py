@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+分钟K线环形缓冲区
+每只股票每个周期（1/5/15/60分钟）一个定长的NumPy结构化数组，新K线覆盖最旧的K线，
+内存占用固定；需要计算指标时再转换为 DataFrame，交给 calculate_indicators 使用
+"""
+# minute_bar_store.py
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from stock_config import MINUTE_BAR_CONFIG
+
+# 单根分钟K线的存储格式（每根56字节）
+BAR_DTYPE = np.dtype([
+    ('time', 'datetime64[m]'),
+    ('open', 'f8'),
+    ('close', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('volume', 'f8'),
+    ('amount', 'f8')
+])
+
+
+def to_bar_array(rows):
+    """
+    将 [(时间, 开盘, 收盘, 最高, 最低, 成交量, 成交额), ...] 转换为按时间排序的结构化数组
+    时间可以是字符串或datetime，成交额可省略
+    """
+    bars = np.zeros(len(rows), dtype=BAR_DTYPE)
+    for i, row in enumerate(rows):
+        bars[i]['time'] = np.datetime64(pd.Timestamp(row[0]), 'm')
+        bars[i]['open'], bars[i]['close'], bars[i]['high'], bars[i]['low'], bars[i]['volume'] = row[1:6]
+        bars[i]['amount'] = row[6] if len(row) > 6 else np.nan
+    return np.sort(bars, order='time', kind='stable')
+
+
+class MinuteBarRing:
+    """
+    定长环形缓冲区
+
+    参数:
+        capacity: 最多保存的K线数量，超出后覆盖最旧的K线
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=BAR_DTYPE)
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def last_time(self):
+        """最新一根K线的时间，缓冲区为空时返回None"""
+        if self._size == 0:
+            return None
+        return self._data[(self._start + self._size - 1) % self.capacity]['time']
+
+    def extend(self, bars):
+        """
+        追加按时间排序的K线
+        早于最新K线的数据被忽略；与最新K线时间相同的K线覆盖它（盘中未走完的K线）
+
+        返回:
+            新增的K线数量
+        """
+        if len(bars) == 0:
+            return 0
+        with self._lock:
+            last = self.last_time()
+            if last is not None:
+                bars = bars[bars['time'] >= last]
+                if len(bars) and bars[0]['time'] == last:
+                    self._data[(self._start + self._size - 1) % self.capacity] = bars[0]
+                    bars = bars[1:]
+            n = len(bars)
+            if n == 0:
+                return 0
+            if n >= self.capacity:
+                self._data[:] = bars[-self.capacity:]
+                self._start = 0
+                self._size = self.capacity
+                return n
+
+            index = (self._start + self._size + np.arange(n)) % self.capacity
+            self._data[index] = bars
+            overflow = max(0, self._size + n - self.capacity)
+            self._start = (self._start + overflow) % self.capacity
+            self._size = min(self.capacity, self._size + n)
+            return n
+
+    def append(self, bar):
+        """追加单根K线（结构化数组的一个元素或 to_bar_array 接受的元组）"""
+        if not isinstance(bar, np.void):
+            bar = to_bar_array([bar])
+        else:
+            bar = np.array([bar], dtype=BAR_DTYPE)
+        return self.extend(bar)
+
+    def to_array(self):
+        """按时间顺序返回K线副本"""
+        with self._lock:
+            index = (self._start + np.arange(self._size)) % self.capacity
+            return self._data[index]
+
+    def to_frame(self):
+        """转换为 calculate_indicators 使用的 DataFrame（date/open/close/high/low/volume/amount）"""
+        bars = self.to_array()
+        df = pd.DataFrame({name: bars[name] for name in BAR_DTYPE.names})
+        return df.rename(columns={'time': 'date'})
+
+
+class MinuteBarStore:
+    """
+    分钟K线存储，按 (股票代码, 市场类型, 周期) 保存环形缓冲区
+    缓冲区数量超过 max_buffers 或超过 idle_ttl 秒未被访问时，按最近最少使用淘汰
+
+    参数:
+        config: 配置，默认使用 MINUTE_BAR_CONFIG
+    """
+
+    def __init__(self, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or MINUTE_BAR_CONFIG
+        self._rings = OrderedDict()  # key -> (缓冲区, 最近访问时间)，按访问时间排序
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def ring(self, stock_code, market_type, period):
+        """获取（必要时创建）指定股票和周期的环形缓冲区"""
+        if period not in self.config['periods']:
+            raise ValueError(f"不支持的分钟周期: {period}，可选: {self.config['periods']}")
+        key = (stock_code, market_type, period)
+        now = time.time()
+        with self._lock:
+            entry = self._rings.get(key)
+            if entry is None:
+                self._evict(now)
+                ring = MinuteBarRing(self.config['capacity'][period])
+            else:
+                ring = entry[0]
+                self._rings.move_to_end(key)
+            self._rings[key] = (ring, now)
+            return ring
+
+    def _evict(self, now):
+        """淘汰长时间未访问的缓冲区，并为新缓冲区腾出位置（调用方持有锁）"""
+        idle_ttl = self.config.get('idle_ttl')
+        while self._rings:
+            key, (_, last_access) = next(iter(self._rings.items()))
+            if idle_ttl is not None and now - last_access > idle_ttl:
+                self._rings.popitem(last=False)
+                self.evicted += 1
+            else:
+                break
+        max_buffers = self.config.get('max_buffers')
+        while max_buffers and len(self._rings) >= max_buffers:
+            self._rings.popitem(last=False)
+            self.evicted += 1
+
+    def ingest(self, stock_code, market_type, period, bars):
+        """写入K线（结构化数组），返回新增数量"""
+        return self.ring(stock_code, market_type, period).extend(bars)
+
+    def refresh(self, stock_code, market_type, period, fetch_func):
+        """
+        从数据源补齐最新K线
+        缓冲区为空时下载整个缓冲区长度的历史，否则只下载最近几根K线
+
+        参数:
+            fetch_func: fetch_func(stock_code, market_type, period, limit) -> 结构化数组
+        """
+        ring = self.ring(stock_code, market_type, period)
+        limit = ring.capacity if len(ring) == 0 else self.config['refresh_bars']
+        bars = fetch_func(stock_code, market_type, period, limit)
+        if bars is None or len(bars) == 0:
+            return 0
+        return ring.extend(bars)
+
+    def get_frame(self, stock_code, market_type, period):
+        """返回按时间排序的分钟K线 DataFrame"""
+        return self.ring(stock_code, market_type, period).to_frame()
+
+    def clear(self):
+        with self._lock:
+            self._rings.clear()
+
+    def stats(self):
+        """缓冲区数量、K线总数、占用内存和已淘汰的缓冲区数量"""
+        with self._lock:
+            rings = [ring for ring, _ in self._rings.values()]
+        return {
+            'buffers': len(rings),
+            'bars': sum(len(r) for r in rings),
+            'bytes': sum(r.nbytes for r in rings),
+            'evicted': self.evicted
+        }
+
+
+# 全局实例
+minute_bar_store = MinuteBarStore()
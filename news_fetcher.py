@@ -11,7 +11,7 @@ import logging
 import time
 import hashlib
 import threading
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, timezone
 import akshare as ak
 import pandas as pd
 
@@ -249,6 +249,30 @@ class NewsFetcher:
         
         return False
 
+    def get_news_version(self, days=1):
+        """
+        最近几天新闻数据的版本：各日期新闻文件的修改时间，用于API的ETag
+
+        返回:
+            (版本元组, 最后修改时间)，没有新闻文件时最后修改时间为None
+        """
+        today = datetime.now()
+        version = []
+        last_modified = None
+        for i in range(days):
+            date = today - timedelta(days=i)
+            filename = self.get_news_filename(date)
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                mtime = None
+            version.append((date.strftime('%Y%m%d'), mtime))
+            if mtime is not None and (last_modified is None or mtime > last_modified):
+                last_modified = mtime
+        if last_modified is not None:
+            last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+        return tuple(version), last_modified
+
     def get_latest_news(self, days=1, limit=50):
         """获取最近几天的新闻数据，并去除重复项"""
         news_data = []
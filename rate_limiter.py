@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+数据源限流
+按数据源使用令牌桶限制请求速率，避免并发扫描时触发数据源的访问频率限制
+"""
+# rate_limiter.py
+import time
+import asyncio
+import threading
+
+from stock_config import RATE_LIMIT_CONFIG
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，burst 为桶容量"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """获取一个令牌，必要时等待；超过timeout仍未获取到时返回False"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SourceRateLimiter:
+    """按数据源名称管理令牌桶，未配置的数据源使用 default 配置"""
+
+    def __init__(self, config=None):
+        self.config = config or RATE_LIMIT_CONFIG
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, source):
+        with self._lock:
+            bucket = self._buckets.get(source)
+            if bucket is None:
+                limits = self.config.get(source, self.config['default'])
+                bucket = TokenBucket(limits['rate'], limits['burst'])
+                self._buckets[source] = bucket
+            return bucket
+
+    def acquire(self, source, timeout=None):
+        """请求数据源前调用，超出速率时阻塞等待"""
+        return self._bucket(source).acquire(timeout)
+
+    async def acquire_async(self, source):
+        """异步版本，等待令牌时不阻塞事件循环"""
+        bucket = self._bucket(source)
+        while not bucket.acquire(timeout=0):
+            await asyncio.sleep(1.0 / bucket.rate)
+
+
+# 全局实例
+source_rate_limiter = SourceRateLimiter()
@@ -4,13 +4,59 @@
 提供多个数据源的备选方案，解决eastmoney.com不稳定的问题
 """
 
-import requests
+import asyncio
 import pandas as pd
 import time
 import logging
 from datetime import datetime, timedelta
 import json
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from rate_limiter import source_rate_limiter
+from http_client import http_session, async_http_client
+from stock_config import FETCH_HEDGE_CONFIG, SCAN_CONFIG
+from minute_bar_store import to_bar_array
+
+class SourceStats:
+    """数据源统计：按指数移动平均记录每个数据源的延迟和错误率"""
+    
+    def __init__(self, alpha=0.2, min_samples=5):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def record(self, source, latency, success):
+        """记录一次请求结果"""
+        with self._lock:
+            stat = self._stats.get(source)
+            if stat is None:
+                self._stats[source] = {'latency': latency, 'error_rate': 0.0 if success else 1.0,
+                                       'samples': 1, 'failures': 0 if success else 1}
+                return
+            stat['latency'] += self.alpha * (latency - stat['latency'])
+            stat['error_rate'] += self.alpha * ((0.0 if success else 1.0) - stat['error_rate'])
+            stat['samples'] += 1
+            if not success:
+                stat['failures'] += 1
+    
+    def expected_latency(self, source, default):
+        """期望延迟：平均延迟加上按错误率计算的失败代价（两倍默认值），样本不足时返回默认值"""
+        with self._lock:
+            stat = self._stats.get(source)
+            if stat is None or stat['samples'] < self.min_samples:
+                return default
+            return stat['latency'] + stat['error_rate'] * 2 * default
+    
+    def rank(self, sources, default):
+        """按期望延迟排序数据源，相同时保持配置顺序"""
+        return sorted(sources, key=lambda s: (self.expected_latency(s, default), sources.index(s)))
+    
+    def snapshot(self):
+        with self._lock:
+            return {source: dict(stat) for source, stat in self._stats.items()}
 
 class ReliableDataFetcher:
     """可靠的股票数据获取器"""
@@ -18,6 +64,22 @@ class ReliableDataFetcher:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
+        # 共用连接池，复用keep-alive连接
+        self.session = http_session
+        
+        # 对冲请求配置和数据源统计
+        self.hedge_config = FETCH_HEDGE_CONFIG
+        self.source_stats = SourceStats(FETCH_HEDGE_CONFIG['stats_alpha'], FETCH_HEDGE_CONFIG['min_samples'])
+        # 每个分析线程最多同时进行一个主请求，另外为对冲请求预留全局上限数量的线程
+        max_hedges = FETCH_HEDGE_CONFIG['max_inflight_hedges']
+        self._hedge_executor = ThreadPoolExecutor(max_workers=SCAN_CONFIG['max_workers'] + max_hedges,
+                                                  thread_name_prefix='fetch-hedge')
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges)
+        
+        # 单个数据源的请求超时，以及一次获取（含切换数据源）的总时限
+        self.source_timeout = FETCH_HEDGE_CONFIG['source_timeout']
+        self.total_timeout = FETCH_HEDGE_CONFIG['total_timeout']
+        
         # 配置多个数据源（移除不稳定的akshare）
         self.data_sources = {
             'tencent': self._get_data_from_tencent,
@@ -63,11 +125,18 @@ class ReliableDataFetcher:
         if end_date is None:
             end_date = datetime.now().strftime('%Y-%m-%d')
         
-        # 获取该市场类型的数据源优先级
-        sources = self.source_priority.get(market_type, ['tencent', 'netease', 'eastmoney'])
+        # 获取该市场类型的数据源优先级，按历史延迟和错误率调整顺序
+        sources = self.get_source_order(market_type)
+        
+        if self.hedge_config.get('enabled', True):
+            return self._get_stock_data_hedged(stock_code, market_type, start_date, end_date, sources)
         
+        deadline = time.time() + self.total_timeout
         for source_name in sources:
             for attempt in range(max_retries):
+                if time.time() >= deadline:
+                    self.logger.error(f"获取 {stock_code} 数据超过 {self.total_timeout} 秒，放弃")
+                    return pd.DataFrame()
                 try:
                     self.logger.info(f"尝试从 {source_name} 获取 {stock_code} 数据 (第{attempt+1}次)")
                     
@@ -76,8 +145,7 @@ class ReliableDataFetcher:
                     if not source_func:
                         continue
                     
-                    # 调用数据源
-                    df = source_func(stock_code, market_type, start_date, end_date)
+                    df = self._call_source(source_name, stock_code, market_type, start_date, end_date)
                     
                     if df is not None and not df.empty:
                         self.logger.info(f"✓ 成功从 {source_name} 获取到 {len(df)} 条数据")
@@ -94,7 +162,290 @@ class ReliableDataFetcher:
         self.logger.error(f"所有数据源都无法获取 {stock_code} 的数据")
         return pd.DataFrame()
     
-
+    def get_source_order(self, market_type='A'):
+        """获取数据源顺序：配置的优先级按统计的期望延迟重新排序"""
+        sources = self.source_priority.get(market_type, ['tencent', 'netease', 'eastmoney'])
+        return self.source_stats.rank(sources, self.hedge_config['hedge_delay'])
+    
+    def get_source_stats(self):
+        """获取各数据源的延迟和错误率统计"""
+        return self.source_stats.snapshot()
+    
+    def _call_source(self, source_name, stock_code, market_type, start_date, end_date, started=None):
+        """
+        限流后调用单个数据源，并记录延迟和是否成功
+        
+        参数:
+            started: 传入字典时，请求真正开始（线程池排队和限流等待之后）的时间记录到 started[source_name]
+        """
+        source_func = self.data_sources.get(source_name)
+        if not source_func:
+            return pd.DataFrame()
+        
+        source_rate_limiter.acquire(source_name)
+        start_time = time.time()
+        if started is not None:
+            started[source_name] = start_time
+        df = pd.DataFrame()
+        try:
+            df = source_func(stock_code, market_type, start_date, end_date)
+            return df
+        finally:
+            self.source_stats.record(source_name, time.time() - start_time, df is not None and not df.empty)
+    
+    def _get_stock_data_hedged(self, stock_code, market_type, start_date, end_date, sources):
+        """
+        对冲请求：先请求第一个数据源，请求开始后超过延迟预算仍未返回时并行请求下一个，
+        某个数据源失败时立即启动下一个，返回最先得到的有效结果
+        
+        延迟预算从请求真正开始时计算，线程池排队和限流等待不会触发对冲；
+        每次调用最多对冲 max_hedges 次，全进程同时进行的对冲请求不超过 max_inflight_hedges；
+        超过 total_timeout 秒仍没有结果时放弃等待，调用线程（通常是共享分析线程池中的线程）随即释放，
+        已发出的请求由各数据源的请求超时结束
+        """
+        hedge_delay = self.hedge_config['hedge_delay']
+        max_hedges = self.hedge_config['max_hedges']
+        remaining = list(sources)
+        running = {}
+        started = {}
+        hedges = 0
+        latest = None
+        deadline = time.time() + self.total_timeout
+        
+        def launch_next(hedge=False):
+            nonlocal latest, hedges
+            while remaining:
+                source_name = remaining[0]
+                if source_name not in self.data_sources:
+                    remaining.pop(0)
+                    continue
+                if hedge:
+                    if hedges >= max_hedges or not self._hedge_slots.acquire(blocking=False):
+                        return False
+                    hedges += 1
+                remaining.pop(0)
+                self.logger.info(f"尝试从 {source_name} 获取 {stock_code} 数据")
+                future = self._hedge_executor.submit(
+                    self._call_source, source_name, stock_code, market_type, start_date, end_date, started)
+                if hedge:
+                    future.add_done_callback(lambda f: self._hedge_slots.release())
+                running[future] = source_name
+                latest = source_name
+                return True
+            return False
+        
+        launch_next()
+        while running:
+            remaining_time = deadline - time.time()
+            if remaining_time <= 0:
+                self.logger.error(f"获取 {stock_code} 数据超过 {self.total_timeout} 秒，放弃等待")
+                for future in running:
+                    future.cancel()
+                return pd.DataFrame()
+            
+            # 最近启动的数据源开始请求后才计时，尚未开始时短暂等待后再检查
+            if latest is None:
+                timeout = hedge_delay
+            elif latest in started:
+                timeout = max(0.0, started[latest] + hedge_delay - time.time())
+            else:
+                timeout = min(hedge_delay, 0.1)
+            done, _ = wait(list(running), timeout=min(timeout, remaining_time), return_when=FIRST_COMPLETED)
+            if not done:
+                # 请求开始后超过延迟预算，并行启动下一个数据源
+                if latest in started and time.time() - started[latest] >= hedge_delay:
+                    if launch_next(hedge=True):
+                        self.logger.info(f"{stock_code} 数据源响应超过 {hedge_delay} 秒，并行请求下一个数据源")
+                    else:
+                        # 对冲次数已达上限，只等待已发出的请求
+                        latest = None
+                continue
+            
+            for future in done:
+                source_name = running.pop(future)
+                try:
+                    df = future.result()
+                except Exception as e:
+                    self.logger.warning(f"从 {source_name} 获取数据失败: {str(e)}")
+                    df = None
+                if df is not None and not df.empty:
+                    self.logger.info(f"✓ 成功从 {source_name} 获取到 {len(df)} 条数据")
+                    # 其余请求仍在进行，结果直接丢弃
+                    for other in running:
+                        other.cancel()
+                    return self._standardize_dataframe(df)
+                self.logger.warning(f"从 {source_name} 获取数据失败，尝试下一个数据源")
+                launch_next()
+        
+        self.logger.error(f"所有数据源都无法获取 {stock_code} 的数据")
+        return pd.DataFrame()
+    
+    def fetch_klines(self, symbols, market_type='A', start_date=None, end_date=None):
+        """
+        批量获取多只股票的K线
+        在一个事件循环中并发请求腾讯接口，所有请求共用连接池，
+        批量接口失败的股票回退到 get_stock_data 逐个数据源尝试
+        
+        返回:
+            dict: {股票代码: DataFrame}，获取失败的股票为空DataFrame
+        """
+        if start_date is None:
+            start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y-%m-%d')
+        
+        return async_http_client.run(self._fetch_klines_async(list(symbols), market_type, start_date, end_date))
+    
+    async def _fetch_klines_async(self, symbols, market_type, start_date, end_date):
+        """并发获取K线的协程"""
+        loop = asyncio.get_running_loop()
+        
+        async def fetch_one(stock_code):
+            df = pd.DataFrame()
+            symbol = self._tencent_symbol(stock_code, market_type)
+            if symbol is not None:
+                try:
+                    await source_rate_limiter.acquire_async('tencent')
+                    data = await async_http_client.get_json(self._tencent_url(symbol, start_date, end_date),
+                                                            headers=self.headers)
+                    df = self._parse_tencent_data(data, symbol)
+                except Exception as e:
+                    self.logger.warning(f"批量获取 {stock_code} 数据失败: {str(e)}")
+            
+            if df.empty:
+                # 批量接口失败时，在线程池中逐个数据源尝试
+                df = await loop.run_in_executor(
+                    None, self.get_stock_data, stock_code, market_type, start_date, end_date, 1)
+                return stock_code, df
+            return stock_code, self._standardize_dataframe(df)
+        
+        results = await asyncio.gather(*(fetch_one(stock_code) for stock_code in symbols))
+        self.logger.info(f"批量获取K线完成，共 {len(symbols)} 只股票，"
+                         f"成功 {sum(1 for _, df in results if not df.empty)} 只")
+        return dict(results)
+    
+    def get_minute_bars(self, stock_code, market_type='A', period=5, limit=480):
+        """
+        获取分钟K线（1/5/15/60分钟）
+        A股优先使用东方财富（klt=分钟数），失败时使用腾讯分钟线接口；港股、美股使用腾讯
+        
+        返回:
+            按时间排序的结构化数组（minute_bar_store.BAR_DTYPE），获取失败时为空数组
+        """
+        sources = [('eastmoney', self._get_minute_bars_from_eastmoney)] if market_type == 'A' else []
+        sources.append(('tencent', self._get_minute_bars_from_tencent))
+        
+        for source_name, fetch in sources:
+            try:
+                source_rate_limiter.acquire(source_name)
+                rows = fetch(stock_code, market_type, period, limit)
+                if rows:
+                    return to_bar_array(rows)
+            except Exception as e:
+                self.logger.warning(f"{source_name} 分钟K线获取失败: {str(e)}")
+        return to_bar_array([])
+    
+    def _get_minute_bars_from_eastmoney(self, stock_code, market_type, period, limit):
+        """东方财富分钟K线：f51-f57 为 时间,开盘,收盘,最高,最低,成交量,成交额"""
+        market = 1 if stock_code.startswith('6') else 0
+        url = (f'https://push2his.eastmoney.com/api/qt/stock/kline/get?secid={market}.{stock_code}'
+               f'&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5%2Cf6&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57'
+               f'&klt={period}&fqt=1&end=20500101&lmt={limit}')
+        response = self.session.get(url, headers=self.headers, timeout=8)
+        response.raise_for_status()
+        data = response.json().get('data') or {}
+        rows = []
+        for line in data.get('klines') or []:
+            parts = line.split(',')
+            rows.append((parts[0], *(float(v) for v in parts[1:7])))
+        return rows
+    
+    def _get_minute_bars_from_tencent(self, stock_code, market_type, period, limit):
+        """腾讯分钟K线：param=代码,m周期,,数量，每行为 [时间YYYYMMDDHHMM, 开盘, 收盘, 最高, 最低, 成交量, ...]"""
+        symbol = self._tencent_symbol(stock_code, market_type)
+        if symbol is None:
+            return []
+        url = f'https://ifzq.gtimg.cn/appstock/app/kline/mkline?param={symbol},m{period},,{limit}'
+        response = self.session.get(url, headers=self.headers, timeout=8)
+        response.raise_for_status()
+        data = response.json().get('data') or {}
+        rows = []
+        for item in (data.get(symbol) or {}).get(f'm{period}') or []:
+            rows.append((pd.to_datetime(item[0], format='%Y%m%d%H%M'), *(float(v) for v in item[1:6])))
+        return rows
+    
+    def _tencent_symbol(self, stock_code, market_type):
+        """构建腾讯接口的股票代码，不支持的市场返回None"""
+        if market_type == 'A':
+            # A股：sh600519（上海）或sz000001（深圳）
+            if stock_code.startswith('6'):
+                return f"sh{stock_code}"
+            return f"sz{stock_code}"
+        elif market_type == 'HK':
+            # 港股：hk01810（需要补齐到5位）
+            return f"hk{stock_code.zfill(5)}"
+        elif market_type == 'US':
+            # 美股：usAAPL.OQ（需要拼接.OQ后缀）
+            return f"us{stock_code.upper()}.OQ"
+        return None
+    
+    def _tencent_url(self, symbol, start_date, end_date):
+        """构建腾讯接口URL，param=代码,day,开始日期,结束日期,550,qfq"""
+        return f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={symbol},day,{start_date},{end_date},550,qfq'
+    
+    def _parse_tencent_data(self, data, symbol):
+        """解析腾讯接口返回的JSON"""
+        if 'data' not in data or symbol not in data['data']:
+            self.logger.warning(f"腾讯接口返回数据中未找到 {symbol}")
+            return pd.DataFrame()
+        
+        # 尝试获取日线数据，优先使用前复权数据
+        kline_data = None
+        symbol_data = data['data'][symbol]
+        
+        if 'qfqday' in symbol_data and symbol_data['qfqday']:
+            kline_data = symbol_data['qfqday']
+            self.logger.debug(f"使用前复权数据，共 {len(kline_data)} 条")
+        elif 'day' in symbol_data and symbol_data['day']:
+            kline_data = symbol_data['day']
+            self.logger.debug(f"使用普通日线数据，共 {len(kline_data)} 条")
+        
+        if not kline_data:
+            self.logger.warning(f"腾讯接口未返回K线数据")
+            return pd.DataFrame()
+        
+        # 转换为DataFrame
+        df_data = []
+        for item in kline_data:
+            try:
+                # 腾讯数据格式：[日期, 开盘, 收盘, 最高, 最低, 成交量]
+                df_data.append({
+                    'date': item[0],
+                    'open': float(item[1]),
+                    'close': float(item[2]),
+                    'high': float(item[3]),
+                    'low': float(item[4]),
+                    'vol': int(float(item[5])) if len(item) > 5 else 0
+                })
+            except (ValueError, IndexError) as e:
+                self.logger.warning(f"解析腾讯数据行失败: {item}, 错误: {e}")
+                continue
+        
+        if not df_data:
+            return pd.DataFrame()
+        
+        df = pd.DataFrame(df_data)
+        if not df.empty:
+            df['date'] = pd.to_datetime(df['date'])
+            # 计算涨跌幅
+            df['zdf'] = df['close'].pct_change() * 100
+            df['zdf'] = df['zdf'].round(2)
+            df.fillna(0, inplace=True)
+            
+            # 按日期排序
+            df = df.sort_values('date').reset_index(drop=True)
+        
+        return df
     
     def _get_data_from_tencent(self, stock_code, market_type, start_date, end_date):
         """
@@ -103,83 +454,17 @@ class ReliableDataFetcher:
         参数格式：param=代码,日k,开始日期,结束日期,获取多少个交易日,前复权
         """
         try:
-            # 根据市场类型构建股票代码
-            if market_type == 'A':
-                # A股：sh600519（上海）或sz000001（深圳）
-                if stock_code.startswith('6'):
-                    symbol = f"sh{stock_code}"
-                else:
-                    symbol = f"sz{stock_code}"
-            elif market_type == 'HK':
-                # 港股：hk01810（需要补齐到5位）
-                symbol = f"hk{stock_code.zfill(5)}"
-            elif market_type == 'US':
-                # 美股：usAAPL.OQ（需要拼接.OQ后缀）
-                symbol = f"us{stock_code.upper()}.OQ"
-            else:
+            symbol = self._tencent_symbol(stock_code, market_type)
+            if symbol is None:
                 return pd.DataFrame()
             
-            # 构建请求URL，使用腾讯接口格式
-            # param=代码,day,开始日期,结束日期,550,qfq
-            url = f'https://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={symbol},day,{start_date},{end_date},550,qfq'
-            
+            url = self._tencent_url(symbol, start_date, end_date)
             self.logger.debug(f"腾讯接口URL: {url}")
             
-            response = requests.get(url, headers=self.headers, timeout=15)
+            response = self.session.get(url, headers=self.headers, timeout=self.source_timeout)
             response.raise_for_status()
             
-            data = response.json()
-            if 'data' not in data or symbol not in data['data']:
-                self.logger.warning(f"腾讯接口返回数据中未找到 {symbol}")
-                return pd.DataFrame()
-            
-            # 尝试获取日线数据，优先使用前复权数据
-            kline_data = None
-            symbol_data = data['data'][symbol]
-            
-            if 'qfqday' in symbol_data and symbol_data['qfqday']:
-                kline_data = symbol_data['qfqday']
-                self.logger.debug(f"使用前复权数据，共 {len(kline_data)} 条")
-            elif 'day' in symbol_data and symbol_data['day']:
-                kline_data = symbol_data['day']
-                self.logger.debug(f"使用普通日线数据，共 {len(kline_data)} 条")
-            
-            if not kline_data:
-                self.logger.warning(f"腾讯接口未返回K线数据")
-                return pd.DataFrame()
-            
-            # 转换为DataFrame
-            df_data = []
-            for item in kline_data:
-                try:
-                    # 腾讯数据格式：[日期, 开盘, 收盘, 最高, 最低, 成交量]
-                    df_data.append({
-                        'date': item[0],
-                        'open': float(item[1]),
-                        'close': float(item[2]),
-                        'high': float(item[3]),
-                        'low': float(item[4]),
-                        'vol': int(float(item[5])) if len(item) > 5 else 0
-                    })
-                except (ValueError, IndexError) as e:
-                    self.logger.warning(f"解析腾讯数据行失败: {item}, 错误: {e}")
-                    continue
-            
-            if not df_data:
-                return pd.DataFrame()
-            
-            df = pd.DataFrame(df_data)
-            if not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-                # 计算涨跌幅
-                df['zdf'] = df['close'].pct_change() * 100
-                df['zdf'] = df['zdf'].round(2)
-                df.fillna(0, inplace=True)
-                
-                # 按日期排序
-                df = df.sort_values('date').reset_index(drop=True)
-            
-            return df
+            return self._parse_tencent_data(response.json(), symbol)
             
         except Exception as e:
             self.logger.warning(f"腾讯数据获取失败: {str(e)}")
@@ -199,7 +484,7 @@ class ReliableDataFetcher:
             
             url = f'https://push2his.eastmoney.com/api/qt/stock/kline/get?cb=&secid={market}.{stock_code}&ut=&fields1=f1%2Cf2%2Cf3%2Cf4%2Cf5%2Cf6&fields2=f51%2Cf52%2Cf53%2Cf54%2Cf55%2Cf56%2Cf57%2Cf58%2Cf59%2Cf60%2Cf61&klt=101&fqt=1&end=20500101&lmt=550&_='
             
-            response = requests.get(url, headers=self.headers, timeout=8)
+            response = self.session.get(url, headers=self.headers, timeout=self.source_timeout)
             response.raise_for_status()
             
             json_data = response.json()
@@ -246,7 +531,7 @@ class ReliableDataFetcher:
             # 使用新浪的历史数据接口
             url = f'https://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData?symbol={symbol}&scale=240&ma=no&datalen=550'
             
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, headers=self.headers, timeout=self.source_timeout)
             response.raise_for_status()
             
             # 新浪返回的是JSON数组格式
@@ -319,7 +604,7 @@ class ReliableDataFetcher:
             else:
                 return pd.DataFrame()  # 网易主要用于A股
             
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = self.session.get(url, headers=self.headers, timeout=self.source_timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -472,6 +757,30 @@ def get_reliable_stock_data(stock_code, market_type='A', start_date=None, end_da
     """
     return reliable_fetcher.get_stock_data(stock_code, market_type, start_date, end_date)
 
+def fetch_klines(symbols, market_type='A', start_date=None, end_date=None):
+    """
+    批量获取多只股票的K线，返回 {股票代码: DataFrame}
+    
+    参数:
+        symbols: 股票代码列表
+        market_type: 市场类型 (A/HK/US)
+        start_date: 开始日期
+        end_date: 结束日期
+    """
+    return reliable_fetcher.fetch_klines(symbols, market_type, start_date, end_date)
+
+def fetch_minute_bars(stock_code, market_type='A', period=5, limit=480):
+    """
+    获取分钟K线，返回结构化数组，可直接写入 minute_bar_store
+    
+    参数:
+        stock_code: 股票代码
+        market_type: 市场类型 (A/HK/US)
+        period: 分钟周期 (1/5/15/60)
+        limit: 最多获取的K线数量
+    """
+    return reliable_fetcher.get_minute_bars(stock_code, market_type, period, limit)
+
 if __name__ == "__main__":
     # 测试数据源可用性
     fetcher = ReliableDataFetcher()
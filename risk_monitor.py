@@ -9,17 +9,22 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from eod_analytics import eod_store
 
 class RiskMonitor:
     def __init__(self, analyzer):
         self.analyzer = analyzer
 
-    def analyze_stock_risk(self, stock_code, market_type='A'):
-        """分析单只股票的风险"""
+    def analyze_stock_risk(self, stock_code, market_type='A', use_materialized=True):
+        """分析单只股票的风险，use_materialized 为True时优先使用收盘后预计算的结果"""
         try:
+            if use_materialized and eod_store is not None:
+                materialized = eod_store.get(stock_code, market_type)
+                if materialized is not None and materialized['risk']:
+                    return materialized['risk']
+
             # 获取股票数据和技术指标
-            df = self.analyzer.get_stock_data(stock_code, market_type)
-            df = self.analyzer.calculate_indicators(df)
+            df = self.analyzer.get_indicator_data(stock_code, market_type)
 
             # 计算各类风险指标
             volatility_risk = self._analyze_volatility_risk(df)
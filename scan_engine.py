@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+并行市场扫描引擎
+按块预取K线并批量计算评分上限，排除不可能达到最低评分的股票，块之间响应取消并报告进度；
+其余股票在进程内共享、有上限的线程池中并发分析，每次只提交有限数量的任务（提交窗口），
+其他调用方的任务不必排在整个扫描之后；单只股票超时后跳过，
+并通过回调实时报告进度，总耗时接近网络并发时间而不是所有请求时间之和；
+符合条件的股票只按评分保留前K只，扫描过程中即可取得当前最好的结果
+"""
+# scan_engine.py
+import time
+import heapq
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from stock_config import SCAN_CONFIG
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """获取共享的分析线程池，市场扫描和指数/行业分析共用，线程总数不超过 SCAN_CONFIG['max_workers']"""
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=SCAN_CONFIG['max_workers'],
+                                                  thread_name_prefix='analysis')
+        return _shared_executor
+
+
+class TopK:
+    """
+    按评分保留前K个报告的小顶堆，内存占用与K成正比而不是与符合条件的股票数量成正比
+
+    参数:
+        k: 保留数量，为0或None时不限数量
+        key: 评分字段
+    """
+
+    def __init__(self, k=None, key='score'):
+        if k is not None and k < 0:
+            raise ValueError(f"k 不能为负数: {k}")
+        self.k = k
+        self.key = key
+        self.found = 0
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, report):
+        """
+        加入一个报告，返回前K名是否发生变化
+        评分相同时先加入的排在前面，与按评分稳定排序的结果一致
+        """
+        self.found += 1
+        item = (report[self.key], -next(self._seq), report)
+        if not self.k or len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+            return True
+        if item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+            return True
+        return False
+
+    def sorted(self):
+        """按评分从高到低返回报告列表"""
+        return [item[2] for item in sorted(self._heap, reverse=True)]
+
+
+class ScanEngine:
+    """
+    市场扫描引擎
+
+    参数:
+        analyzer: StockAnalyzer 实例，使用其 quick_analyze_stock 分析单只股票
+        stock_timeout: 单只股票的超时时间（秒），默认读取 SCAN_CONFIG
+        executor: 线程池，默认使用 get_shared_executor()
+    """
+
+    def __init__(self, analyzer, stock_timeout=None, executor=None):
+        self.logger = logging.getLogger(__name__)
+        self.analyzer = analyzer
+        self.executor = executor
+        self.stock_timeout = stock_timeout or SCAN_CONFIG['stock_timeout']
+
+    def scan(self, stock_list, min_score=60, market_type='A', progress_callback=None, should_stop=None,
+             top_k=None, partial_callback=None):
+        """
+        扫描股票列表
+
+        参数:
+            stock_list: 股票代码列表
+            min_score: 最低评分，低于该评分的股票不返回
+            market_type: 市场类型
+            progress_callback: 进度回调 callback(processed, total, found)
+            should_stop: 返回True时停止扫描（用于任务取消）
+            top_k: 最多返回的股票数量，为None或0时不限数量（指数/行业分析需要全部成分股的结果；
+                   市场扫描任务传入 SCAN_CONFIG['top_k']）
+            partial_callback: 阶段结果回调 callback(results, found)，前K名变化时调用，
+                              间隔不小于 SCAN_CONFIG['partial_interval'] 秒
+
+        返回:
+            按评分从高到低排序的报告列表（指定 top_k 时只保留前K只），格式同 quick_analyze_stock
+        """
+        # 重复的股票只分析一次（进度和超时按股票代码跟踪）
+        stock_list = list(dict.fromkeys(stock_list))
+        total = len(stock_list)
+        recommendations = TopK(top_k)
+        partial_interval = SCAN_CONFIG.get('partial_interval', 1.0)
+        partial_dirty = False
+        last_partial = 0
+        processed = 0
+        skipped = 0
+        failed = 0
+        timed_out = 0
+        start_time = time.time()
+        self.logger.info(f"开始并行市场扫描，共 {total} 只股票")
+
+        chunk_size = SCAN_CONFIG.get('prefetch_chunk') or total or 1
+
+        def iter_candidates():
+            """按块预取K线并计算评分上限，逐块产出需要完整分析的股票，块之间检查取消并报告进度"""
+            nonlocal processed, skipped
+            for offset in range(0, total, chunk_size):
+                if should_stop is not None and should_stop():
+                    return
+                chunk = list(stock_list[offset:offset + chunk_size])
+
+                # 批量预取K线，逐只分析时直接读取本地数据，不再为每只股票单独建立连接
+                try:
+                    self.analyzer.prefetch_stock_data(chunk, market_type)
+                except Exception as e:
+                    self.logger.warning(f"批量预取K线失败，逐只获取数据: {str(e)}")
+
+                # 第一阶段：批量计算评分上限，上限达不到最低评分的股票不再逐只分析
+                candidates = chunk
+                if SCAN_CONFIG.get('staged', True) and min_score > 0:
+                    try:
+                        bounds = self.analyzer.score_upper_bounds(chunk, market_type)
+                        candidates = [s for s in chunk if bounds.get(s, 100) >= min_score]
+                        self.logger.info(f"评分上限预筛选：第 {offset + 1}-{offset + len(chunk)} 只股票中 "
+                                         f"{len(candidates)} 只可能达到 {min_score} 分")
+                    except Exception as e:
+                        self.logger.warning(f"评分上限预筛选失败，逐只分析全部股票: {str(e)}")
+                if len(chunk) > len(candidates):
+                    skipped += len(chunk) - len(candidates)
+                    processed += len(chunk) - len(candidates)
+                    if progress_callback is not None:
+                        progress_callback(processed, total, recommendations.found)
+                yield from candidates
+
+        started = {}
+
+        def analyze(stock_code):
+            started[stock_code] = time.time()
+            return self.analyzer.quick_analyze_stock(stock_code, market_type)
+
+        executor = self.executor or get_shared_executor()
+        # 同一时间最多提交 window 个任务，完成后再补充，共享线程池的队列不会被一次扫描占满
+        window = SCAN_CONFIG.get('submit_window') or 2 * SCAN_CONFIG['max_workers']
+        queued = iter_candidates()
+        futures = {}
+        pending = set()
+
+        def submit(count):
+            for stock_code in itertools.islice(queued, count):
+                future = executor.submit(analyze, stock_code)
+                futures[future] = stock_code
+                pending.add(future)
+
+        try:
+            submit(window)
+            last_logged = processed
+
+            while pending:
+                if should_stop is not None and should_stop():
+                    self.logger.info(f"市场扫描被取消，已处理 {processed}/{total} 只股票")
+                    break
+
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    processed += 1
+                    try:
+                        report = future.result()
+                        if report['score'] >= min_score and recommendations.push(report):
+                            partial_dirty = True
+                    except Exception as e:
+                        failed += 1
+                        self.logger.error(f"分析股票 {futures[future]} 时出错: {str(e)}")
+
+                # 超时的股票直接跳过，结果会被丢弃；数据获取有总时限（FETCH_HEDGE_CONFIG['total_timeout']），
+                # 分析线程随后即释放回共享线程池
+                now = time.time()
+                expired = [f for f in pending
+                           if futures[f] in started and now - started[futures[f]] > self.stock_timeout]
+                for future in expired:
+                    pending.discard(future)
+                    processed += 1
+                    timed_out += 1
+                    self.logger.warning(f"分析股票 {futures[future]} 超时（{self.stock_timeout}秒），已跳过")
+
+                submit(window - len(pending))
+
+                if (done or expired) and progress_callback is not None:
+                    progress_callback(processed, total, recommendations.found)
+
+                if partial_dirty and partial_callback is not None and time.time() - last_partial >= partial_interval:
+                    partial_dirty = False
+                    last_partial = time.time()
+                    partial_callback(recommendations.sorted(), recommendations.found)
+
+                if processed - last_logged >= 10 or (processed == total and processed != last_logged):
+                    last_logged = processed
+                    elapsed = time.time() - start_time
+                    remaining = (elapsed / processed) * (total - processed) if processed > 0 else 0
+                    self.logger.info(
+                        f"已处理 {processed}/{total} 只股票，耗时 {elapsed:.1f}秒，预计剩余 {remaining:.1f}秒")
+        finally:
+            # 取消尚未开始的任务，不关闭共享线程池
+            for future in pending:
+                future.cancel()
+
+        # 按得分排序
+        results = recommendations.sorted()
+
+        total_time = time.time() - start_time
+        self.logger.info(
+            f"市场扫描完成，共处理 {processed} 只股票（上限预筛选跳过 {skipped}，失败 {failed}，超时 {timed_out}），"
+            f"找到 {recommendations.found} 只符合条件的股票，返回前 {len(results)} 只，总耗时 {total_time:.1f}秒")
+
+        return results
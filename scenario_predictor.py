@@ -40,8 +40,7 @@ class ScenarioPredictor:
         """生成乐观、中性、悲观三种市场情景预测"""
         try:
             # 获取股票数据和技术指标
-            df = self.analyzer.get_stock_data(stock_code, market_type)
-            df = self.analyzer.calculate_indicators(df)
+            df = self.analyzer.get_indicator_data(stock_code, market_type)
 
             # 获取股票信息
             stock_info = self.analyzer.get_stock_info(stock_code)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+请求合并（single-flight）
+多个线程同时请求同一份数据时，只有第一个线程真正执行获取，
+其余线程等待并共用它的结果，避免开盘时热门股票被重复下载
+"""
+# single_flight.py
+import logging
+import threading
+import functools
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """
+        执行 func，同一时刻相同 key 的调用只执行一次
+
+        返回:
+            (结果, 是否为共用的结果)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+# 全局实例
+single_flight = SingleFlight()
+
+
+def coalesce(copy_result=False):
+    """
+    方法装饰器：按 (方法, 参数) 合并并发调用
+    键中不包含实例，不同实例（例如每个请求线程各自创建的 StockAnalyzer）对同一份数据的调用同样会合并
+
+    参数:
+        copy_result: 为True时，等待方得到结果的副本（用于调用方会原地修改的DataFrame）；
+                     也可以传入函数，用该函数生成副本
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return func(self, *args, **kwargs)
+
+            result, shared = single_flight.do(key, lambda: func(self, *args, **kwargs))
+            if shared and copy_result and result is not None:
+                if callable(copy_result):
+                    return copy_result(result)
+                if hasattr(result, 'copy'):
+                    return result.copy()
+            return result
+        return wrapper
+    return decorator
@@ -20,10 +20,23 @@ from dotenv import load_dotenv
 import logging
 import math
 import json
+import hashlib
 import threading
+from concurrent.futures import wait
 from get_quote import *
 from get_codename import *
-from reliable_data_fetcher import get_reliable_stock_data
+from reliable_data_fetcher import get_reliable_stock_data, fetch_klines, fetch_minute_bars
+from minute_bar_store import minute_bar_store
+from stock_config import MINUTE_BAR_CONFIG
+from market_snapshot import market_snapshot
+from kline_store import kline_store
+from eod_analytics import eod_store
+from cache_service import cache_service
+from memory_cache import share_frame, enable_copy_on_write
+from single_flight import coalesce, single_flight
+from scan_engine import ScanEngine, get_shared_executor
+from indicator_engine import calculate_indicators_batch, latest_score_inputs, calculate_score_batch, score_upper_bound
+from incremental_indicators import IndicatorState, indicator_state_store
 from ai_client import get_ai_client
 #pip install google-genai
 import mimetypes
@@ -37,6 +50,9 @@ except ImportError:
 # 线程局部存储
 thread_local = threading.local()
 
+# 缓存命中时与缓存共用底层数组（pandas 2 需要开启写时复制，否则 share_frame 每次深拷贝）
+enable_copy_on_write()
+
 
 class StockAnalyzer:
     """
@@ -80,12 +96,35 @@ class StockAnalyzer:
             'volume_ma_period': 20,
             'atr_period': 14
         }
-        # 添加缓存初始化
-        self.data_cache = {}
+        # 添加缓存初始化：使用统一缓存服务的 stock 命名空间，按数据类型过期
+        self.data_cache = cache_service.namespace('stock')
+
+        # 单次分析的中间状态（分项评分、JSON匹配标志）按线程隔离，
+        # 扫描和指数分析在多个线程中共用同一个分析器时互不干扰
+        self._local = threading.local()
+
+    @property
+    def score_details(self):
+        """当前线程最近一次 calculate_score 的分项评分"""
+        try:
+            return self._local.score_details
+        except AttributeError:
+            raise AttributeError('score_details') from None
 
-        # JSON匹配标志
-        self.json_match_flag = True
+    @score_details.setter
+    def score_details(self, value):
+        self._local.score_details = value
 
+    @property
+    def json_match_flag(self):
+        """当前线程最近一次新闻分析的JSON匹配标志"""
+        return getattr(self._local, 'json_match_flag', True)
+
+    @json_match_flag.setter
+    def json_match_flag(self, value):
+        self._local.json_match_flag = value
+
+    @coalesce(copy_result=share_frame)
     def get_stock_data(self, stock_code, market_type='A', start_date=None, end_date=None):
         """获取股票数据"""
         # import akshare as ak
@@ -98,18 +137,10 @@ class StockAnalyzer:
         self.logger.info(f"开始获取股票 {stock_code} 数据，市场类型: {market_type}")
 
         cache_key = f"{stock_code}_{market_type}_{start_date}_{end_date}_price"
-        if cache_key in self.data_cache:
-            cached_df = self.data_cache[cache_key]
-            # 创建一个副本以避免修改缓存数据
-            # 并确保副本的日期类型为datetime
-            result = cached_df.copy()
-            # If 'date' column exists but is not datetime, convert it
-            if 'date' in result.columns and not pd.api.types.is_datetime64_any_dtype(result['date']):
-                try:
-                    result['date'] = pd.to_datetime(result['date'])
-                except Exception as e:
-                    self.logger.warning(f"无法将日期列转换为datetime格式: {str(e)}")
-            return result
+        cached_df = self.data_cache.get(cache_key)
+        if cached_df is not None:
+            # 缓存中的日期列已是datetime类型，返回共用底层数组的只读视图，不做深拷贝
+            return share_frame(cached_df)
 
         if start_date is None:
             start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
@@ -122,9 +153,14 @@ class StockAnalyzer:
             end_date = str(end_date)[0:4] + '-' + str(end_date)[4:6] + '-' + str(end_date)[6:8]
             # print(end_date)
         try:
-            # 使用可靠的数据获取器，支持多数据源备选
-            self.logger.info(f"使用可靠数据获取器获取 {stock_code} 数据")
-            df = get_reliable_stock_data(stock_code, market_type, start_date, end_date)
+            # 优先读取本地K线存储，只从可靠数据获取器补齐缺失的最新数据
+            if kline_store is not None:
+                df = kline_store.get_stock_data(stock_code, market_type, start_date, end_date,
+                                                get_reliable_stock_data)
+            else:
+                # 使用可靠的数据获取器，支持多数据源备选
+                self.logger.info(f"使用可靠数据获取器获取 {stock_code} 数据")
+                df = get_reliable_stock_data(stock_code, market_type, start_date, end_date)
             
             # 如果可靠数据获取器失败，回退到原有方法
             if df is None or df.empty:
@@ -169,15 +205,132 @@ class StockAnalyzer:
 
             result = df.sort_values('date', inplace=True)
 
-            # 缓存原始数据（包含datetime类型）
-            self.data_cache[cache_key] = df.copy()
+            # 缓存原始数据（包含datetime类型），调用方拿到的是视图
+            self.data_cache[cache_key] = df
 
-            return df
+            return share_frame(df)
 
         except Exception as e:
             self.logger.error(f"获取股票数据失败: {e}")
             raise Exception(f"获取股票数据失败: {e}")
 
+    def prefetch_stock_data(self, stock_list, market_type='A'):
+        """
+        批量预取多只股票的K线到本地K线存储
+        在一个事件循环中并发下载，共用连接池，之后 get_stock_data 直接读取本地数据
+        """
+        if kline_store is None:
+            return 0
+        stock_codes = []
+        for stock_code in stock_list:
+            code = get_codename(stock_code, 'code')
+            if code:
+                stock_codes.append(code)
+
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        return kline_store.sync_many(stock_codes, market_type, start_date, end_date, fetch_klines)
+
+    def score_upper_bounds(self, stock_list, market_type='A'):
+        """
+        两阶段扫描的第一阶段：用本地K线批量计算每只股票的评分上限
+        读取与 quick_analyze_stock 相同区间的数据，趋势、成交量、动量按实际值计算，
+        其余评分项按满分计，上限低于最低评分的股票无需再做完整分析
+
+        返回:
+            {股票代码: 评分上限}，本地没有K线的股票不在结果中
+        """
+        if kline_store is None:
+            return {}
+        codes = {}
+        for stock_code in stock_list:
+            code = get_codename(stock_code, 'code')
+            if code:
+                codes.setdefault(code, []).append(stock_code)
+        if not codes:
+            return {}
+
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        history = kline_store.load_many(list(codes), market_type, start_date, end_date)
+        if history.empty:
+            return {}
+        # 与 get_stock_data 一样删除含空值的K线
+        history = history.dropna().rename(columns={'code': 'stock_code'})
+
+        latest = self.calculate_indicators_batch(history, latest_only=True)
+        # quick_analyze_stock 使用 calculate_score 的默认市场参数评分，上限按相同口径计算
+        bounds = score_upper_bound(latest)
+        return {stock_code: int(bound)
+                for code, bound in zip(latest['stock_code'], bounds)
+                for stock_code in codes.get(code, [])}
+
+    def prefilter_stock_list(self, stock_list, market_type='A', filters=None):
+        """
+        用全市场行情快照预筛选股票列表（成交额、股价、涨跌幅、换手率、ST），
+        快照获取失败时返回原列表
+
+        参数:
+            filters: 传给 MarketSnapshot.prefilter 的条件，未指定的使用默认配置
+        """
+        try:
+            spot = market_snapshot.get_spot(market_type)
+            candidates = set(market_snapshot.prefilter(spot, market_type, **(filters or {}))['code'])
+        except Exception as e:
+            self.logger.warning(f"获取行情快照失败，跳过预筛选: {str(e)}")
+            return list(stock_list)
+        return [stock_code for stock_code in stock_list if str(stock_code) in candidates]
+
+    def screen_market(self, market_type='A', min_score=60, filters=None, limit=None):
+        """
+        全市场快速筛选
+        一次请求获取全市场快照并预筛选，快照作为当天K线与本地历史合并后批量计算指标和评分，
+        不再逐只下载历史数据
+
+        参数:
+            market_type: 市场类型
+            min_score: 最低评分
+            filters: 预筛选条件，见 MarketSnapshot.prefilter
+            limit: 预筛选后最多保留的股票数量（按成交额）
+
+        返回:
+            按评分从高到低排序的报告列表，字段同 quick_analyze_stock
+        """
+        spot = market_snapshot.get_spot(market_type)
+        candidates = market_snapshot.prefilter(spot, market_type, limit=limit, **(filters or {}))
+        panel = market_snapshot.merge_history(candidates, market_type, sync_func=self.prefetch_stock_data)
+        if panel.empty:
+            return []
+
+        latest = self.calculate_indicators_batch(panel, latest_only=True)
+        scores = self.calculate_score_batch(latest, market_type)
+        names = dict(zip(candidates['code'].astype(str), candidates['name']))
+
+        reports = []
+        for i, row in latest.iterrows():
+            score = int(scores.loc[i, 'total'])
+            if score < min_score or row['bar_count'] < 2:
+                continue
+            stock_code = row['stock_code']
+            reports.append({
+                'stock_code': stock_code,
+                'stock_name': names.get(stock_code, '未知'),
+                'industry': self.get_stock_info(stock_code).get('行业', '未知'),
+                'analysis_date': datetime.now().strftime('%Y-%m-%d'),
+                'score': score,
+                'price': float(row['close']),
+                'price_change': float((row['close'] - row['prev_close']) / row['prev_close'] * 100),
+                'ma_trend': 'UP' if row['MA5'] > row['MA20'] else 'DOWN',
+                'rsi': float(row['RSI']),
+                'macd_signal': 'BUY' if row['MACD'] > row['Signal'] else 'SELL',
+                'volume_status': 'HIGH' if row['Volume_Ratio'] > 1.5 else 'NORMAL',
+                'recommendation': self.get_recommendation(score)
+            })
+
+        reports.sort(key=lambda x: x['score'], reverse=True)
+        self.logger.info(f"全市场筛选完成，{len(candidates)} 只候选股票中 {len(reports)} 只评分不低于 {min_score}")
+        return reports
+
     def get_north_flow_history(self, stock_code, start_date=None, end_date=None):
         """获取单个股票的北向资金历史持股数据"""
         try:
@@ -316,11 +469,215 @@ class StockAnalyzer:
             self.logger.error(f"计算技术指标时出错: {str(e)}")
             raise
 
-    def calculate_score(self, df, market_type='A'):
+    def get_indicator_data(self, stock_code, market_type='A', start_date=None, end_date=None):
+        """
+        获取带技术指标的行情数据
+        同一股票、指标参数和最新K线只计算一次，之后返回缓存结果的视图；
+        缓存为全局共享，风险、情景预测、问答等模块通过同一个分析器实例复用
+        """
+        df = self.get_stock_data(stock_code, market_type, start_date, end_date)
+        if df is None or df.empty:
+            return df
+
+        cache_key = f"{self.indicator_fingerprint(stock_code, df, market_type, start_date, end_date)}_indicators"
+        cached_df = self.data_cache.get(cache_key)
+        if cached_df is not None:
+            return share_frame(cached_df)
+
+        df = self.calculate_indicators(df)
+        self.data_cache[cache_key] = df
+        return share_frame(df)
+
+    def indicator_fingerprint(self, stock_code, df, market_type='A', start_date=None, end_date=None):
+        """
+        指标数据的指纹：标准化后的股票代码、市场、区间、K线数量、最新K线日期和指标参数
+        用作指标和评分的缓存键；调用方显式传给 calculate_score，
+        不随DataFrame传递（切片、tail、copy 得到的新DataFrame不会沿用原数据的评分）
+        """
+        code = get_codename(stock_code, 'code') or stock_code
+        return (f"{code}_{market_type}_{start_date}_{end_date}_{len(df)}_"
+                f"{pd.Timestamp(df['date'].iloc[-1]):%Y%m%d}_{self._params_key()}")
+
+    def _params_key(self):
+        """指标参数的短摘要，用作缓存键的一部分"""
+        return hashlib.md5(json.dumps(self.params, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+    def update_indicators(self, stock_code, bar, market_type='A', replace_last=False):
+        """
+        新K线到达时增量更新技术指标
+
+        首次调用时用历史K线建立该股票的指标状态，之后每根K线只做 O(1) 的更新，
+        结果与 calculate_indicators 对完整历史重新计算的最后一行一致
+
+        参数:
+            stock_code: 股票代码
+            bar: 新K线，包含 date/open/close/high/low/volume；date 与最后一根K线相同时替换该K线
+                 （历史K线包含当天未收盘的K线，盘中推送的当天K线不会被重复追加）
+            market_type: 市场类型
+            replace_last: 为True时替换最后一根K线（盘中刷新当天的K线）
+
+        返回:
+            最新一行的行情和指标（已做小数位格式化）
+        """
+        key = (stock_code, market_type, self._params_key())
+        state = indicator_state_store.get(key)
+        if state is None:
+            # 同一只股票并发的首次调用只建立一次状态
+            state, _ = single_flight.do(('indicator_state',) + key,
+                                        lambda: self._seed_indicator_state(key, stock_code, market_type))
+
+        with state.lock:
+            state.update(bar, replace_last)
+            latest = state.latest_row()
+        row = self.format_indicator_data(pd.DataFrame([latest]))
+        return row.iloc[0].to_dict()
+
+    def _seed_indicator_state(self, key, stock_code, market_type):
+        """用历史K线建立指标状态并保存，其他线程已建立时直接返回"""
+        state = indicator_state_store.get(key)
+        if state is None:
+            df = self.get_stock_data(stock_code, market_type)
+            state = IndicatorState.from_frame(df, self.params)
+            indicator_state_store.set(key, state)
+        return state
+
+    def get_intraday_data(self, stock_code, market_type='A', period=5, refresh=True):
+        """
+        获取分钟K线（1/5/15/60分钟）
+        数据保存在定长环形缓冲区中，首次调用下载完整缓冲区，之后只补齐最新几根K线
+
+        参数:
+            stock_code: 股票代码
+            market_type: 市场类型
+            period: 分钟周期
+            refresh: 是否先从数据源补齐最新K线
+        """
+        if refresh:
+            try:
+                minute_bar_store.refresh(stock_code, market_type, period, fetch_minute_bars)
+            except Exception as e:
+                self.logger.warning(f"刷新 {stock_code} {period}分钟K线失败: {str(e)}")
+        return minute_bar_store.get_frame(stock_code, market_type, period)
+
+    def get_intraday_indicator_data(self, stock_code, market_type='A', period=5, refresh=True):
+        """获取分钟K线并用 calculate_indicators 计算技术指标，指标参数与日线相同"""
+        df = self.get_intraday_data(stock_code, market_type, period, refresh)
+        if df.empty:
+            return df
+        return self.calculate_indicators(df)
+
+    def scan_intraday(self, stock_list, market_type='A', period=5, min_score=0):
+        """
+        盘中监控自选股：并发补齐分钟K线后批量计算指标和评分
+        股票数量不超过 MINUTE_BAR_CONFIG['max_scan_stocks']；补齐超过 refresh_timeout 秒的股票
+        不再等待，使用缓冲区中已有的K线
+
+        返回:
+            按评分从高到低排序的列表，每项包含股票代码、最新价、评分分项和K线时间
+        """
+        max_stocks = MINUTE_BAR_CONFIG['max_scan_stocks']
+        if len(stock_list) > max_stocks:
+            raise ValueError(f"盘中监控最多支持 {max_stocks} 只股票，当前 {len(stock_list)} 只")
+
+        executor = get_shared_executor()
+        futures = {executor.submit(minute_bar_store.refresh, code, market_type, period, fetch_minute_bars): code
+                   for code in stock_list}
+        done, pending = wait(futures, timeout=MINUTE_BAR_CONFIG['refresh_timeout'])
+        for future in done:
+            if future.exception() is not None:
+                self.logger.warning(f"刷新 {futures[future]} {period}分钟K线失败: {str(future.exception())}")
+        if pending:
+            # 超时的股票不再等待，尚未开始的刷新直接取消
+            for future in pending:
+                future.cancel()
+            self.logger.warning(f"盘中监控 {len(pending)} 只股票的分钟K线刷新超时，使用已有数据")
+
+        frames = []
+        for stock_code in stock_list:
+            df = minute_bar_store.get_frame(stock_code, market_type, period)
+            if not df.empty:
+                df['stock_code'] = stock_code
+                frames.append(df)
+        if not frames:
+            return []
+
+        latest = self.calculate_indicators_batch(pd.concat(frames, ignore_index=True), latest_only=True)
+        scores = self.calculate_score_batch(latest, market_type)
+
+        results = []
+        for i, row in latest.iterrows():
+            score = int(scores.loc[i, 'total'])
+            if score < min_score:
+                continue
+            results.append({
+                'stock_code': row['stock_code'],
+                'period': period,
+                'bar_time': row['date'].strftime('%Y-%m-%d %H:%M'),
+                'price': float(row['close']),
+                'rsi': None if pd.isna(row['RSI']) else float(row['RSI']),
+                'score': score,
+                'score_details': {key: float(scores.loc[i, key])
+                                  for key in ['trend', 'volatility', 'technical', 'volume', 'momentum']}
+            })
+        results.sort(key=lambda x: x['score'], reverse=True)
+        return results
+
+    def calculate_indicators_batch(self, panel, symbol_col='stock_code', latest_only=False):
+        """
+        批量计算多只股票的技术指标
+
+        参数:
+            panel: 长表 DataFrame（date、股票代码列和 open/close/high/low/volume），
+                   或宽表字典 {字段名: DataFrame(index=日期, columns=股票代码)}
+            symbol_col: 股票代码列名
+            latest_only: 为True时只返回每只股票最新一行（附带评分所需的回看字段）
+
+        返回:
+            与逐只调用 calculate_indicators 结果一致的长表 DataFrame
+        """
+        try:
+            df = calculate_indicators_batch(panel, self.params, symbol_col)
+            df = self.format_indicator_data(df)
+            if latest_only:
+                df = latest_score_inputs(df, symbol_col)
+            return df
+        except Exception as e:
+            self.logger.error(f"批量计算技术指标时出错: {str(e)}")
+            raise
+
+    def calculate_score_batch(self, latest, market_type='A'):
+        """
+        批量计算评分 - 与 calculate_score 逐只计算的结果一致
+
+        参数:
+            latest: calculate_indicators_batch(..., latest_only=True) 的输出
+            market_type: 市场类型 (A/HK/US)
+
+        返回:
+            DataFrame，包含 trend/volatility/technical/volume/momentum/total 各项得分
+        """
+        earnings_season = market_type == 'US' and self._is_earnings_season()
+
+        # 港股A股联动调整与 calculate_score 保持一致
+        score_offset = 0
+        if market_type == 'HK' and self._check_a_share_linkage(latest) > 0.7:
+            score_offset = 5 if self._get_mainland_market_sentiment() > 0 else -5
+
+        return calculate_score_batch(latest, market_type, earnings_season, score_offset)
+
+    def calculate_score(self, df, market_type='A', fingerprint=None):
         """
         计算股票评分 - 使用时空共振交易系统增强
         根据不同的市场特征调整评分权重和标准
+        传入 fingerprint（indicator_fingerprint 的结果）时按指纹缓存评分，同一K线只计算一次
         """
+        cache_key = f"{fingerprint}_{market_type}_score" if fingerprint else None
+        if cache_key:
+            cached_details = self.data_cache.get(cache_key)
+            if cached_details is not None:
+                self.score_details = dict(cached_details)
+                return cached_details['total']
+
         try:
             score = 0
             latest = df.iloc[-1]
@@ -523,6 +880,8 @@ class StockAnalyzer:
                 'momentum': momentum_score,
                 'total': final_score
             }
+            if cache_key:
+                self.data_cache[cache_key] = dict(self.score_details)
 
             return final_score
 
@@ -546,8 +905,7 @@ class StockAnalyzer:
         """
         try:
             # Get stock data
-            df = self.get_stock_data(stock_code)
-            df = self.calculate_indicators(df)
+            df = self.get_indicator_data(stock_code)
 
             # 获取波动率因子（来自维度3：能量守恒）
             latest = df.iloc[-1]
@@ -807,10 +1165,10 @@ class StockAnalyzer:
 
             # 缓存键
             cache_key = f"{stock_code}_{market_type}_news"
-            if cache_key in self.data_cache and (
-                    datetime.now() - self.data_cache[cache_key]['timestamp']).seconds < 3600:
+            cached = self.data_cache.get(cache_key)
+            if cached is not None and (datetime.now() - cached['timestamp']).seconds < 3600:
                 # 缓存1小时内的数据
-                return self.data_cache[cache_key]['data']
+                return cached['data']
 
             # 获取股票基本信息
             stock_info = self.get_stock_info(stock_code)
@@ -1283,7 +1641,8 @@ class StockAnalyzer:
             news_data = self.get_stock_news(stock_code, market_type)
             print(f"news_data:{news_data}")
             # 6. 评分分解
-            score = self.calculate_score(df, market_type)
+            score = self.calculate_score(df, market_type,
+                                         fingerprint=self.indicator_fingerprint(stock_code, df, market_type))
             score_details = getattr(self, 'score_details', {'total': score})
 
             # 7. 获取投资建议
@@ -1461,13 +1820,10 @@ class StockAnalyzer:
         try:
             # self.clear_cache(stock_code, market_type)
             # 获取股票数据
-            df = self.get_stock_data(stock_code, market_type)
-            self.logger.info(f"获取股票数据完成")
-            # 计算技术指标
-            df = self.calculate_indicators(df)
-            self.logger.info(f"计算技术指标完成")
+            df = self.get_indicator_data(stock_code, market_type)
+            self.logger.info(f"获取股票数据并计算技术指标完成")
             # 评分系统
-            score = self.calculate_score(df)
+            score = self.calculate_score(df, fingerprint=self.indicator_fingerprint(stock_code, df, market_type))
             self.logger.info(f"评分系统完成")
             # 获取最新数据
             latest = df.iloc[-1]
@@ -1501,7 +1857,7 @@ class StockAnalyzer:
                     },
                     {}  # news_data placeholder
                 ),
-                'ai_analysis': self.get_ai_analysis(df, stock_code)
+                'ai_analysis': self.get_ai_analysis(df, stock_code, market_type)
             }
 
             return report
@@ -1513,60 +1869,16 @@ class StockAnalyzer:
     # 原有API：保持接口不变
     def scan_market(self, stock_list, min_score=60, market_type='A'):
         """扫描市场，寻找符合条件的股票"""
-        recommendations = []
-        total_stocks = len(stock_list)
-
-        self.logger.info(f"开始市场扫描，共 {total_stocks} 只股票")
-        start_time = time.time()
-        processed = 0
-
-        # 批量处理，减少日志输出
-        batch_size = 10
-        for i in range(0, total_stocks, batch_size):
-            batch = stock_list[i:i + batch_size]
-            batch_results = []
-
-            for stock_code in batch:
-                try:
-                    # 使用简化版分析以加快速度
-                    report = self.quick_analyze_stock(stock_code, market_type)
-                    if report['score'] >= min_score:
-                        batch_results.append(report)
-                except Exception as e:
-                    self.logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
-                    continue
-
-            # 添加批处理结果
-            recommendations.extend(batch_results)
-
-            # 更新处理进度
-            processed += len(batch)
-            elapsed = time.time() - start_time
-            remaining = (elapsed / processed) * (total_stocks - processed) if processed > 0 else 0
-
-            self.logger.info(
-                f"已处理 {processed}/{total_stocks} 只股票，耗时 {elapsed:.1f}秒，预计剩余 {remaining:.1f}秒")
-
-        # 按得分排序
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-
-        total_time = time.time() - start_time
-        self.logger.info(
-            f"市场扫描完成，共分析 {total_stocks} 只股票，找到 {len(recommendations)} 只符合条件的股票，总耗时 {total_time:.1f}秒")
-
-        return recommendations
+        return ScanEngine(self).scan(stock_list, min_score, market_type)
 
     def quick_analyze_stock(self, stock_code, market_type='A'):
         """快速分析股票，用于市场扫描"""
         try:
-            # 获取股票数据
-            df = self.get_stock_data(stock_code, market_type)
-
-            # 计算技术指标
-            df = self.calculate_indicators(df)
+            # 获取股票数据和技术指标
+            df = self.get_indicator_data(stock_code, market_type)
 
             # 简化评分计算
-            score = self.calculate_score(df)
+            score = self.calculate_score(df, fingerprint=self.indicator_fingerprint(stock_code, df, market_type))
 
             # 获取最新数据
             latest = df.iloc[-1]
@@ -1613,35 +1925,20 @@ class StockAnalyzer:
         import akshare as ak
         try:
             cache_key = f"{stock_code}_info"
-            if cache_key in self.data_cache:
-                return self.data_cache[cache_key]
-
-            # 获取A股股票基本信息
-            stock_info = allstockinfo
+            cached_info = self.data_cache.get(cache_key)
+            if cached_info is not None:
+                return cached_info
 
-            # 修改：使用列名而不是索引访问数据
+            # 从代码表索引中按代码或名称查找
             info_dict = {}
-            for _, row in stock_info.iterrows():
-                # 使用iloc安全地获取数据
-                if len(row) >= 2:  # 确保有至少两列
-                    info_dict[row.iloc[0]] = row.iloc[1]
-            for data in stock_info.iterrows():
-                code = data[1]['code']
-                name = data[1]['name']
-                market = data[1]['market']
-                try:
-                    Industry = data[1]['Industry']
-                    if Industry is None:
-                        Industry = "未知"
-                except:
-                    Industry = "未知"
-                if code == stock_code or name == stock_code:
-                    info_dict = {
-                        '股票代码': code,
-                        '股票名称': name,
-                        '行业': Industry,
-                        '地区': market
-                    }
+            record = get_stock_record(stock_code)
+            if record:
+                info_dict = {
+                    '股票代码': record['code'],
+                    '股票名称': record['name'],
+                    '行业': record['Industry'],
+                    '地区': record['market']
+                }
             # 确保基本字段存在
             if '股票代码' not in info_dict:
                 info_dict['股票代码'] = "未知"
@@ -1848,26 +2145,29 @@ class StockAnalyzer:
         start_time = time.time()
         self.logger.info(f"开始执行股票 {stock_code} 的增强分析")
 
-        # 获取股票数据
-        df = self.get_stock_data(stock_code, market_type)
-        data_time = time.time()
-        self.logger.info(f"获取股票数据耗时: {data_time - start_time:.2f}秒")
+        # 优先使用收盘后预计算的技术指标、支撑压力位和技术面评分，未覆盖的股票实时计算
+        materialized = eod_store.get(stock_code, market_type) if eod_store is not None else None
+        if materialized is not None:
+            df = materialized['indicators']
+            sr_levels = materialized['support_resistance']
+            technical_score = materialized['technical_score']
+            self.logger.info(f"使用 {materialized['trade_date']} 收盘后预计算的技术指标和评分")
+        else:
+            # 获取股票数据和技术指标（同一K线只计算一次）
+            df = self.get_indicator_data(stock_code, market_type)
+            indicator_time = time.time()
+            self.logger.info(f"获取股票数据和技术指标耗时: {indicator_time - start_time:.2f}秒")
 
-        # 计算技术指标
-        df = self.calculate_indicators(df)
-        indicator_time = time.time()
-        self.logger.info(f"计算技术指标耗时: {indicator_time - data_time:.2f}秒")
+            # 获取支撑压力位
+            sr_levels = self.identify_support_resistance(df)
+
+            # 计算技术面评分
+            technical_score = self.calculate_technical_score(df)
 
         # 获取最新数据
         latest = df.iloc[-1]
         prev = df.iloc[-2] if len(df) > 1 else latest
 
-        # 获取支撑压力位
-        sr_levels = self.identify_support_resistance(df)
-
-        # 计算技术面评分
-        technical_score = self.calculate_technical_score(df)
-
         # 获取股票信息
         stock_info = self.get_stock_info(stock_code)
 
@@ -1929,7 +2229,7 @@ class StockAnalyzer:
                 ),
                 'key_points': []
             },
-            'ai_analysis': self.get_ai_analysis(df, stock_code)
+            'ai_analysis': self.get_ai_analysis(df, stock_code, market_type)
         }
         print(f"增强版报告：{enhanced_report}")
         # 最后检查并修复报告结构
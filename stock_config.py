@@ -3,6 +3,8 @@
 股票查询配置文件
 """
 
+import os
+
 # API配置
 API_CONFIG = {
     # 查询超时时间（秒）
@@ -60,6 +62,308 @@ DATA_CONFIG = {
     'columns': ['code', 'name', 'market', 'Industry']
 }
 
+# 本地K线存储配置
+KLINE_STORE_CONFIG = {
+    # 是否启用本地K线存储
+    'enabled': True,
+    
+    # SQLite数据库文件路径
+    'db_path': './data/kline_store.db',
+    
+    # 各市场收盘时间（本地时间），同步时间晚于最近一次收盘即视为最新
+    'market_close': {
+        'A': '15:30',
+        'HK': '16:30',
+        'US': '05:30'   # 美股收盘对应北京时间次日凌晨
+    },
+    
+    # 各市场开盘时间（本地时间，含集合竞价），与收盘时间之间为交易时段；美股跨越北京时间午夜
+    'market_open': {
+        'A': '09:15',
+        'HK': '09:00',
+        'US': '21:30'
+    },
+    
+    # 各市场收盘事件发生在星期几（0=周一）
+    'close_weekdays': {
+        'A': [0, 1, 2, 3, 4],
+        'HK': [0, 1, 2, 3, 4],
+        'US': [1, 2, 3, 4, 5]
+    },
+    
+    # 收盘事件对应的K线日期偏移（天），美股北京时间凌晨收盘的是前一天的K线
+    'bar_date_offset': {
+        'US': -1
+    }
+}
+
+# 分钟K线配置
+MINUTE_BAR_CONFIG = {
+    # 支持的分钟周期
+    'periods': [1, 5, 15, 60],
+    
+    # 每只股票每个周期保存的K线数量（环形缓冲区长度），需覆盖MA60等指标的计算窗口
+    'capacity': {
+        1: 480,   # 约2个交易日
+        5: 480,   # 约10个交易日
+        15: 320,  # 约20个交易日
+        60: 240   # 约60个交易日
+    },
+    
+    # 缓冲区已有数据时，每次刷新下载的最近K线数量
+    'refresh_bars': 10,
+    
+    # 最多保存的缓冲区数量（股票 x 周期），超出后淘汰最近最少使用的缓冲区
+    'max_buffers': 2000,
+    
+    # 超过该秒数未被访问的缓冲区在创建新缓冲区时淘汰
+    'idle_ttl': 24 * 3600,
+    
+    # 盘中监控一次最多的股票数量，以及等待补齐分钟K线的最长时间（秒）
+    'max_scan_stocks': 200,
+    'refresh_timeout': 10
+}
+
+# 增量技术指标配置
+INDICATOR_STATE_CONFIG = {
+    # 最多保存的指标状态数量（股票 x 市场 x 参数），超出后淘汰最近最少使用的状态
+    'max_states': int(os.getenv('INDICATOR_STATE_MAX', '2000'))
+}
+
+# 统一缓存配置（各分析器共用）
+DATA_CACHE_CONFIG = {
+    # 本地内存预算（字节），超出后按最近最少使用淘汰
+    'max_bytes': int(os.getenv('DATA_CACHE_MAX_MB', '256')) * 1024 * 1024,
+    
+    # 二级缓存: memory（仅本地内存）/ redis / disk，多进程部署时使用redis或disk共享数据
+    'backend': os.getenv('CACHE_BACKEND', 'redis' if os.getenv('USE_REDIS_CACHE', 'False').lower() == 'true' else 'memory'),
+    'redis_url': os.getenv('REDIS_URL'),
+    'key_prefix': 'stockanal:',
+    'disk_path': './data/cache_service.db',
+    
+    # 写入二级缓存的数据超过该字节数时用zlib压缩，compress_level 为压缩级别（1速度优先）
+    'compress_min_bytes': 16384,
+    'compress_level': 1,
+    
+    # 防止缓存击穿：同一个键只由一个请求加载，其余请求最多等待的秒数（也是跨进程加载锁的过期时间）
+    'fill_lock_timeout': 30,
+    'fill_poll_interval': 0.05,
+    
+    # 各命名空间的过期时间（秒），值为字典时按缓存键后缀区分数据类型
+    # 基本面分析的命名空间沿用 fundamental_config.CACHE_CONFIG
+    'namespaces': {
+        'stock': {
+            'price': 600,     # 行情数据，盘中需要及时刷新
+            'indicators': 600,  # 技术指标，随行情数据一起过期
+            'score': 600,       # 评分结果，与技术指标一致
+            'news': 3600,     # 新闻资讯
+            'info': 86400     # 股票基本信息
+        },
+        'capital_flow': 3600,        # 资金流向
+        'industry_fund_flow': 1800,  # 行业资金流向
+        'industry_stocks': 3600,     # 行业成分股
+        'index_industry': 3600,      # 指数/行业整体分析结果
+        'market_snapshot': 60,       # 全市场行情快照
+        'view': 300                  # Flask-Caching 视图缓存（@cache.cached 指定的timeout优先）
+    },
+    
+    # 未列出命名空间的默认过期时间
+    'default_ttl': 3600
+}
+
+# 全市场行情快照配置
+SNAPSHOT_CONFIG = {
+    # 快照缓存时间（秒）
+    'ttl': 60,
+    
+    # 与快照合并的本地历史K线天数（自然日），覆盖MA60等指标的计算窗口
+    'history_days': 180,
+    
+    # 各市场的预筛选默认条件，值为None表示不限制；成交额和股价使用各市场的交易货币
+    'prefilter': {
+        'A': {
+            'min_amount': 5e7,       # 最低成交额（人民币）
+            'min_price': 1.0,        # 最低股价
+            'max_abs_change': None,  # 涨跌幅绝对值上限（%）
+            'min_turnover': 0.3,     # 最低换手率（%）
+            'exclude_st': True       # 排除ST股票（只对A股生效）
+        },
+        'HK': {
+            'min_amount': 1e7,       # 最低成交额（港元）
+            'min_price': 0.5,
+            'max_abs_change': None,
+            'min_turnover': None,
+            'exclude_st': False
+        },
+        'US': {
+            'min_amount': 5e6,       # 最低成交额（美元）
+            'min_price': 1.0,
+            'max_abs_change': None,
+            'min_turnover': None,
+            'exclude_st': False
+        }
+    }
+}
+
+# 市场扫描配置
+SCAN_CONFIG = {
+    # 并发分析的线程数
+    'max_workers': int(os.getenv('SCAN_MAX_WORKERS', '16')),
+    
+    # 单只股票分析超时时间（秒），超时后跳过
+    'stock_timeout': int(os.getenv('SCAN_STOCK_TIMEOUT', '30')),
+    
+    # 同一时间提交到共享线程池的任务数上限，为0时取 max_workers 的2倍
+    'submit_window': int(os.getenv('SCAN_SUBMIT_WINDOW', '0')),
+    
+    # 每次批量预取K线的股票数量，预取完一块即开始分析，块之间检查任务取消
+    'prefetch_chunk': int(os.getenv('SCAN_PREFETCH_CHUNK', '200')),
+    
+    # 两阶段扫描：先批量计算评分上限，只对可能达到最低评分的股票做完整分析
+    'staged': os.getenv('SCAN_STAGED', 'True').lower() == 'true',
+    
+    # 只保留评分最高的前K只股票，为0时不限数量
+    'top_k': int(os.getenv('SCAN_TOP_K', '100')),
+    
+    # 扫描过程中发布阶段结果的最小间隔（秒）
+    'partial_interval': 1.0
+}
+
+# 任务队列配置（个股分析和市场扫描由独立的工作进程执行）
+TASK_QUEUE_CONFIG = {
+    'db_path': os.getenv('TASK_QUEUE_DB', './data/task_queue.db'),
+    
+    # 优先级，数值越大越先执行；提交时可单独指定
+    'priority': {
+        'stock_analysis': 10,
+        'market_scan': 0,
+        'eod_materialize': -10
+    },
+    
+    # 各类型同时执行的任务数上限（所有工作进程合计）
+    'concurrency': {
+        'stock_analysis': int(os.getenv('TASK_ANALYSIS_CONCURRENCY', '4')),
+        'market_scan': int(os.getenv('TASK_SCAN_CONCURRENCY', '1')),
+        'eod_materialize': 1
+    },
+    
+    # python web_server.py 启动时同时启动工作进程；使用gunicorn等部署时设为False，单独运行 python task_worker.py
+    'embedded_worker': os.getenv('TASK_WORKER_EMBEDDED', 'True').lower() == 'true',
+    
+    # 工作进程轮询队列的间隔（秒）
+    'poll_interval': 0.5,
+    
+    # Web进程检查任务变化的间隔（秒），所有等待任务结果的请求共用一次查询
+    'watch_interval': 0.5,
+    
+    # 任务进度推送（SSE）无变化时发送保活注释的间隔（秒），需小于反向代理的读超时
+    'stream_keepalive': 15,
+    
+    # 执行中的任务超过该时间（秒）未更新视为工作进程已退出，重新放回队列
+    'stale_timeout': 600,
+    
+    # 已结束任务保留时间（秒）
+    'completed_ttl': 3600,
+    
+    # 任务最长保留时间（秒）
+    'max_age': 10800
+}
+
+# 收盘后预计算配置（每天16:30左右清理缓存后，由任务工作进程批量计算常用股票的分析结果）
+EOD_CONFIG = {
+    # 是否启用
+    'enabled': os.getenv('EOD_MATERIALIZE', 'True').lower() == 'true',
+    
+    # SQLite数据库文件路径
+    'db_path': os.getenv('EOD_DB', './data/eod_analytics.db'),
+    
+    # 市场类型
+    'market_type': 'A',
+    
+    # 预计算范围：指数成分股（逗号分隔的指数代码）、额外的股票代码，以及最近几天分析过的股票（需启用数据库）
+    'indices': [code.strip() for code in os.getenv('EOD_INDICES', '000300').split(',') if code.strip()],
+    'stocks': [code.strip() for code in os.getenv('EOD_STOCKS', '').split(',') if code.strip()],
+    'recent_days': 7,
+    
+    # 单次预计算的股票数量上限
+    'max_stocks': int(os.getenv('EOD_MAX_STOCKS', '1000')),
+    
+    # 预计算结果保留天数
+    'retention_days': 7
+}
+
+# API响应协商缓存和压缩配置
+RESPONSE_CONFIG = {
+    # 为JSON响应设置ETag，客户端带 If-None-Match 且数据未变化时返回304
+    'etag': os.getenv('RESPONSE_ETAG', 'True').lower() == 'true',
+    
+    # 按客户端的 Accept-Encoding 压缩响应（brotli 需安装 Brotli 包，否则使用gzip）
+    'compress': os.getenv('RESPONSE_COMPRESS', 'True').lower() == 'true',
+    
+    # 小于该字节数的响应不压缩
+    'compress_min_size': 1024,
+    
+    # gzip压缩级别（1-9）和brotli压缩质量（0-11），数值越大压缩率越高、耗时越长
+    'gzip_level': 6,
+    'brotli_quality': 4
+}
+
+# HTTP连接池配置
+HTTP_CONFIG = {
+    # 缓存的主机连接池数量
+    'pool_connections': 20,
+    
+    # 每个主机保持的keep-alive连接数，不小于扫描并发数
+    'pool_maxsize': 32,
+    
+    # 异步批量请求的最大并发数
+    'max_concurrency': 32,
+    
+    # 默认请求超时时间（秒）
+    'timeout': 15,
+    
+    # 安装h2时启用HTTP/2
+    'http2': True
+}
+
+# 多数据源对冲请求配置
+FETCH_HEDGE_CONFIG = {
+    # 是否启用对冲请求：首个数据源超过延迟预算仍未返回时，并行请求下一个数据源
+    'enabled': True,
+    
+    # 延迟预算（秒），从请求真正开始时计算，不含线程池排队和限流等待
+    'hedge_delay': 1.5,
+    
+    # 每次获取最多因超时并行请求的额外数据源数量（失败后切换数据源不计入）
+    'max_hedges': 1,
+    
+    # 全进程同时进行的对冲请求数量上限
+    'max_inflight_hedges': 4,
+    
+    # 单个数据源的请求超时（秒）
+    'source_timeout': 8,
+    
+    # 一次获取（含对冲和切换数据源）的总时限（秒），复权变化时增量同步会连续获取两次，
+    # 两次之和仍小于 SCAN_CONFIG['stock_timeout']，超时的扫描任务能及时释放共享分析线程池中的线程
+    'total_timeout': 12,
+    
+    # 统计延迟和错误率的指数移动平均系数
+    'stats_alpha': 0.2,
+    
+    # 样本数达到该值后才按统计结果调整数据源顺序
+    'min_samples': 5
+}
+
+# 数据源限流配置：rate 为每秒请求数，burst 为允许的突发请求数
+RATE_LIMIT_CONFIG = {
+    'tencent': {'rate': 10, 'burst': 20},
+    'eastmoney': {'rate': 5, 'burst': 10},
+    'sina': {'rate': 5, 'burst': 10},
+    'netease': {'rate': 5, 'burst': 10},
+    'yahoo': {'rate': 2, 'burst': 5},
+    'default': {'rate': 5, 'burst': 10}
+}
+
 # 日志配置
 LOG_CONFIG = {
     'level': 'INFO',
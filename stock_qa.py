@@ -334,8 +334,7 @@ class StockQA:
             industry = stock_info.get('行业', '未知')
 
             # 获取技术指标数据
-            df = self.analyzer.get_stock_data(stock_code, market_type)
-            df = self.analyzer.calculate_indicators(df)
+            df = self.analyzer.get_indicator_data(stock_code, market_type)
 
             # 提取最新数据
             latest = df.iloc[-1]
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+"""
+持久化任务队列
+个股分析和市场扫描任务保存在SQLite中，由独立的工作进程（task_worker.py）领取执行，
+Web进程只负责提交任务和查询状态；重启后任务不丢失，多个Web进程共享同一个队列
+"""
+# task_queue.py
+import os
+import json
+import uuid
+import sqlite3
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+from stock_config import TASK_QUEUE_CONFIG
+
+# 任务状态
+TASK_PENDING = 'pending'
+TASK_RUNNING = 'running'
+TASK_COMPLETED = 'completed'
+TASK_FAILED = 'failed'
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _now():
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def _json_default(obj):
+    """结果中的NumPy类型和日期转换为JSON可序列化的类型"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+class TaskQueue:
+    """
+    基于SQLite的任务队列
+
+    参数:
+        db_path: 数据库文件路径，默认读取 TASK_QUEUE_CONFIG
+        config: 配置，默认使用 TASK_QUEUE_CONFIG
+    """
+
+    def __init__(self, db_path=None, config=None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or TASK_QUEUE_CONFIG
+        self.db_path = db_path or self.config['db_path']
+        self._write_lock = threading.Lock()
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._init_db()
+
+    @contextmanager
+    def _connect(self, immediate=False):
+        """打开数据库连接；immediate为True时立即获取写锁，用于多进程间原子领取任务"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    key TEXT,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    params TEXT,
+                    result TEXT,
+                    partial TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (type, status, priority)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_key ON tasks (type, key)')
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(tasks)')}
+            if 'version' not in columns:
+                conn.execute('ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            if 'partial' not in columns:
+                conn.execute('ALTER TABLE tasks ADD COLUMN partial TEXT')
+        # WAL模式下读取状态不会被工作进程的写入阻塞
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        finally:
+            conn.close()
+
+    def _to_task(self, row, with_result=True):
+        if row is None:
+            return None
+        task = {
+            'id': row['id'],
+            'type': row['type'],
+            'key': row['key'],
+            'priority': row['priority'],
+            'status': row['status'],
+            'progress': row['progress'],
+            'total': row['total'],
+            'version': row['version'],
+            'params': json.loads(row['params']) if row['params'] else {},
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+        if with_result and row['result'] is not None:
+            task['result'] = json.loads(row['result'])
+        if with_result and row['partial'] is not None:
+            task['partial'] = json.loads(row['partial'])
+        if row['error'] is not None:
+            task['error'] = row['error']
+        return task
+
+    def submit(self, task_type, params, key=None, priority=None, total=0):
+        """
+        提交任务
+
+        参数:
+            task_type: 任务类型（stock_analysis / market_scan）
+            params: 任务参数（可JSON序列化）
+            key: 去重键，相同键的任务未结束或已完成时直接复用
+            priority: 优先级，数值越大越先执行，默认读取配置
+            total: 任务包含的条目数（市场扫描为股票数量）
+
+        返回:
+            (任务, 是否新建)
+        """
+        if priority is None:
+            priority = self.config['priority'].get(task_type, 0)
+
+        with self._write_lock, self._connect(immediate=True) as conn:
+            if key is not None:
+                row = conn.execute(
+                    'SELECT * FROM tasks WHERE type = ? AND key = ? AND status IN (?, ?, ?) '
+                    'ORDER BY rowid DESC LIMIT 1',
+                    (task_type, key, TASK_PENDING, TASK_RUNNING, TASK_COMPLETED)
+                ).fetchone()
+                if row is not None:
+                    return self._to_task(row), False
+
+            task_id = str(uuid.uuid4())
+            now = _now()
+            conn.execute(
+                'INSERT INTO tasks (id, type, key, priority, status, progress, total, params, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?)',
+                (task_id, task_type, key, priority, TASK_PENDING, total,
+                 json.dumps(params, ensure_ascii=False, default=_json_default), now, now)
+            )
+            row = conn.execute('SELECT * FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        self.logger.info(f"提交任务 {task_type}:{task_id}，优先级 {priority}")
+        return self._to_task(row), True
+
+    def get(self, task_id, task_type=None):
+        """查询任务，task_type 不匹配或不存在时返回None"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if row is None or (task_type is not None and row['type'] != task_type):
+            return None
+        return self._to_task(row)
+
+    def claim(self, task_type, worker_id):
+        """
+        领取一个待执行任务（优先级高的先执行，同优先级先提交先执行）
+        该类型正在执行的任务数达到并发上限时返回None；
+        超过 stale_timeout 未更新的执行中任务视为工作进程已退出，重新放回队列
+        """
+        limit = self.config['concurrency'].get(task_type, 1)
+        stale_before = (datetime.now() - timedelta(seconds=self.config['stale_timeout'])).strftime(TIME_FORMAT)
+
+        with self._write_lock, self._connect(immediate=True) as conn:
+            requeued = conn.execute(
+                'UPDATE tasks SET status = ?, worker = NULL, version = version + 1 '
+                'WHERE type = ? AND status = ? AND updated_at < ?',
+                (TASK_PENDING, task_type, TASK_RUNNING, stale_before)
+            ).rowcount
+            if requeued:
+                self.logger.warning(f"{requeued} 个 {task_type} 任务长时间未更新，已重新放回队列")
+
+            running = conn.execute('SELECT COUNT(*) FROM tasks WHERE type = ? AND status = ?',
+                                   (task_type, TASK_RUNNING)).fetchone()[0]
+            if running >= limit:
+                return None
+
+            row = conn.execute(
+                'SELECT * FROM tasks WHERE type = ? AND status = ? ORDER BY priority DESC, rowid LIMIT 1',
+                (task_type, TASK_PENDING)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE tasks SET status = ?, worker = ?, updated_at = ?, version = version + 1 WHERE id = ?',
+                         (TASK_RUNNING, worker_id, _now(), row['id']))
+            row = conn.execute('SELECT * FROM tasks WHERE id = ?', (row['id'],)).fetchone()
+        return self._to_task(row, with_result=False)
+
+    def update(self, task_id, status=None, progress=None, total=None, result=None, error=None, partial=None):
+        """
+        更新任务状态、进度或结果；同时刷新 updated_at 作为心跳
+        partial 为执行过程中的阶段结果（例如市场扫描当前的前K名）
+        """
+        fields = ['updated_at = ?', 'version = version + 1']
+        values = [_now()]
+        if status is not None:
+            fields.append('status = ?')
+            values.append(status)
+        if progress is not None:
+            fields.append('progress = ?')
+            values.append(int(progress))
+        if total is not None:
+            fields.append('total = ?')
+            values.append(int(total))
+        if result is not None:
+            fields.append('result = ?')
+            values.append(json.dumps(result, ensure_ascii=False, default=_json_default))
+        if error is not None:
+            fields.append('error = ?')
+            values.append(error)
+        if partial is not None:
+            fields.append('partial = ?')
+            values.append(json.dumps(partial, ensure_ascii=False, default=_json_default))
+        values.append(task_id)
+
+        with self._write_lock, self._connect() as conn:
+            conn.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id = ?', values)
+
+    def finish(self, task_id, result=None, error=None):
+        """任务结束：有错误时标记为失败，否则标记为完成；已被取消的任务保持取消状态"""
+        status = TASK_FAILED if error is not None else TASK_COMPLETED
+        fields = ['status = ?', 'updated_at = ?', 'version = version + 1']
+        values = [status, _now()]
+        if error is None:
+            fields.append('progress = 100')
+            fields.append('result = ?')
+            values.append(json.dumps(result, ensure_ascii=False, default=_json_default))
+        else:
+            fields.append('error = ?')
+            values.append(error)
+        values.extend([task_id, TASK_RUNNING])
+
+        with self._write_lock, self._connect() as conn:
+            conn.execute(f'UPDATE tasks SET {", ".join(fields)} WHERE id = ? AND status = ?', values)
+
+    def cancel(self, task_id):
+        """
+        取消未结束的任务
+
+        返回:
+            None 表示任务不存在，False 表示任务已结束无法取消，True 表示已取消
+        """
+        with self._write_lock, self._connect(immediate=True) as conn:
+            row = conn.execute('SELECT status FROM tasks WHERE id = ?', (task_id,)).fetchone()
+            if row is None:
+                return None
+            if row['status'] in (TASK_COMPLETED, TASK_FAILED):
+                return False
+            conn.execute('UPDATE tasks SET status = ?, error = ?, updated_at = ?, version = version + 1 WHERE id = ?',
+                         (TASK_FAILED, '用户取消任务', _now(), task_id))
+        return True
+
+    def is_cancelled(self, task_id):
+        """执行中的任务被取消或删除时返回True"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT status FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return row is None or row['status'] != TASK_RUNNING
+
+    def cleanup(self, task_type=None):
+        """
+        清理旧任务：结束超过 completed_ttl 的任务，以及创建超过 max_age 的任务
+
+        返回:
+            删除的任务数量
+        """
+        now = datetime.now()
+        finished_before = (now - timedelta(seconds=self.config['completed_ttl'])).strftime(TIME_FORMAT)
+        created_before = (now - timedelta(seconds=self.config['max_age'])).strftime(TIME_FORMAT)
+        sql = ('DELETE FROM tasks WHERE ((status IN (?, ?) AND updated_at < ?) OR '
+               '(updated_at < ? AND created_at < ?))')
+        params = [TASK_COMPLETED, TASK_FAILED, finished_before, created_before, created_before]
+        if task_type is not None:
+            sql += ' AND type = ?'
+            params.append(task_type)
+
+        with self._write_lock, self._connect() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def clear_completed(self):
+        """删除所有已完成的任务（收盘后数据更新，旧的分析结果不再复用）"""
+        with self._write_lock, self._connect() as conn:
+            return conn.execute('DELETE FROM tasks WHERE status = ?', (TASK_COMPLETED,)).rowcount
+
+    def versions(self, task_ids):
+        """批量查询任务的版本号（每次更新加1），不存在的任务不在返回结果中"""
+        if not task_ids:
+            return {}
+        placeholders = ', '.join('?' * len(task_ids))
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT id, version FROM tasks WHERE id IN ({placeholders})',
+                                list(task_ids)).fetchall()
+        return {row['id']: row['version'] for row in rows}
+
+    def stats(self):
+        """按类型和状态统计任务数量"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT type, status, COUNT(*) FROM tasks GROUP BY type, status').fetchall()
+        stats = {}
+        for task_type, status, count in rows:
+            stats.setdefault(task_type, {})[status] = count
+        return stats
+
+
+class TaskWatcher:
+    """
+    任务变化通知
+    所有等待者共用一个后台线程，每隔 watch_interval 秒批量查询一次被关注任务的版本号，
+    有变化时唤醒对应的等待者；等待期间不占用CPU，也不会按等待者数量放大数据库查询
+
+    参数:
+        queue: 任务队列
+        interval: 查询间隔（秒），默认读取队列配置的 watch_interval
+    """
+
+    def __init__(self, queue, interval=None):
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue
+        self.interval = interval or queue.config.get('watch_interval', 0.5)
+        self._cond = threading.Condition()
+        self._watchers = {}
+        self._versions = {}
+        self._thread = None
+
+    def _watch(self, task_id):
+        with self._cond:
+            self._watchers[task_id] = self._watchers.get(task_id, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='task-watcher', daemon=True)
+                self._thread.start()
+
+    def _unwatch(self, task_id):
+        with self._cond:
+            count = self._watchers.get(task_id, 0) - 1
+            if count > 0:
+                self._watchers[task_id] = count
+            else:
+                self._watchers.pop(task_id, None)
+                self._versions.pop(task_id, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                task_ids = list(self._watchers)
+                if not task_ids:
+                    self._thread = None
+                    return
+            try:
+                versions = self.queue.versions(task_ids)
+            except Exception as e:
+                self.logger.warning(f"查询任务版本失败: {str(e)}")
+                versions = None
+
+            if versions is not None:
+                with self._cond:
+                    changed = False
+                    for task_id in task_ids:
+                        # 任务被删除时版本号记为None
+                        version = versions.get(task_id)
+                        if task_id in self._watchers and self._versions.get(task_id, -1) != version:
+                            self._versions[task_id] = version
+                            changed = True
+                    if changed:
+                        self._cond.notify_all()
+            time.sleep(self.interval)
+
+    def wait(self, task_id, version=None, timeout=None):
+        """
+        等待任务更新
+
+        参数:
+            task_id: 任务ID
+            version: 调用方已知的版本号，为None时立即返回当前任务
+            timeout: 最长等待时间（秒），超时返回未变化的任务
+
+        返回:
+            最新的任务；任务不存在时返回None
+        """
+        task = self.queue.get(task_id)
+        if task is None or version is None or task['version'] != version:
+            return task
+
+        deadline = None if timeout is None else time.time() + timeout
+        self._watch(task_id)
+        try:
+            while True:
+                with self._cond:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    if not self._cond.wait_for(lambda: self._versions.get(task_id, version) != version, remaining):
+                        break
+                task = self.queue.get(task_id)
+                if task is None or task['version'] != version:
+                    return task
+                # 后台线程记录的是更早的版本，以数据库中的当前版本为准继续等待
+                with self._cond:
+                    self._versions[task_id] = version
+        finally:
+            self._unwatch(task_id)
+        return self.queue.get(task_id)
+
+    def wait_for_completion(self, task_id, timeout):
+        """
+        等待任务完成或失败
+
+        返回:
+            最新的任务（超时时为未结束的任务）；任务不存在时返回None
+        """
+        deadline = time.time() + timeout
+        task = self.queue.get(task_id)
+        while task is not None and task['status'] not in (TASK_COMPLETED, TASK_FAILED):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            task = self.wait(task_id, task['version'], remaining)
+        return task
+
+
+# 全局实例
+task_queue = TaskQueue()
+task_watcher = TaskWatcher(task_queue)
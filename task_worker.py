@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+任务工作进程
+从持久化任务队列（task_queue.py）领取个股分析、市场扫描和收盘后预计算任务并执行，
+每种任务类型一组执行线程，线程数即该类型的并发上限（TASK_QUEUE_CONFIG['concurrency']）
+
+运行方式:
+    python task_worker.py
+python web_server.py 启动时默认会同时启动一个工作进程（TASK_QUEUE_CONFIG['embedded_worker']）
+"""
+# task_worker.py
+import os
+import sys
+import time
+import atexit
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import subprocess
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from stock_config import TASK_QUEUE_CONFIG, LOG_CONFIG, SCAN_CONFIG
+from task_queue import task_queue
+
+# 每隔多少秒刷新一次执行中任务的更新时间，避免长任务被当作工作进程已退出
+HEARTBEAT_INTERVAL = 60
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TaskWorker:
+    """
+    任务工作进程
+
+    参数:
+        queue: 任务队列，默认使用全局 task_queue
+        config: 配置，默认使用 TASK_QUEUE_CONFIG
+        worker_id: 工作进程标识，默认为 主机名:进程号
+    """
+
+    def __init__(self, queue=None, config=None, worker_id=None):
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue or task_queue
+        self.config = config or TASK_QUEUE_CONFIG
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {
+            'stock_analysis': self.run_stock_analysis,
+            'market_scan': self.run_market_scan,
+            'eod_materialize': self.run_eod_materialize
+        }
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._analyzer = None
+        self._scan_engine = None
+        self._init_lock = threading.Lock()
+
+    @property
+    def analyzer(self):
+        """首次执行任务时再创建分析器，避免工作进程启动时加载全部依赖"""
+        with self._init_lock:
+            if self._analyzer is None:
+                from stock_analyzer import StockAnalyzer
+                self._analyzer = StockAnalyzer()
+            return self._analyzer
+
+    @property
+    def scan_engine(self):
+        analyzer = self.analyzer
+        with self._init_lock:
+            if self._scan_engine is None:
+                from scan_engine import ScanEngine
+                self._scan_engine = ScanEngine(analyzer)
+            return self._scan_engine
+
+    def start(self):
+        """启动执行线程和心跳线程"""
+        for task_type in self.handlers:
+            for i in range(self.config['concurrency'].get(task_type, 1)):
+                thread = threading.Thread(target=self._slot_loop, args=(task_type,),
+                                          name=f"{task_type}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name='heartbeat', daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        self.logger.info(f"任务工作进程 {self.worker_id} 已启动，并发配置: {self.config['concurrency']}")
+
+    def stop(self):
+        self._stop.set()
+
+    def run_forever(self, parent_pid=None):
+        """
+        启动后阻塞运行，直到收到中断或父进程退出
+
+        参数:
+            parent_pid: 由Web进程启动时传入，Web进程退出后工作进程随之退出
+        """
+        self.start()
+        cleared_date = None
+        try:
+            while not self._stop.wait(5):
+                if parent_pid and not _process_alive(parent_pid):
+                    self.logger.info("父进程已退出，停止任务工作进程")
+                    break
+
+                # 收盘后数据更新，清理本进程的数据缓存，与Web进程的 run_task_cleaner 保持一致
+                now = datetime.now()
+                if now.hour == 16 and 25 <= now.minute <= 35 and cleared_date != now.date():
+                    from cache_service import cache_service
+                    cache_service.clear()
+                    cleared_date = now.date()
+                    self.logger.info("市场收盘时间检测到，已清理工作进程的缓存数据")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _slot_loop(self, task_type):
+        """单个执行线程：循环领取并执行指定类型的任务"""
+        while not self._stop.is_set():
+            try:
+                task = self.queue.claim(task_type, self.worker_id)
+            except Exception as e:
+                self.logger.error(f"领取 {task_type} 任务失败: {str(e)}")
+                task = None
+            if task is None:
+                self._stop.wait(self.config['poll_interval'])
+                continue
+            self.execute(task)
+
+    def execute(self, task):
+        """执行已领取的任务并写回结果"""
+        task_id = task['id']
+        with self._active_lock:
+            self._active.add(task_id)
+        start_time = time.time()
+        try:
+            result = self.handlers[task['type']](task)
+            self.queue.finish(task_id, result=result)
+            self.logger.info(f"任务 {task['type']}:{task_id} 完成，耗时 {time.time() - start_time:.2f} 秒")
+        except Exception as e:
+            self.logger.error(f"任务 {task['type']}:{task_id} 失败: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            self.queue.finish(task_id, error=str(e))
+        finally:
+            with self._active_lock:
+                self._active.discard(task_id)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._active_lock:
+                active = list(self._active)
+            for task_id in active:
+                try:
+                    if not self.queue.is_cancelled(task_id):
+                        self.queue.update(task_id)
+                except Exception as e:
+                    self.logger.warning(f"刷新任务 {task_id} 心跳失败: {str(e)}")
+
+    def run_stock_analysis(self, task):
+        """个股分析任务：增强分析并保存到数据库"""
+        from database import USE_DATABASE, save_analysis_result_to_db
+
+        params = task['params']
+        stock_code = params['stock_code']
+        market_type = params.get('market_type', 'A')
+        self.queue.update(task['id'], progress=10)
+
+        result = self.analyzer.perform_enhanced_analysis(stock_code, market_type)
+
+        if USE_DATABASE:
+            try:
+                save_analysis_result_to_db(stock_code, market_type, result)
+            except Exception as db_error:
+                self.logger.error(f"保存分析结果到数据库失败: {str(db_error)}")
+        return result
+
+    def run_market_scan(self, task):
+        """市场扫描任务：可选快照预筛选后并行扫描，扫描过程中发布当前的前K名"""
+        task_id = task['id']
+        params = task['params']
+        stock_list = params['stock_list']
+        min_score = params.get('min_score', 60)
+        market_type = params.get('market_type', 'A')
+        prefilter = params.get('prefilter')
+        # 扫描任务只保留前K名，未指定时读取 SCAN_CONFIG['top_k']
+        top_k = params.get('top_k')
+        if top_k is None:
+            top_k = SCAN_CONFIG['top_k']
+        last_progress = [-1]
+        found_count = [0]
+
+        def on_progress(processed, total, found):
+            # 进度百分比变化时才写入队列
+            found_count[0] = found
+            progress = min(100, int(processed / total * 100))
+            if progress != last_progress[0]:
+                last_progress[0] = progress
+                self.queue.update(task_id, progress=progress)
+
+        def on_partial(results, found):
+            # 当前的前K名，扫描结束前即可展示
+            self.queue.update(task_id, partial={'found': found, 'results': results})
+
+        def is_cancelled():
+            return self.queue.is_cancelled(task_id)
+
+        # 用全市场快照预筛选，减少逐只分析的股票数量
+        scan_list = stock_list
+        if prefilter:
+            scan_list = self.analyzer.prefilter_stock_list(
+                stock_list, market_type, prefilter if isinstance(prefilter, dict) else None)
+            self.logger.info(f"扫描任务 {task_id} 预筛选后剩余 {len(scan_list)}/{len(stock_list)} 只股票")
+            self.queue.update(task_id, total=len(scan_list))
+
+        # 并行扫描，单只股票超时跳过
+        results = self.scan_engine.scan(scan_list, min_score, market_type,
+                                        progress_callback=on_progress, should_stop=is_cancelled,
+                                        top_k=top_k, partial_callback=on_partial)
+        if is_cancelled():
+            self.logger.info(f"扫描任务 {task_id} 被取消")
+            return results
+
+        # 完成后阶段结果只保留符合条件的总数，前K名见任务结果
+        self.queue.update(task_id, partial={'found': max(found_count[0], len(results))})
+        return results
+
+
+    def run_eod_materialize(self, task):
+        """收盘后预计算任务：批量计算常用股票的技术指标、评分、支撑压力位和风险指标"""
+        from eod_analytics import EODMaterializer
+        from risk_monitor import RiskMonitor
+
+        task_id = task['id']
+        params = task['params']
+        last_progress = [-1]
+
+        def on_progress(processed, total):
+            progress = min(100, int(processed / total * 100)) if total else 100
+            if progress != last_progress[0]:
+                last_progress[0] = progress
+                self.queue.update(task_id, progress=progress)
+
+        materializer = EODMaterializer(self.analyzer, RiskMonitor(self.analyzer))
+        return materializer.run(stock_list=params.get('stock_list'), market_type=params.get('market_type'),
+                                force=params.get('force', False), progress_callback=on_progress,
+                                should_stop=lambda: self.queue.is_cancelled(task_id))
+
+
+def start_worker_process():
+    """
+    在子进程中启动任务工作进程（python web_server.py 使用），当前进程退出时一并结束
+
+    返回:
+        subprocess.Popen 对象
+    """
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--parent-pid', str(os.getpid())])
+
+    def _terminate():
+        if process.poll() is None:
+            process.terminate()
+
+    atexit.register(_terminate)
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description='股票分析任务工作进程')
+    parser.add_argument('--parent-pid', type=int, default=None, help='父进程退出时随之退出')
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=LOG_CONFIG['level'], format=LOG_CONFIG['format'])
+    TaskWorker().run_forever(parent_pid=args.parent_pid)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+测试收盘后预计算：结果与实时计算一致、交易时段和下一次收盘后不使用、同一交易日只执行一次、取消后不再预取
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from eod_analytics import EODStore, EODMaterializer
+from kline_store import last_market_close
+from risk_monitor import RiskMonitor
+from stock_analyzer import StockAnalyzer
+
+
+def make_analyzer():
+    """使用生成的K线代替数据源的分析器"""
+    analyzer = StockAnalyzer()
+    frames = {}
+
+    def get_indicator_data(stock_code, market_type='A', start_date=None, end_date=None):
+        if stock_code not in frames:
+            rng = np.random.default_rng(int(stock_code))
+            close = 20 + np.cumsum(rng.normal(0, 0.5, 250))
+            raw = pd.DataFrame({
+                'date': pd.bdate_range(end=datetime.now().date(), periods=250),
+                'open': close + rng.normal(0, 0.1, 250), 'close': close,
+                'high': close + 0.5, 'low': close - 0.5,
+                'volume': rng.integers(100000, 1000000, 250).astype(float)
+            })
+            frames[stock_code] = analyzer.calculate_indicators(raw)
+        return frames[stock_code]
+
+    analyzer.get_indicator_data = get_indicator_data
+    analyzer.prefetch_stock_data = lambda stock_list, market_type='A': 0
+    return analyzer
+
+
+def test_materialize_and_serve():
+    """测试预计算结果与实时计算一致，下一次收盘后不再使用"""
+    print("=== 测试收盘后预计算 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = EODStore(os.path.join(tmpdir, 'eod.db'))
+        analyzer = make_analyzer()
+        risk_monitor = RiskMonitor(analyzer)
+        materializer = EODMaterializer(analyzer, risk_monitor, store=store,
+                                       config={'market_type': 'A', 'stocks': [], 'indices': [], 'recent_days': 0})
+
+        stock_list = ['600519', '000001', '300750']
+        summary = materializer.run(stock_list=stock_list)
+        assert summary['succeeded'] == 3 and summary['failed'] == 0
+        assert materializer.run(stock_list=stock_list).get('skipped'), "同一交易日不应重复执行"
+
+        # 最近一次收盘之后、下一次开盘之前读取
+        after_close = last_market_close('A') + timedelta(minutes=1)
+        for stock_code in stock_list:
+            record = store.get(stock_code, now=after_close)
+            df = analyzer.get_indicator_data(stock_code)
+            assert record['technical_score'] == analyzer.calculate_technical_score(df)
+            assert record['support_resistance'] == analyzer.identify_support_resistance(df)
+            assert record['risk']['risk_level'] == risk_monitor.analyze_stock_risk(
+                stock_code, use_materialized=False)['risk_level']
+            pd.testing.assert_frame_equal(record['indicators'], df)
+
+        # 下一次收盘之后结果失效，回退到实时计算
+        next_close = last_market_close('A', datetime.now() + timedelta(days=7)) + timedelta(minutes=1)
+        assert store.get('600519', now=next_close) is None
+        assert store.get('688981', now=after_close) is None
+
+        # 交易时段内最新价和指标随行情变化，不使用上一次收盘的结果
+        session = datetime.combine(after_close.date(), datetime.min.time()) + timedelta(days=1, hours=10)
+        while session.weekday() >= 5:
+            session += timedelta(days=1)
+        assert store.get('600519', now=session) is None
+        print(f"预计算 {summary['succeeded']} 只股票，耗时 {summary['elapsed']} 秒，统计: {store.stats()['count']}")
+
+
+def test_cancel_before_prefetch():
+    """测试取消后不再预取K线，也不记录为已完成"""
+    print("=== 测试收盘后预计算取消 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = EODStore(os.path.join(tmpdir, 'eod.db'))
+        analyzer = make_analyzer()
+        prefetched = []
+        analyzer.prefetch_stock_data = lambda stock_list, market_type='A': prefetched.append(list(stock_list))
+        materializer = EODMaterializer(analyzer, store=store,
+                                       config={'market_type': 'A', 'stocks': [], 'indices': [], 'recent_days': 0})
+
+        summary = materializer.run(stock_list=['600519', '000001'], should_stop=lambda: True)
+        assert prefetched == [] and summary['succeeded'] == 0
+        assert not store.has_run(summary['run_date'], 'A'), "取消的预计算不应记录为已完成"
+
+
+if __name__ == '__main__':
+    test_materialize_and_serve()
+    test_cancel_before_prefetch()
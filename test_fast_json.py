@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+测试快速JSON序列化与原 convert_numpy_types + json.dumps 的输出一致
+"""
+
+import json
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import fast_json
+
+
+def test_special_values():
+    """测试NumPy类型、NaN/Inf和日期的输出"""
+    print("=== 测试特殊值 ===")
+    payload = {
+        'score': np.float64(81.5), 'pinf': np.float64(np.inf), 'ninf': np.float64(-np.inf),
+        'nan': np.float64('nan'), 'fnan': float('nan'), 'finf': float('inf'),
+        'count': np.int64(5), 'flag': np.bool_(True), 'values': np.arange(3),
+        'day': date(2024, 1, 2), 'time': datetime(2024, 1, 2, 9, 30), 'ts': pd.Timestamp('2024-01-02 09:30'),
+        'items': [{'name': '贵州茅台', 'weight': np.float32(0.5)}], 1: 'int key'
+    }
+    expected = {
+        'score': 81.5, 'pinf': 1e308, 'ninf': None, 'nan': None, 'fnan': None, 'finf': None,
+        'count': 5, 'flag': True, 'values': [0, 1, 2],
+        'day': '2024-01-02', 'time': '2024-01-02T09:30:00', 'ts': '2024-01-02T09:30:00',
+        'items': [{'name': '贵州茅台', 'weight': 0.5}], '1': 'int key'
+    }
+    assert json.loads(fast_json.dumps(payload)) == expected
+
+    # 未安装orjson时的标准库路径
+    has_orjson = fast_json.HAS_ORJSON
+    fast_json.HAS_ORJSON = False
+    try:
+        assert json.loads(fast_json.dumps(payload)) == expected
+    finally:
+        fast_json.HAS_ORJSON = has_orjson
+    print(f"orjson: {fast_json.HAS_ORJSON}")
+
+
+def test_frame_records():
+    """测试DataFrame按列转换的结果与 to_dict('records') 一致"""
+    print("=== 测试DataFrame转换 ===")
+    df = pd.DataFrame({
+        'date': pd.date_range('2024-01-01', periods=5),
+        'close': [10.0, np.nan, 10.5, np.inf, 11.0],
+        'volume': np.arange(5, dtype='int64'),
+        'code': ['600519'] * 5
+    })
+    df.loc[2, 'date'] = pd.NaT
+
+    records = json.loads(fast_json.dumps({'data': fast_json.frame_records(df, '%Y-%m-%d')}))['data']
+    expected = df.copy()
+    expected['date'] = expected['date'].dt.strftime('%Y-%m-%d')
+    expected = expected.astype(object).where(expected.notna() & ~expected.isin([np.inf]), None)
+    assert records == expected.to_dict('records')
+    assert records[2]['date'] is None and records[1]['close'] is None and records[3]['close'] is None
+
+    columns = fast_json.frame_columns(df[['close', 'volume']])
+    assert columns['volume'] == [0, 1, 2, 3, 4]
+    print(f"记录数: {len(records)}")
+
+
+if __name__ == '__main__':
+    test_special_values()
+    test_frame_records()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+测试API响应的ETag协商和压缩
+"""
+
+import gzip
+import json
+
+from flask import Flask, jsonify, request
+
+import http_cache
+
+
+def make_app(counter):
+    app = Flask(__name__)
+    http_cache.init_app(app)
+
+    @app.route('/versioned')
+    def versioned():
+        version = request.args.get('v', '1')
+        response = http_cache.not_modified(version)
+        if response is not None:
+            return response
+        counter['built'] += 1
+        return http_cache.set_version(jsonify({'items': list(range(1000))}), version)
+
+    @app.route('/plain')
+    def plain():
+        return jsonify({'value': request.args.get('value', 'a')})
+
+    return app
+
+
+def test_versioned_etag():
+    """测试数据版本未变化时返回304且不生成响应内容"""
+    print("=== 测试按数据版本协商 ===")
+    counter = {'built': 0}
+    client = make_app(counter).test_client()
+
+    first = client.get('/versioned', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200 and first.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(first.data))['items'][-1] == 999
+    etag = first.headers['ETag']
+
+    again = client.get('/versioned', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+    assert counter['built'] == 1
+
+    changed = client.get('/versioned?v=2', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and 'Content-Encoding' not in changed.headers
+    print(f"压缩前 {len(changed.data)} 字节，压缩后 {len(first.data)} 字节")
+
+
+def test_content_etag():
+    """测试未设置版本的JSON响应按内容生成ETag，小响应不压缩"""
+    print("=== 测试内容哈希ETag ===")
+    client = make_app({'built': 0}).test_client()
+    first = client.get('/plain', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in first.headers
+    assert client.get('/plain', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    assert client.get('/plain?value=b', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+if __name__ == '__main__':
+    test_versioned_etag()
+    test_content_etag()
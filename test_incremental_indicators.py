@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+测试增量技术指标与批量计算结果的一致性
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+from stock_analyzer import StockAnalyzer
+from incremental_indicators import IndicatorState, IndicatorStateStore, indicator_state_store
+from indicator_engine import INDICATOR_COLUMNS
+from test_indicator_engine import make_panel
+
+
+def make_history(days=550):
+    panel = make_panel(symbols=('600519',), days=days, seed=3)
+    return panel.drop(columns='stock_code').reset_index(drop=True)
+
+
+def test_incremental_matches_batch():
+    """测试逐根K线增量更新与完整历史重新计算一致"""
+    print("=== 测试增量更新与批量计算一致 ===")
+    analyzer = StockAnalyzer()
+    history = make_history()
+    expected = analyzer.calculate_indicators(history.copy())
+
+    state = IndicatorState.from_frame(history.iloc[:100], analyzer.params)
+    for i in range(100, len(history)):
+        row = state.update(history.iloc[i].to_dict())
+        for col in INDICATOR_COLUMNS:
+            batch_value = expected.loc[i, col]
+            if col in ['MA5', 'MA20', 'MA60', 'BB_upper', 'BB_middle', 'BB_lower', 'RSI', 'Volatility',
+                       'ROC', 'Volume_Ratio']:
+                # calculate_indicators 结果已格式化为2位小数
+                assert abs(row[col] - batch_value) <= 0.005 + 1e-9, (i, col)
+            elif col in ['MACD', 'Signal', 'MACD_hist']:
+                assert abs(row[col] - batch_value) <= 0.0005 + 1e-9, (i, col)
+            else:
+                assert np.isclose(row[col], batch_value, rtol=1e-10, equal_nan=True), (i, col)
+    print(f"{len(history) - 100} 根K线增量更新结果一致")
+
+
+def test_replace_last_bar():
+    """测试盘中刷新同一根K线"""
+    print("\n=== 测试替换最后一根K线 ===")
+    history = make_history(200)
+    state = IndicatorState.from_frame(history.iloc[:-1])
+    last = history.iloc[-1].to_dict()
+
+    intraday = dict(last, close=last['close'] * 1.05, high=last['high'] * 1.05)
+    state.update(intraday)
+    row = state.update(last)  # 日期相同，自动替换
+
+    full = IndicatorState.from_frame(history)
+    for col in INDICATOR_COLUMNS:
+        assert np.isclose(row[col], full.latest[col], equal_nan=True), col
+    assert state.bar_count == len(history)
+    print(f"替换后RSI={row['RSI']:.2f}，K线数量={state.bar_count}")
+
+
+def test_seeded_with_today_bar():
+    """测试历史K线已包含当天K线时，推送当天K线替换而不是重复追加，缺少日期时拒绝更新"""
+    print("\n=== 测试历史包含当天K线 ===")
+    history = make_history(200)
+    analyzer = StockAnalyzer()
+    seeds = []
+
+    def get_stock_data(stock_code, market_type='A', start_date=None, end_date=None):
+        seeds.append(stock_code)
+        return history.copy()
+
+    analyzer.get_stock_data = get_stock_data
+    indicator_state_store.clear()
+    today = history.iloc[-1].to_dict()
+    bar = dict(today, close=today['close'] * 1.02, high=max(today['high'], today['close'] * 1.02))
+
+    threads = [threading.Thread(target=analyzer.update_indicators, args=('600519', bar)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seeds == ['600519'], f"并发的首次调用建立了 {len(seeds)} 次状态"
+
+    state = indicator_state_store.get(('600519', 'A', analyzer._params_key()))
+    expected = IndicatorState.from_frame(pd.concat([history.iloc[:-1], pd.DataFrame([bar])], ignore_index=True))
+    assert state.bar_count == len(history)
+    for col in INDICATOR_COLUMNS:
+        assert np.isclose(state.latest[col], expected.latest[col], equal_nan=True), col
+
+    undated = {k: v for k, v in bar.items() if k != 'date'}
+    try:
+        state.update(undated)
+        assert False, "缺少日期的K线应被拒绝"
+    except ValueError:
+        pass
+    assert state.bar_count == len(history)
+    indicator_state_store.clear()
+
+
+def test_state_store_bounded():
+    """测试指标状态数量超过上限时淘汰最近最少使用的状态"""
+    store = IndicatorStateStore(max_states=3)
+    for i in range(3):
+        store.set(i, IndicatorState())
+    store.get(0)
+    store.set(3, IndicatorState())
+    assert len(store) == 3 and store.get(1) is None and store.get(0) is not None
+
+
+if __name__ == '__main__':
+    test_incremental_matches_batch()
+    test_replace_last_bar()
+    test_seeded_with_today_bar()
+    test_state_store_bounded()
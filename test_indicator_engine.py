@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+测试批量技术指标引擎、批量评分与逐只计算结果的一致性，以及评分缓存的指纹
+"""
+
+import numpy as np
+import pandas as pd
+from stock_analyzer import StockAnalyzer
+from indicator_engine import score_upper_bound, calculate_score_batch
+
+
+def make_panel(symbols=('600519', '000001', '00700'), days=120, seed=7):
+    """构造长度不同、带停牌缺口的模拟行情面板"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    all_dates = pd.bdate_range('2024-01-01', periods=days)
+    for i, code in enumerate(symbols):
+        dates = all_dates[i * 10:]
+        if i == 1:
+            dates = dates.delete([15, 16, 40])  # 模拟停牌
+        close = 10 + np.cumsum(rng.normal(0, 0.3, len(dates)))
+        frames.append(pd.DataFrame({
+            'date': dates,
+            'stock_code': code,
+            'open': close + rng.normal(0, 0.1, len(dates)),
+            'close': close,
+            'high': close + np.abs(rng.normal(0, 0.2, len(dates))),
+            'low': close - np.abs(rng.normal(0, 0.2, len(dates))),
+            'volume': rng.integers(1000, 100000, len(dates)).astype(float)
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_batch_matches_single():
+    """测试长表批量计算与逐只计算一致"""
+    print("=== 测试批量计算与逐只计算一致 ===")
+    analyzer = StockAnalyzer()
+    panel = make_panel()
+
+    batch = analyzer.calculate_indicators_batch(panel)
+    for code, group in panel.groupby('stock_code'):
+        single = analyzer.calculate_indicators(group.drop(columns='stock_code').reset_index(drop=True))
+        batched = batch[batch['stock_code'] == code].drop(columns='stock_code').reset_index(drop=True)
+        pd.testing.assert_frame_equal(single, batched[single.columns])
+        print(f"{code}: {len(single)} 条记录一致")
+
+
+def test_wide_panel_latest_only():
+    """测试宽表输入和只取最新一行"""
+    print("\n=== 测试宽表输入 ===")
+    analyzer = StockAnalyzer()
+    panel = make_panel()
+    wide = {field: panel.pivot(index='date', columns='stock_code', values=field)
+            for field in ['open', 'close', 'high', 'low', 'volume']}
+
+    latest = analyzer.calculate_indicators_batch(wide, latest_only=True)
+    assert len(latest) == panel['stock_code'].nunique()
+    for _, row in latest.iterrows():
+        group = panel[panel['stock_code'] == row['stock_code']]
+        single = analyzer.calculate_indicators(group.drop(columns='stock_code').reset_index(drop=True))
+        for col in ['MA5', 'RSI', 'MACD', 'BB_upper', 'ATR', 'Volume_Ratio', 'ROC']:
+            assert np.isclose(single.iloc[-1][col], row[col], equal_nan=True)
+        print(f"{row['stock_code']}: 最新RSI={row['RSI']}")
+
+
+def test_score_batch_matches_single():
+    """测试批量评分与 calculate_score 一致"""
+    print("\n=== 测试批量评分 ===")
+    analyzer = StockAnalyzer()
+    symbols = [f"{i:06d}" for i in range(40)]
+    panel = make_panel(symbols=symbols, days=500, seed=11)
+
+    latest = analyzer.calculate_indicators_batch(panel, latest_only=True)
+    for market_type in ['A', 'HK', 'US']:
+        scores = analyzer.calculate_score_batch(latest, market_type)
+        for i, row in latest.iterrows():
+            group = panel[panel['stock_code'] == row['stock_code']]
+            df = analyzer.calculate_indicators(group.drop(columns='stock_code').reset_index(drop=True))
+            expected = analyzer.calculate_score(df, market_type)
+            assert scores.loc[i, 'total'] == expected
+            for key in ['trend', 'volatility', 'technical', 'volume', 'momentum']:
+                assert scores.loc[i, key] == analyzer.score_details[key]
+        print(f"{market_type}: {len(scores)} 只股票评分一致")
+
+
+def test_score_upper_bound():
+    """测试评分上限不低于完整评分"""
+    print("\n=== 测试评分上限 ===")
+    analyzer = StockAnalyzer()
+    symbols = [f"{i:06d}" for i in range(40)]
+    latest = analyzer.calculate_indicators_batch(make_panel(symbols=symbols, days=500, seed=13), latest_only=True)
+    # 包括美股财报季和港股情绪上调等市场调整
+    cases = [('A', {}), ('HK', {'score_offset': 5}), ('US', {'earnings_season': False}),
+             ('US', {'earnings_season': True})]
+    for market_type, kwargs in cases:
+        bounds = score_upper_bound(latest, market_type)
+        scores = calculate_score_batch(latest, market_type, **kwargs)
+        assert (scores['total'].to_numpy() <= bounds).all()
+        print(f"{market_type} {kwargs}: 上限低于60分的股票 {(bounds < 60).sum()}/{len(bounds)}")
+
+
+
+def test_score_cache_fingerprint():
+    """测试评分按显式传入的指纹缓存：截取的历史重新计算，股票名称与代码共用同一缓存"""
+    print("\n=== 测试评分缓存指纹 ===")
+    analyzer = StockAnalyzer()
+    history = make_panel(symbols=('600519',), days=200).drop(columns='stock_code').reset_index(drop=True)
+    analyzer.get_stock_data = lambda stock_code, market_type='A', start_date=None, end_date=None: history.copy()
+
+    df = analyzer.get_indicator_data('600519')
+    assert analyzer.indicator_fingerprint('贵州茅台', df) == analyzer.indicator_fingerprint('600519', df)
+    full_score = analyzer.calculate_score(df, fingerprint=analyzer.indicator_fingerprint('600519', df))
+
+    # 截取的历史（例如情景预测使用的较短区间）不沿用完整数据的评分
+    truncated = df.iloc[:-30].copy()
+    assert analyzer.calculate_score(truncated) == StockAnalyzer().calculate_score(truncated.copy())
+    assert analyzer.calculate_score(df, fingerprint=analyzer.indicator_fingerprint('贵州茅台', df)) == full_score
+    print(f"完整数据评分 {full_score}，截取后评分 {analyzer.calculate_score(truncated)}")
+
+
+if __name__ == '__main__':
+    test_batch_matches_single()
+    test_wide_panel_latest_only()
+    test_score_batch_matches_single()
+    test_score_upper_bound()
+    test_score_cache_fingerprint()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+测试缓存命中时返回的DataFrame与缓存共用内存，调用方修改后缓存中的数据不变
+"""
+
+import numpy as np
+import pandas as pd
+
+import stock_analyzer  # noqa: F401  导入时开启写时复制
+from memory_cache import BoundedCache, copy_on_write_enabled, share_frame
+
+
+def test_cache_hit_shares_memory():
+    """测试命中返回的DataFrame与缓存共用底层数组，不做深拷贝"""
+    print(f"=== 测试缓存共用内存（pandas {pd.__version__}） ===")
+    assert copy_on_write_enabled(), "导入 stock_analyzer 后应启用写时复制"
+
+    cache = BoundedCache()
+    df = pd.DataFrame({'close': np.linspace(10, 20, 1000), 'volume': np.arange(1000, dtype=float)})
+    cache['600519_A_None_None_price'] = df
+
+    hit = share_frame(cache.get('600519_A_None_None_price'))
+    assert np.shares_memory(hit['close'].to_numpy(), df['close'].to_numpy())
+
+    # 调用方修改或新增列时只复制被修改的列，缓存中的数据保持不变
+    hit['close'] = hit['close'] * 2
+    hit.loc[0, 'volume'] = -1.0
+    hit['MA5'] = hit['close'].rolling(5).mean()
+    cached = cache.get('600519_A_None_None_price')
+    assert cached['close'].iloc[-1] == 20.0 and cached['volume'].iloc[0] == 0.0
+    assert 'MA5' not in cached.columns
+    print("命中返回的DataFrame与缓存共用内存，修改后缓存不变")
+
+
+if __name__ == '__main__':
+    test_cache_hit_shares_memory()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+测试分钟K线环形缓冲区、缓冲区淘汰、分钟级指标计算和盘中监控
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import stock_analyzer
+from minute_bar_store import MinuteBarRing, MinuteBarStore, to_bar_array, BAR_DTYPE
+from stock_analyzer import StockAnalyzer
+from stock_config import MINUTE_BAR_CONFIG
+
+
+def make_bars(start='2026-10-16 09:31', count=100, freq='5min', seed=5):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=count, freq=freq)
+    close = 20 + np.cumsum(rng.normal(0, 0.05, count))
+    rows = [(t, c + 0.01, c, c + 0.05, c - 0.05, float(v), float(v) * c)
+            for t, c, v in zip(times, close, rng.integers(100, 10000, count))]
+    return to_bar_array(rows)
+
+
+def test_ring_wraparound():
+    """测试缓冲区写满后覆盖最旧的K线"""
+    print("=== 测试环形缓冲区 ===")
+    bars = make_bars(count=130)
+    ring = MinuteBarRing(50)
+    ring.extend(bars[:30])
+    ring.extend(bars[30:75])
+    for bar in bars[75:]:
+        ring.append(bar)
+
+    assert len(ring) == 50
+    assert ring.nbytes == 50 * BAR_DTYPE.itemsize
+    np.testing.assert_array_equal(ring.to_array(), bars[-50:])
+
+    # 时间相同的K线覆盖最新一根，早于最新K线的数据被忽略
+    updated = bars[-1:].copy()
+    updated['close'] = 99.0
+    assert ring.extend(updated) == 0
+    assert ring.extend(bars[:10]) == 0
+    assert ring.to_array()[-1]['close'] == 99.0
+    assert len(ring) == 50
+    print(f"缓冲区长度 {len(ring)}，占用 {ring.nbytes} 字节")
+
+
+def test_intraday_indicators():
+    """测试分钟K线可直接用于 calculate_indicators 和批量评分"""
+    print("\n=== 测试分钟级指标和评分 ===")
+    analyzer = StockAnalyzer()
+    store = MinuteBarStore()
+    for i, code in enumerate(['600519', '000001']):
+        store.ingest(code, 'A', 5, make_bars(count=200, seed=i))
+
+    frame = store.get_frame('600519', 'A', 5)
+    df = analyzer.calculate_indicators(frame.copy())
+    assert len(df) == 200 and not np.isnan(df['MA60'].iloc[-1])
+
+    panel = pd.concat([store.get_frame(code, 'A', 5).assign(stock_code=code) for code in ['600519', '000001']],
+                      ignore_index=True)
+    latest = analyzer.calculate_indicators_batch(panel, latest_only=True)
+    scores = analyzer.calculate_score_batch(latest, 'A')
+    expected = analyzer.calculate_score(df, 'A')
+    assert scores.loc[latest['stock_code'] == '600519', 'total'].iloc[0] == expected
+    print(f"600519 5分钟评分: {expected}")
+
+    try:
+        store.ring('600519', 'A', 3)
+        assert False, "不支持的周期应报错"
+    except ValueError:
+        pass
+
+
+def test_store_eviction():
+    """测试缓冲区数量超过上限或长时间未访问时被淘汰"""
+    print("\n=== 测试缓冲区淘汰 ===")
+    store = MinuteBarStore(dict(MINUTE_BAR_CONFIG, max_buffers=3, idle_ttl=None))
+    for code in ['600519', '000001', '300750']:
+        store.ingest(code, 'A', 5, make_bars(count=10))
+    store.get_frame('600519', 'A', 5)
+    store.ingest('688981', 'A', 5, make_bars(count=10))
+    assert store.stats()['buffers'] == 3 and store.stats()['evicted'] == 1
+    assert len(store.get_frame('600519', 'A', 5)) == 10
+    assert store.get_frame('000001', 'A', 5).empty, "最近最少使用的缓冲区应被淘汰"
+
+    idle = MinuteBarStore(dict(MINUTE_BAR_CONFIG, idle_ttl=0.05))
+    idle.ingest('600519', 'A', 5, make_bars(count=10))
+    time.sleep(0.1)
+    idle.ingest('000001', 'A', 5, make_bars(count=10))
+    assert idle.stats()['buffers'] == 1
+    print(f"淘汰后统计: {store.stats()}")
+
+
+def test_scan_intraday_limits():
+    """测试盘中监控限制股票数量，刷新超时的股票使用已有数据而不阻塞请求"""
+    print("\n=== 测试盘中监控超时 ===")
+    analyzer = StockAnalyzer()
+    store = MinuteBarStore()
+    store.ingest('600519', 'A', 5, make_bars(count=200))
+    store.ingest('000001', 'A', 5, make_bars(count=200, seed=1))
+
+    def fetch(stock_code, market_type, period, limit):
+        if stock_code == '000001':
+            time.sleep(3)
+        return make_bars(count=5, start='2026-10-19 09:31')
+
+    original = (stock_analyzer.minute_bar_store, stock_analyzer.fetch_minute_bars, dict(MINUTE_BAR_CONFIG))
+    stock_analyzer.minute_bar_store, stock_analyzer.fetch_minute_bars = store, fetch
+    MINUTE_BAR_CONFIG.update(refresh_timeout=0.5, max_scan_stocks=2)
+    try:
+        start = time.time()
+        results = analyzer.scan_intraday(['600519', '000001'], 'A', 5)
+        assert time.time() - start < 2, "刷新超时的股票不应阻塞请求"
+        assert {r['stock_code'] for r in results} == {'600519', '000001'}
+        try:
+            analyzer.scan_intraday(['600519', '000001', '300750'], 'A', 5)
+            assert False, "超过股票数量上限应报错"
+        except ValueError:
+            pass
+    finally:
+        stock_analyzer.minute_bar_store, stock_analyzer.fetch_minute_bars = original[:2]
+        MINUTE_BAR_CONFIG.clear()
+        MINUTE_BAR_CONFIG.update(original[2])
+    print(f"耗时 {time.time() - start:.2f} 秒，返回 {len(results)} 只")
+
+
+if __name__ == '__main__':
+    test_ring_wraparound()
+    test_intraday_indicators()
+    test_store_eviction()
+    test_scan_intraday_limits()
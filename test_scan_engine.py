@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+测试市场扫描引擎的前K名堆、阶段结果回调、分批提交、分块预取和指数分析覆盖全部成分股
+"""
+
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import index_industry_analyzer
+from index_industry_analyzer import IndexIndustryAnalyzer
+from scan_engine import ScanEngine, TopK
+from stock_config import SCAN_CONFIG
+
+
+class FakeAnalyzer:
+    """按股票代码返回固定评分的分析器，不访问网络"""
+
+    def __init__(self, scores, delay=0.01):
+        self.scores = scores
+        self.delay = delay
+        self.prefetched = []
+
+    def prefetch_stock_data(self, stock_list, market_type='A'):
+        self.prefetched.append(len(stock_list))
+
+    def score_upper_bounds(self, stock_list, market_type='A'):
+        return {}
+
+    def quick_analyze_stock(self, stock_code, market_type='A'):
+        time.sleep(self.delay)
+        return {'stock_code': stock_code, 'score': self.scores[stock_code]}
+
+
+def test_top_k_matches_sort():
+    """测试前K名与完整排序后截取的结果一致（评分相同时先加入的在前）"""
+    print("=== 测试前K名堆 ===")
+    rng = random.Random(7)
+    reports = [{'stock_code': str(i), 'score': rng.randint(50, 100)} for i in range(500)]
+
+    top = TopK(20)
+    for report in reports:
+        top.push(report)
+    expected = sorted(reports, key=lambda x: x['score'], reverse=True)[:20]
+    assert top.sorted() == expected
+    assert len(top) == 20 and top.found == 500
+
+    unbounded = TopK(0)
+    for report in reports:
+        unbounded.push(report)
+    assert unbounded.sorted() == sorted(reports, key=lambda x: x['score'], reverse=True)
+
+    try:
+        TopK(-1)
+        assert False, "k为负数时应报错"
+    except ValueError:
+        pass
+
+
+def test_scan_partial_results():
+    """测试扫描过程中发布阶段结果，最终结果只保留前K名"""
+    print("=== 测试扫描阶段结果 ===")
+    rng = random.Random(11)
+    stock_list = [f"{600000 + i}" for i in range(200)]
+    scores = {code: rng.randint(30, 100) for code in stock_list}
+    partials = []
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        engine = ScanEngine(FakeAnalyzer(scores), executor=executor)
+        results = engine.scan(stock_list, min_score=60, top_k=10,
+                              partial_callback=lambda results, found: partials.append((results, found)))
+
+    qualified = sorted((c for c in stock_list if scores[c] >= 60), key=lambda c: scores[c], reverse=True)
+    assert [r['score'] for r in results] == [scores[c] for c in qualified[:10]]
+    assert partials, "扫描过程中应发布阶段结果"
+    assert all(len(p) <= 10 for p, _ in partials)
+    assert all(p == sorted(p, key=lambda x: x['score'], reverse=True) for p, _ in partials)
+    print(f"阶段结果 {len(partials)} 次，符合条件 {len(qualified)} 只，返回 {len(results)} 只")
+
+
+def test_scan_bounded_submission():
+    """测试扫描只向线程池提交有限数量的任务，其他调用方不必排在整个扫描之后，重复的股票只分析一次"""
+    print("=== 测试分批提交 ===")
+    stock_list = [f"{600000 + i}" for i in range(300)]
+    window = SCAN_CONFIG.get('submit_window') or 2 * SCAN_CONFIG['max_workers']
+    state = {'outstanding': 0, 'peak': 0, 'lock': threading.Lock()}
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            with state['lock']:
+                state['outstanding'] += 1
+                state['peak'] = max(state['peak'], state['outstanding'])
+            future = super().submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda f: state.update(outstanding=state['outstanding'] - 1))
+            return future
+
+    with CountingExecutor(max_workers=4) as executor:
+        engine = ScanEngine(FakeAnalyzer({code: 70 for code in stock_list}, delay=0.002), executor=executor)
+        # 重复的股票只分析一次
+        results = engine.scan(stock_list + stock_list[:20], min_score=60, top_k=0)
+
+    assert sorted(r['stock_code'] for r in results) == sorted(stock_list)
+    assert state['peak'] <= window, f"同时提交了 {state['peak']} 个任务，超过窗口 {window}"
+    print(f"300只股票，同时提交的任务最多 {state['peak']} 个")
+
+
+def test_scan_chunked_prefetch_cancel():
+    """测试按块预取K线，取消后不再预取剩余的块"""
+    print("=== 测试分块预取 ===")
+    stock_list = [f"{600000 + i}" for i in range(1000)]
+    analyzer = FakeAnalyzer({code: 70 for code in stock_list}, delay=0.002)
+    chunk_size = SCAN_CONFIG['prefetch_chunk']
+    progress = []
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        engine = ScanEngine(analyzer, executor=executor)
+        engine.scan(stock_list, min_score=60, top_k=0,
+                    progress_callback=lambda processed, total, found: progress.append(processed),
+                    should_stop=lambda: len(progress) >= 5)
+
+    assert analyzer.prefetched and all(n <= chunk_size for n in analyzer.prefetched)
+    assert sum(analyzer.prefetched) < len(stock_list), "取消后不应继续预取"
+    print(f"每块 {chunk_size} 只，取消前预取了 {len(analyzer.prefetched)} 块")
+
+
+def test_index_analysis_covers_all_constituents():
+    """测试指数分析使用全部成分股的结果，不受扫描任务的前K名限制"""
+    print("=== 测试指数分析覆盖全部成分股 ===")
+    count = SCAN_CONFIG['top_k'] + 50
+    codes = [f"{600000 + i}" for i in range(count)]
+    constituents = pd.DataFrame({'成分券代码': codes, '权重(%)': [1.0] * count})
+    original = index_industry_analyzer.ak.index_stock_cons_weight_csindex
+    index_industry_analyzer.ak.index_stock_cons_weight_csindex = lambda symbol: constituents
+    try:
+        analyzer = IndexIndustryAnalyzer(FakeAnalyzer({code: i % 100 for i, code in enumerate(codes)}, delay=0))
+        analyzer.data_cache.pop('index_000852')
+        result = analyzer.analyze_index('000852', limit=None)
+        analyzer.data_cache.pop('index_000852')
+    finally:
+        index_industry_analyzer.ak.index_stock_cons_weight_csindex = original
+
+    assert result['stock_count'] == count, f"只统计了 {result['stock_count']}/{count} 只成分股"
+    expected = sum(i % 100 for i in range(count)) / count
+    assert abs(result['score'] - round(expected, 2)) < 1e-9
+    print(f"{count} 只成分股，指数评分 {result['score']}")
+
+
+if __name__ == '__main__':
+    test_top_k_matches_sort()
+    test_scan_partial_results()
+    test_scan_bounded_submission()
+    test_scan_chunked_prefetch_cancel()
+    test_index_analysis_covers_all_constituents()
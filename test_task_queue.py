@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+测试持久化任务队列：优先级、去重、并发上限、取消和工作进程执行
+"""
+
+import os
+import time
+import tempfile
+import threading
+
+import numpy as np
+from stock_config import TASK_QUEUE_CONFIG
+from task_queue import TaskQueue, TaskWatcher, TASK_COMPLETED, TASK_FAILED
+from task_worker import TaskWorker
+
+
+def make_queue(tmpdir, **overrides):
+    config = dict(TASK_QUEUE_CONFIG)
+    config['concurrency'] = {'stock_analysis': 2, 'market_scan': 1}
+    config['poll_interval'] = 0.05
+    config.update(overrides)
+    return TaskQueue(os.path.join(tmpdir, 'task_queue.db'), config)
+
+
+def test_priority_and_limits():
+    """测试按优先级领取、相同键复用、并发上限和取消"""
+    print("=== 测试任务队列 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = make_queue(tmpdir)
+        low, _ = queue.submit('stock_analysis', {'stock_code': '600519'}, key='600519_A', priority=0)
+        high, _ = queue.submit('stock_analysis', {'stock_code': '000001'}, key='000001_A', priority=10)
+        same, is_new = queue.submit('stock_analysis', {'stock_code': '600519'}, key='600519_A')
+        assert not is_new and same['id'] == low['id']
+
+        assert queue.claim('stock_analysis', 'w1')['id'] == high['id']
+        assert queue.claim('stock_analysis', 'w1')['id'] == low['id']
+        queue.submit('stock_analysis', {'stock_code': '000002'}, key='000002_A')
+        assert queue.claim('stock_analysis', 'w1') is None, "达到并发上限时不应领取"
+
+        # 结果中的NumPy类型可以序列化
+        queue.finish(high['id'], result={'score': np.float64(81.5), 'values': np.arange(3)})
+        task = queue.get(high['id'], 'stock_analysis')
+        assert task['status'] == TASK_COMPLETED
+        assert task['result'] == {'score': 81.5, 'values': [0, 1, 2]}
+        assert queue.get(high['id'], 'market_scan') is None
+
+        # 取消后工作进程写回的结果被忽略
+        assert queue.cancel(low['id']) is True
+        assert queue.is_cancelled(low['id'])
+        queue.finish(low['id'], result={'score': 50})
+        assert queue.get(low['id'])['status'] == TASK_FAILED
+        assert queue.cancel(high['id']) is False
+        print(f"任务统计: {queue.stats()}")
+
+
+def test_stale_requeue():
+    """测试长时间未更新的执行中任务重新放回队列"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = make_queue(tmpdir, stale_timeout=-1)
+        task, _ = queue.submit('market_scan', {'stock_list': ['600519']})
+        assert queue.claim('market_scan', 'w1')['id'] == task['id']
+        assert queue.claim('market_scan', 'w2')['id'] == task['id']
+
+
+def test_worker_concurrency():
+    """测试工作进程按类型限制并发并完成所有任务"""
+    print("=== 测试任务工作进程 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = make_queue(tmpdir)
+        worker = TaskWorker(queue, queue.config)
+        lock = threading.Lock()
+        counters = {'running': 0, 'peak': 0}
+
+        def handler(task):
+            with lock:
+                counters['running'] += 1
+                counters['peak'] = max(counters['peak'], counters['running'])
+            time.sleep(0.1)
+            with lock:
+                counters['running'] -= 1
+            return {'stock_code': task['params']['stock_code']}
+
+        worker.handlers = {'stock_analysis': handler}
+        ids = [queue.submit('stock_analysis', {'stock_code': str(i)})[0]['id'] for i in range(6)]
+        worker.start()
+        try:
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                if all(queue.get(task_id)['status'] == TASK_COMPLETED for task_id in ids):
+                    break
+                time.sleep(0.05)
+        finally:
+            worker.stop()
+
+        assert all(queue.get(task_id)['status'] == TASK_COMPLETED for task_id in ids)
+        assert counters['peak'] == 2
+        print(f"最大并发: {counters['peak']}")
+
+
+def test_watcher_wakeup():
+    """测试等待者在任务更新后被唤醒，超时返回未变化的任务"""
+    print("=== 测试任务变化通知 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        queue = make_queue(tmpdir)
+        watcher = TaskWatcher(queue, interval=0.05)
+        task, _ = queue.submit('market_scan', {'stock_list': ['600519']})
+
+        unchanged = watcher.wait(task['id'], task['version'], timeout=0.2)
+        assert unchanged['version'] == task['version']
+
+        def run():
+            time.sleep(0.2)
+            claimed = queue.claim('market_scan', 'w1')
+            queue.update(claimed['id'], progress=50)
+            time.sleep(0.2)
+            queue.finish(claimed['id'], result=[{'stock_code': '600519', 'score': 75}])
+
+        threading.Thread(target=run, daemon=True).start()
+        start = time.time()
+        updated = watcher.wait(task['id'], task['version'], timeout=5)
+        assert updated['version'] > task['version']
+        done = watcher.wait_for_completion(task['id'], timeout=5)
+        assert done['status'] == TASK_COMPLETED and done['result'][0]['score'] == 75
+        print(f"任务完成通知耗时: {time.time() - start:.2f}秒")
+
+
+if __name__ == '__main__':
+    test_priority_and_limits()
+    test_stale_requeue()
+    test_worker_concurrency()
+    test_watcher_wakeup()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+测试共享视图缓存：多个worker共享Flask-Caching缓存、并发未命中只执行一次视图、二级缓存序列化
+"""
+
+import os
+import time
+import fnmatch
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+from flask import Flask, jsonify
+from flask_caching import Cache
+
+from cache_service import CacheService, PayloadSerializer, RedisBackend
+from stock_config import DATA_CACHE_CONFIG
+from view_cache import SharedViewCache
+
+
+class LocalRedis:
+    """进程内的Redis替身，只实现 RedisBackend 用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self._alive(key)
+            return entry[0] if entry else None
+
+    def pttl(self, key):
+        with self.lock:
+            entry = self._alive(key)
+            if entry is None:
+                return -2
+            return -1 if entry[1] is None else int((entry[1] - time.time()) * 1000)
+
+    def set(self, key, value, px=None, nx=False):
+        with self.lock:
+            if nx and self._alive(key) is not None:
+                return None
+            self.data[key] = (value, time.time() + px / 1000.0 if px else None)
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def scan_iter(self, match='*'):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    def pipeline(self):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+
+def make_worker(service, counter):
+    """一个Flask应用对应一个gunicorn worker，各自有独立的一级缓存"""
+    app = Flask(__name__)
+    cache = Cache(config={'CACHE_TYPE': 'view_cache.SharedViewCache', 'CACHE_DEFAULT_TIMEOUT': 300})
+    cache.init_app(app)
+    app.extensions['cache'][cache].service = service
+
+    @app.route('/data')
+    @cache.cached(timeout=300, query_string=True)
+    def data():
+        with counter['lock']:
+            counter['calls'] += 1
+        time.sleep(0.3)
+        return jsonify({'values': list(range(100))})
+
+    return app.test_client()
+
+
+def test_shared_across_workers():
+    """测试两个worker共享视图缓存，并发未命中时只执行一次视图"""
+    print("=== 测试共享视图缓存 ===")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = dict(DATA_CACHE_CONFIG, backend='disk', disk_path=os.path.join(tmpdir, 'cache.db'),
+                      fill_poll_interval=0.02)
+        counter = {'calls': 0, 'lock': threading.Lock()}
+        workers = [make_worker(CacheService(config), counter) for _ in range(2)]
+
+        statuses = []
+        threads = [threading.Thread(target=lambda c=workers[i % 2]: statuses.append(c.get('/data').status_code))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert statuses == [200] * 8
+        assert counter['calls'] == 1, f"视图执行了 {counter['calls']} 次"
+
+        # 新的worker（一级缓存为空）从二级缓存命中
+        fresh = make_worker(CacheService(config), counter)
+        assert fresh.get('/data').get_json()['values'][-1] == 99
+        assert counter['calls'] == 1
+        print(f"8个并发请求、3个worker，视图执行 {counter['calls']} 次")
+
+
+def test_redis_backend_serialization():
+    """测试Redis后端的DataFrame序列化、压缩和加载锁"""
+    print("=== 测试Redis后端 ===")
+    df = pd.DataFrame({'close': np.linspace(10, 20, 2000), 'volume': np.arange(2000, dtype=float)})
+    serializer = PayloadSerializer(compress_min_bytes=1024)
+    data = serializer.dumps(df)
+    assert data[:1] == b'Z'
+    pd.testing.assert_frame_equal(serializer.loads(data), df)
+
+    backend = RedisBackend(None, 'test:', serializer=serializer, client=LocalRedis())
+    backend.set('stock:600519_price', df, ttl=60)
+    value, remaining = backend.get('stock:600519_price')
+    pd.testing.assert_frame_equal(value, df)
+    assert 0 < remaining <= 60
+    assert backend.add('fill-lock:x', 'a', 5) and not backend.add('fill-lock:x', 'b', 5)
+    backend.clear('stock:')
+    assert backend.get('stock:600519_price') is None
+
+
+if __name__ == '__main__':
+    test_shared_across_workers()
+    test_redis_backend_serialization()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Flask-Caching 视图缓存后端
+缓存数据存放在统一缓存服务（cache_service.py）的 view 命名空间：
+本地内存一级缓存 + 配置的Redis/磁盘二级缓存，多个gunicorn worker共享同一份视图缓存；
+缓存未命中时只有一个请求执行视图，同一时间的其他请求（包括其他worker）等待其结果
+
+使用方式:
+    cache = Cache(config={'CACHE_TYPE': 'view_cache.SharedViewCache'})
+"""
+# view_cache.py
+import pickle
+import threading
+
+from flask_caching.backends.base import BaseCache
+
+from cache_service import cache_service
+
+_MISSING = object()
+
+
+class SharedViewCache(BaseCache):
+    """
+    基于统一缓存服务的 Flask-Caching 后端
+
+    参数:
+        default_timeout: 默认过期时间（秒），0表示使用命名空间的默认过期时间
+        service: CacheService 实例，默认使用全局 cache_service
+        namespace: 缓存命名空间
+    """
+
+    def __init__(self, default_timeout=300, ignore_delete_many_errors=False, service=None, namespace='view'):
+        super().__init__(default_timeout=default_timeout, ignore_delete_many_errors=ignore_delete_many_errors)
+        self.service = service or cache_service
+        self.namespace = namespace
+        self._held = threading.local()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        cache = cls(*args, **kwargs)
+        # 视图出错或返回不缓存的响应时不会调用set，请求结束时释放未释放的加载权
+        app.teardown_request(cache.release_pending)
+        return cache
+
+    def _held_keys(self):
+        keys = getattr(self._held, 'keys', None)
+        if keys is None:
+            keys = self._held.keys = set()
+        return keys
+
+    def get(self, key):
+        # 缓存中存放pickle后的数据：Flask的响应对象会在 after_request 中被修改（压缩、304），
+        # 每次命中都返回新的对象，与 SimpleCache 的行为一致
+        data = self.service.get(self.namespace, key, _MISSING)
+        if data is _MISSING:
+            if self.service.acquire_fill(self.namespace, key):
+                # 由当前请求执行视图，set 时释放
+                self._held_keys().add(key)
+                return None
+            data = self.service.wait_fill(self.namespace, key, _MISSING)
+            if data is _MISSING:
+                return None
+        return pickle.loads(data)
+
+    def set(self, key, value, timeout=None):
+        timeout = self.default_timeout if timeout is None else timeout
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.service.set(self.namespace, key, data, ttl=timeout if timeout and timeout > 0 else None)
+        self._release(key)
+        return True
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def has(self, key):
+        return self.service.get(self.namespace, key, _MISSING) is not _MISSING
+
+    def delete(self, key):
+        self.service.delete(self.namespace, key)
+        return True
+
+    def clear(self):
+        self.service.clear(self.namespace)
+        return True
+
+    def _release(self, key):
+        keys = self._held_keys()
+        if key in keys:
+            keys.discard(key)
+            self.service.release_fill(self.namespace, key)
+
+    def release_pending(self, exc=None):
+        """释放当前线程持有的所有加载权（teardown_request）"""
+        for key in list(self._held_keys()):
+            self._release(key)
@@ -11,7 +11,7 @@
 
 import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, stream_with_context
 from stock_analyzer import StockAnalyzer
 from us_stock_service import USStockService
 import threading
@@ -27,7 +27,8 @@ from flask_caching import Cache
 import threading
 import sys
 from flask_swagger_ui import get_swaggerui_blueprint
-from database import get_session, StockInfo, AnalysisResult, Portfolio, USE_DATABASE
+from database import get_session, StockInfo, AnalysisResult, Portfolio, USE_DATABASE, save_analysis_result_to_db
+from sqlalchemy import func
 from dotenv import load_dotenv
 from industry_analyzer import IndustryAnalyzer
 from fundamental_analyzer import FundamentalAnalyzer
@@ -38,6 +39,13 @@ from risk_monitor import RiskMonitor
 from index_industry_analyzer import IndexIndustryAnalyzer
 from news_fetcher import news_fetcher, start_news_scheduler
 from database import  init_db
+from cache_service import cache_service
+from scan_engine import ScanEngine
+import fast_json
+import http_cache
+from stock_config import TASK_QUEUE_CONFIG, EOD_CONFIG
+from eod_analytics import eod_store
+from task_queue import task_queue, task_watcher, TASK_PENDING, TASK_RUNNING, TASK_COMPLETED, TASK_FAILED
 # 加载环境变量
 load_dotenv()
 store={}
@@ -62,22 +70,17 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 analyzer = StockAnalyzer()
 us_stock_service = USStockService()
 
-# 配置缓存
+# 配置缓存：视图缓存存放在统一缓存服务中（本地内存一级缓存 + 二级缓存），
+# 设置 USE_REDIS_CACHE/REDIS_URL（或 CACHE_BACKEND）后多个worker共享，并发未命中时只执行一次视图
 cache_config = {
-    'CACHE_TYPE': 'SimpleCache',
+    'CACHE_TYPE': 'view_cache.SharedViewCache',
     'CACHE_DEFAULT_TIMEOUT': 300
 }
 
-# 如果配置了Redis，使用Redis作为缓存后端
-if os.getenv('USE_REDIS_CACHE', 'False').lower() == 'true' and os.getenv('REDIS_URL'):
-    cache_config = {
-        'CACHE_TYPE': 'RedisCache',
-        'CACHE_REDIS_URL': os.getenv('REDIS_URL'),
-        'CACHE_DEFAULT_TIMEOUT': 300
-    }
-
-cache = Cache(config={'CACHE_TYPE': 'SimpleCache'})
+cache = Cache(config=cache_config)
 cache.init_app(app)
+# API响应的ETag/304和压缩
+http_cache.init_app(app)
 
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
@@ -100,6 +103,7 @@ scenario_predictor = ScenarioPredictor(analyzer)
 stock_qa = StockQA(analyzer)
 risk_monitor = RiskMonitor(analyzer)
 index_industry_analyzer = IndexIndustryAnalyzer(analyzer)
+scan_engine = ScanEngine(analyzer)
 industry_analyzer = IndustryAnalyzer()
 
 start_news_scheduler()
@@ -124,284 +128,9 @@ handler.setFormatter(logging.Formatter(
 ))
 app.logger.addHandler(handler)
 
-# 扩展任务管理系统以支持不同类型的任务
-task_types = {
-    'scan': 'market_scan',  # 市场扫描任务
-    'analysis': 'stock_analysis'  # 个股分析任务
-}
-
-# 任务数据存储
-tasks = {
-    'market_scan': {},  # 原来的scan_tasks
-    'stock_analysis': {}  # 新的个股分析任务
-}
-
-
-def get_task_store(task_type):
-    """获取指定类型的任务存储"""
-    return tasks.get(task_type, {})
-
-
-def generate_task_key(task_type, **params):
-    """生成任务键"""
-    if task_type == 'stock_analysis':
-        # 对于个股分析，使用股票代码和市场类型作为键
-        return f"{params.get('stock_code')}_{params.get('market_type', 'A')}"
-    return None  # 其他任务类型不使用预生成的键
-
-
-def get_or_create_task(task_type, **params):
-    """获取或创建任务"""
-    store = get_task_store(task_type)
-    task_key = generate_task_key(task_type, **params)
-
-    # 检查是否有现有任务
-    if task_key and task_key in store:
-        task = store[task_key]
-        # 检查任务是否仍然有效
-        if task['status'] in [TASK_PENDING, TASK_RUNNING]:
-            return task['id'], task, False
-        if task['status'] == TASK_COMPLETED and 'result' in task:
-            # 任务已完成且有结果，重用它
-            return task['id'], task, False
-
-    # 创建新任务
-    task_id = generate_task_id()
-    task = {
-        'id': task_id,
-        'key': task_key,  # 存储任务键以便以后查找
-        'type': task_type,
-        'status': TASK_PENDING,
-        'progress': 0,
-        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'params': params
-    }
-
-    with task_lock:
-        if task_key:
-            store[task_key] = task
-        store[task_id] = task
-
-    return task_id, task, True
-
-
-# 添加到web_server.py顶部
-# 任务管理系统
-scan_tasks = {}  # 存储扫描任务的状态和结果
-task_lock = threading.Lock()  # 用于线程安全操作
-
-# 任务状态常量
-TASK_PENDING = 'pending'
-TASK_RUNNING = 'running'
-TASK_COMPLETED = 'completed'
-TASK_FAILED = 'failed'
-
-
-def generate_task_id():
-    """生成唯一的任务ID"""
-    import uuid
-    return str(uuid.uuid4())
-
-
-def start_market_scan_task_status(task_id, status, progress=None, result=None, error=None):
-    """更新任务状态 - 保持原有签名"""
-    with task_lock:
-        if task_id in scan_tasks:
-            task = scan_tasks[task_id]
-            task['status'] = status
-            if progress is not None:
-                task['progress'] = progress
-            if result is not None:
-                task['result'] = result
-            if error is not None:
-                task['error'] = error
-            task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-
-def update_task_status(task_type, task_id, status, progress=None, result=None, error=None):
-    """更新任务状态"""
-    store = get_task_store(task_type)
-    with task_lock:
-        if task_id in store:
-            task = store[task_id]
-            task['status'] = status
-            if progress is not None:
-                task['progress'] = progress
-            if result is not None:
-                task['result'] = result
-            if error is not None:
-                task['error'] = error
-            task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-            # 更新键索引的任务
-            if 'key' in task and task['key'] in store:
-                store[task['key']] = task
-
-
-analysis_tasks = {}
-
-
-def get_or_create_analysis_task(stock_code, market_type='A'):
-    """获取或创建个股分析任务"""
-    # 创建一个键，用于查找现有任务
-    task_key = f"{stock_code}_{market_type}"
-
-    with task_lock:
-        # 检查是否有现有任务
-        for task_id, task in analysis_tasks.items():
-            if task.get('key') == task_key:
-                # 检查任务是否仍然有效
-                if task['status'] in [TASK_PENDING, TASK_RUNNING]:
-                    return task_id, task, False
-                if task['status'] == TASK_COMPLETED and 'result' in task:
-                    # 任务已完成且有结果，重用它
-                    return task_id, task, False
-
-        # 创建新任务
-        task_id = generate_task_id()
-        task = {
-            'id': task_id,
-            'key': task_key,
-            'status': TASK_PENDING,
-            'progress': 0,
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'params': {
-                'stock_code': stock_code,
-                'market_type': market_type
-            }
-        }
-
-        analysis_tasks[task_id] = task
-
-        return task_id, task, True
-
-
-def update_analysis_task(task_id, status, progress=None, result=None, error=None):
-    """更新个股分析任务状态"""
-    with task_lock:
-        if task_id in analysis_tasks:
-            task = analysis_tasks[task_id]
-            task['status'] = status
-            if progress is not None:
-                task['progress'] = progress
-            if result is not None:
-                task['result'] = result
-            if error is not None:
-                task['error'] = error
-            task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-
-# 定义自定义JSON编码器
-
-
-# 在web_server.py中，更新convert_numpy_types函数以处理NaN值
-
-# 将NumPy类型转换为Python原生类型的函数
-def convert_numpy_types(obj):
-    """递归地将字典和列表中的NumPy类型转换为Python原生类型"""
-    try:
-        import numpy as np
-        import math
-
-        if isinstance(obj, dict):
-            return {key: convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            # Handle NaN and Infinity specifically
-            if np.isnan(obj):
-                return None
-            elif np.isinf(obj):
-                return None if obj < 0 else 1e308  # Use a very large number for +Infinity
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, np.bool_):
-            return bool(obj)
-        # Handle Python's own float NaN and Infinity
-        elif isinstance(obj, float):
-            if math.isnan(obj):
-                return None
-            elif math.isinf(obj):
-                return None
-            return obj
-        # 添加对date和datetime类型的处理
-        elif isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        else:
-            return obj
-    except ImportError:
-        # 如果没有安装numpy，但需要处理date和datetime
-        import math
-        if isinstance(obj, dict):
-            return {key: convert_numpy_types(value) for key, value in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_numpy_types(item) for item in obj]
-        elif isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        # Handle Python's own float NaN and Infinity
-        elif isinstance(obj, float):
-            if math.isnan(obj):
-                return None
-            elif math.isinf(obj):
-                return None
-            return obj
-        return obj
-
-
-# 同样更新 NumpyJSONEncoder 类
-class NumpyJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        # For NumPy data types
-        try:
-            import numpy as np
-            import math
-            if isinstance(obj, np.integer):
-                return int(obj)
-            elif isinstance(obj, np.floating):
-                # Handle NaN and Infinity specifically
-                if np.isnan(obj):
-                    return None
-                elif np.isinf(obj):
-                    return None
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, np.bool_):
-                return bool(obj)
-            # Handle Python's own float NaN and Infinity
-            elif isinstance(obj, float):
-                if math.isnan(obj):
-                    return None
-                elif math.isinf(obj):
-                    return None
-                return obj
-        except ImportError:
-            # Handle Python's own float NaN and Infinity if numpy is not available
-            import math
-            if isinstance(obj, float):
-                if math.isnan(obj):
-                    return None
-                elif math.isinf(obj):
-                    return None
-
-        # 添加对date和datetime类型的处理
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-
-        return super(NumpyJSONEncoder, self).default(obj)
-
-
-# 使用我们的编码器的自定义 jsonify 函数
+# 自定义 jsonify：NumPy类型、NaN/Inf、日期和DataFrame由 fast_json 直接编码
 def custom_jsonify(data):
-    return app.response_class(
-        json.dumps(convert_numpy_types(data), cls=NumpyJSONEncoder),
-        mimetype='application/json'
-    )
+    return app.response_class(fast_json.dumps(data), mimetype='application/json')
 
 
 # 保持API兼容的路由
@@ -577,7 +306,7 @@ def make_cache_key_with_stock():
 
 @app.route('/api/start_stock_analysis', methods=['POST'])
 def start_stock_analysis():
-    """启动个股分析任务"""
+    """启动个股分析任务（提交到任务队列，由工作进程执行）"""
     try:
         data = request.json
         stock_code = data.get('stock_code')
@@ -588,12 +317,9 @@ def start_stock_analysis():
 
         app.logger.info(f"准备分析股票: {stock_code}")
 
-        # 获取或创建任务
-        task_id, task, is_new = get_or_create_task(
-            'stock_analysis',
-            stock_code=stock_code,
-            market_type=market_type
-        )
+        # 获取或创建任务，相同股票未结束或已完成的任务直接复用
+        task, is_new = submit_analysis_task(stock_code, market_type, data.get('priority'))
+        task_id = task['id']
 
         # 如果是已完成的任务，直接返回结果
         if task['status'] == TASK_COMPLETED and 'result' in task:
@@ -606,45 +332,15 @@ def start_stock_analysis():
                 except Exception as db_error:
                     app.logger.error(f"保存缓存结果到数据库失败: {str(db_error)}")
             
-            return jsonify({
+            return custom_jsonify({
                 'task_id': task_id,
                 'status': task['status'],
                 'result': task['result']
             })
 
-        # 如果是新创建的任务，启动后台处理
         if is_new:
             app.logger.info(f"创建新的分析任务: {task_id}")
 
-            # 启动后台线程执行分析
-            def run_analysis():
-                # try:
-                update_task_status('stock_analysis', task_id, TASK_RUNNING, progress=10)
-
-                # 执行分析
-                result = analyzer.perform_enhanced_analysis(stock_code, market_type)
-                
-                # 保存分析结果到数据库
-                if USE_DATABASE:
-                    try:
-                        save_analysis_result_to_db(stock_code, market_type, result)
-                    except Exception as db_error:
-                        app.logger.error(f"保存分析结果到数据库失败: {str(db_error)}")
-
-                # 更新任务状态为完成
-                update_task_status('stock_analysis', task_id, TASK_COMPLETED, progress=100, result=result)
-                app.logger.info(f"分析任务 {task_id} 完成")
-
-                # except Exception as e:
-                #     app.logger.error(f"分析任务 {task_id} 失败: {str(e)}")
-                #     app.logger.error(traceback.format_exc())
-                #     update_task_status('stock_analysis', task_id, TASK_FAILED, error=str(e))
-
-            # 启动后台线程
-            thread = threading.Thread(target=run_analysis)
-            thread.daemon = True
-            thread.start()
-
         # 返回任务ID和状态
         return jsonify({
             'task_id': task_id,
@@ -657,59 +353,100 @@ def start_stock_analysis():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/analysis_status/<task_id>', methods=['GET'])
-def get_analysis_status(task_id):
-    """获取个股分析任务状态"""
-    store = get_task_store('stock_analysis')
-    with task_lock:
-        if task_id not in store:
-            return jsonify({'error': '找不到指定的分析任务'}), 404
+def submit_analysis_task(stock_code, market_type='A', priority=None):
+    """提交个股分析任务，返回 (任务, 是否新建)"""
+    return task_queue.submit(
+        'stock_analysis',
+        {'stock_code': stock_code, 'market_type': market_type},
+        key=f"{stock_code}_{market_type}",
+        priority=priority
+    )
 
-        task = store[task_id]
 
-        # 基本状态信息
-        status = {
-            'id': task['id'],
-            'status': task['status'],
-            'progress': task.get('progress', 0),
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at']
-        }
+def task_status_response(task, with_total=False):
+    """任务状态查询的响应内容"""
+    status = {
+        'id': task['id'],
+        'status': task['status'],
+        'progress': task.get('progress', 0),
+        'created_at': task['created_at'],
+        'updated_at': task['updated_at']
+    }
+    if with_total:
+        status['total'] = task.get('total', 0)
+
+    # 市场扫描的阶段结果：符合条件的总数和当前的前K名
+    partial = task.get('partial')
+    if partial:
+        status['found'] = partial.get('found', 0)
+        if task['status'] == TASK_RUNNING and partial.get('results') is not None:
+            status['partial'] = partial['results']
+
+    # 如果任务完成，包含结果
+    if task['status'] == TASK_COMPLETED and 'result' in task:
+        status['result'] = task['result']
+
+    # 如果任务失败，包含错误信息
+    if task['status'] == TASK_FAILED and 'error' in task:
+        status['error'] = task['error']
+
+    return status
 
-        # 如果任务完成，包含结果
-        if task['status'] == TASK_COMPLETED and 'result' in task:
-            status['result'] = task['result']
 
-        # 如果任务失败，包含错误信息
-        if task['status'] == TASK_FAILED and 'error' in task:
-            status['error'] = task['error']
+@app.route('/api/analysis_status/<task_id>', methods=['GET'])
+def get_analysis_status(task_id):
+    """获取个股分析任务状态"""
+    task = task_queue.get(task_id, 'stock_analysis')
+    if task is None:
+        return jsonify({'error': '找不到指定的分析任务'}), 404
 
-        return custom_jsonify(status)
+    return custom_jsonify(task_status_response(task))
 
 
 @app.route('/api/cancel_analysis/<task_id>', methods=['POST'])
 def cancel_analysis(task_id):
     """取消个股分析任务"""
-    store = get_task_store('stock_analysis')
-    with task_lock:
-        if task_id not in store:
-            return jsonify({'error': '找不到指定的分析任务'}), 404
+    if task_queue.get(task_id, 'stock_analysis') is None:
+        return jsonify({'error': '找不到指定的分析任务'}), 404
+
+    if not task_queue.cancel(task_id):
+        return jsonify({'message': '任务已完成或失败，无法取消'})
+
+    return jsonify({'message': '任务已取消'})
 
-        task = store[task_id]
 
-        if task['status'] in [TASK_COMPLETED, TASK_FAILED]:
-            return jsonify({'message': '任务已完成或失败，无法取消'})
+@app.route('/api/task_stream/<task_id>', methods=['GET'])
+def task_stream(task_id):
+    """
+    以SSE推送任务进度和结果，替代轮询 /api/analysis_status 和 /api/scan_status
+    事件类型: progress（进行中）、completed（结果）、failed（错误），任务结束后关闭连接
+    """
+    task = task_queue.get(task_id)
+    if task is None:
+        return jsonify({'error': '找不到指定的任务'}), 404
 
-        # 更新状态为失败
-        task['status'] = TASK_FAILED
-        task['error'] = '用户取消任务'
-        task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    keepalive = TASK_QUEUE_CONFIG['stream_keepalive']
 
-        # 更新键索引的任务
-        if 'key' in task and task['key'] in store:
-            store[task['key']] = task
+    def generate():
+        current = task
+        while current is not None:
+            status = task_status_response(current, with_total=current['type'] == 'market_scan')
+            event = current['status'] if current['status'] in (TASK_COMPLETED, TASK_FAILED) else 'progress'
+            yield f"event: {event}\ndata: {fast_json.dumps(status).decode('utf-8')}\n\n"
+            if event != 'progress':
+                return
 
-        return jsonify({'message': '任务已取消'})
+            version = current['version']
+            current = task_watcher.wait(task_id, version, keepalive)
+            while current is not None and current['version'] == version:
+                # 无变化时发送注释行，保持连接不被代理超时断开
+                yield ": keepalive\n\n"
+                current = task_watcher.wait(task_id, version, keepalive)
+
+        yield f"event: failed\ndata: {json.dumps({'id': task_id, 'status': TASK_FAILED, 'error': '任务已被清理'})}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 # 保留原有API用于向后兼容
@@ -724,17 +461,12 @@ def enhanced_analysis():
         if not stock_code:
             return custom_jsonify({'error': '请输入股票代码'}), 400
 
-        # 调用新的任务系统，但模拟同步行为
-        # 这会导致和之前一样的超时问题，但保持兼容
+        # 提交到任务队列，等待工作进程完成以模拟同步行为
         timeout = 300
         start_time = time.time()
 
-        # 获取或创建任务
-        task_id, task, is_new = get_or_create_task(
-            'stock_analysis',
-            stock_code=stock_code,
-            market_type=market_type
-        )
+        task, is_new = submit_analysis_task(stock_code, market_type, data.get('priority'))
+        task_id = task['id']
 
         # 如果是已完成的任务，直接返回结果
         if task['status'] == TASK_COMPLETED and 'result' in task:
@@ -749,46 +481,19 @@ def enhanced_analysis():
             
             return custom_jsonify({'result': task['result']})
 
-        # 启动分析（如果是新任务）
-        if is_new:
-            # 同步执行分析
-            try:
-                result = analyzer.perform_enhanced_analysis(stock_code, market_type)
-                
-                # 保存分析结果到数据库
-                if USE_DATABASE:
-                    try:
-                        save_analysis_result_to_db(stock_code, market_type, result)
-                    except Exception as db_error:
-                        app.logger.error(f"保存分析结果到数据库失败: {str(db_error)}")
-                
-                update_task_status('stock_analysis', task_id, TASK_COMPLETED, progress=100, result=result)
-                app.logger.info(f"分析完成: {stock_code}，耗时 {time.time() - start_time:.2f} 秒")
-                return custom_jsonify({'result': result})
-            except Exception as e:
-                app.logger.error(f"分析过程中出错: {str(e)}")
-                update_task_status('stock_analysis', task_id, TASK_FAILED, error=str(e))
-                return custom_jsonify({'error': f'分析过程中出错: {str(e)}'}), 500
-        else:
-            # 已存在正在处理的任务，等待其完成
-            max_wait = timeout - (time.time() - start_time)
-            wait_interval = 0.5
-            waited = 0
-
-            while waited < max_wait:
-                with task_lock:
-                    current_task = store[task_id]
-                    if current_task['status'] == TASK_COMPLETED and 'result' in current_task:
-                        return custom_jsonify({'result': current_task['result']})
-                    if current_task['status'] == TASK_FAILED:
-                        error = current_task.get('error', '任务失败，无详细信息')
-                        return custom_jsonify({'error': error}), 500
-
-                time.sleep(wait_interval)
-                waited += wait_interval
-
-            # 超时
-            return custom_jsonify({'error': '处理超时，请稍后重试'}), 504
+        # 等待任务完成（由任务变化通知唤醒，不再逐个请求轮询）
+        current_task = task_watcher.wait_for_completion(task_id, timeout)
+        if current_task is None:
+            return custom_jsonify({'error': '任务已被清理，请重新提交'}), 500
+        if current_task['status'] == TASK_COMPLETED and 'result' in current_task:
+            app.logger.info(f"分析完成: {stock_code}，耗时 {time.time() - start_time:.2f} 秒")
+            return custom_jsonify({'result': current_task['result']})
+        if current_task['status'] == TASK_FAILED:
+            error = current_task.get('error', '任务失败，无详细信息')
+            return custom_jsonify({'error': f'分析过程中出错: {error}'}), 500
+
+        # 超时
+        return custom_jsonify({'error': '处理超时，请稍后重试'}), 504
 
     except Exception as e:
         app.logger.error(f"执行增强版分析时出错: {traceback.format_exc()}")
@@ -826,7 +531,7 @@ def server_error(error):
 
 # Update the get_stock_data function in web_server.py to handle date formatting properly
 @app.route('/api/stock_data', methods=['GET'])
-@cache.cached(timeout=300, query_string=True)
+@cache.cached(timeout=300, query_string=True, response_filter=http_cache.is_cacheable)
 def get_stock_data():
     try:
         stock_code = request.args.get('stock_code')
@@ -854,45 +559,122 @@ def get_stock_data():
         # 获取股票历史数据
         app.logger.info(
             f"获取股票 {stock_code} 的历史数据，市场: {market_type}, 起始日期: {start_date}, 结束日期: {end_date}")
-        df = analyzer.get_stock_data(stock_code, market_type, start_date, end_date)
-
-        # 计算技术指标
-        app.logger.info(f"计算股票 {stock_code} 的技术指标")
-        df = analyzer.calculate_indicators(df)
+        # 默认的1年区间优先使用收盘后预计算的技术指标，其余情况按K线缓存，同一数据只计算一次
+        materialized = eod_store.get(stock_code, market_type) if period == '1y' and eod_store is not None else None
+        if materialized is not None:
+            df = materialized['indicators']
+        else:
+            df = analyzer.get_indicator_data(stock_code, market_type, start_date, end_date)
 
         # 检查数据是否为空
         if df.empty:
             app.logger.warning(f"股票 {stock_code} 的数据为空")
             return custom_jsonify({'error': '未找到股票数据'}), 404
 
+        # 最后一根K线未变化时返回304，不再序列化
+        version = http_cache.frame_version(df)
+        response = http_cache.not_modified(version)
+        if response is not None:
+            return response
+
         # 将DataFrame转为JSON格式
         app.logger.info(f"将数据转换为JSON格式，行数: {len(df)}")
 
-        # 确保日期列是字符串格式 - 修复缓存问题
-        if 'date' in df.columns:
+        # 确保日期列是日期类型，按列统一格式化 - 修复缓存问题
+        if 'date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['date']):
             try:
-                if pd.api.types.is_datetime64_any_dtype(df['date']):
-                    df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-                else:
-                    df = df.copy()
-                    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                    df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+                df = df.copy()
+                df['date'] = pd.to_datetime(df['date'], errors='coerce')
             except Exception as e:
                 app.logger.error(f"处理日期列时出错: {str(e)}")
                 df['date'] = df['date'].astype(str)
 
-        # 将NaN值替换为None
-        df = df.replace({np.nan: None, np.inf: None, -np.inf: None})
+        # format=columns 返回列式数据 {length, columns: {列名: 值数组}}，列名不再逐行重复，
+        # 浮点数保留 precision 位小数（默认4位，足够图表显示）
+        if request.args.get('format') == 'columns':
+            precision = request.args.get('precision', 4, type=int)
+            columns = fast_json.frame_columns(df, date_format='%Y-%m-%d', precision=precision)
+            app.logger.info(f"数据处理完成，返回 {len(df)} 条记录（列式）")
+            return http_cache.set_version(
+                custom_jsonify({'format': 'columns', 'length': len(df), 'columns': columns}), version)
 
-        records = df.to_dict('records')
+        # 按列转换为记录，NaN/Inf 在编码时输出为 null
+        records = fast_json.frame_records(df, date_format='%Y-%m-%d')
 
         app.logger.info(f"数据处理完成，返回 {len(records)} 条记录")
-        return custom_jsonify({'data': records})
+        return http_cache.set_version(custom_jsonify({'data': records}), version)
     except Exception as e:
         app.logger.error(f"获取股票数据时出错: {str(e)}")
         app.logger.error(traceback.format_exc())
         return custom_jsonify({'error': str(e)}), 500
 
+@app.route('/api/market_screen', methods=['POST'])
+def market_screen():
+    """全市场快速筛选：行情快照预筛选后批量计算指标和评分"""
+    try:
+        data = request.json or {}
+        market_type = data.get('market_type', 'A')
+        min_score = data.get('min_score', 60)
+        limit = data.get('limit', maxstocknum)
+        filters = data.get('filters') or {}
+
+        results = analyzer.screen_market(market_type, min_score, filters, limit)
+        return custom_jsonify({'count': len(results), 'results': results})
+    except ValueError as e:
+        return custom_jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"全市场筛选时出错: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return custom_jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/intraday_data', methods=['GET'])
+def get_intraday_data():
+    """获取分钟K线及技术指标"""
+    try:
+        stock_code = request.args.get('stock_code')
+        market_type = request.args.get('market_type', 'A')
+        period = int(request.args.get('period', 5))
+
+        if not stock_code:
+            return custom_jsonify({'error': '请提供股票代码'}), 400
+
+        df = analyzer.get_intraday_indicator_data(stock_code, market_type, period)
+        if df.empty:
+            return custom_jsonify({'error': '未找到分钟K线数据'}), 404
+
+        records = fast_json.frame_records(df, date_format='%Y-%m-%d %H:%M')
+        return custom_jsonify({'period': period, 'data': records})
+    except ValueError as e:
+        return custom_jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"获取分钟K线时出错: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return custom_jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/intraday_scan', methods=['POST'])
+def intraday_scan():
+    """盘中监控自选股，按分钟K线计算评分"""
+    try:
+        data = request.json or {}
+        stock_list = data.get('stock_list', [])
+        market_type = data.get('market_type', 'A')
+        period = int(data.get('period', 5))
+        min_score = data.get('min_score', 0)
+
+        if not stock_list:
+            return custom_jsonify({'error': '请提供股票列表'}), 400
+
+        results = analyzer.scan_intraday(stock_list, market_type, period, min_score)
+        return custom_jsonify({'period': period, 'count': len(results), 'results': results})
+    except ValueError as e:
+        return custom_jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"盘中监控时出错: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return custom_jsonify({'error': str(e)}), 500
+
 @app.route('/api/start_market_scan', methods=['POST'])
 def start_market_scan():
     """启动市场扫描任务"""
@@ -901,6 +683,17 @@ def start_market_scan():
         stock_list = data.get('stock_list', [])
         min_score = data.get('min_score', 60)
         market_type = data.get('market_type', 'A')
+        # 预筛选: true 使用默认条件，或传入条件字典（min_amount/min_price/max_abs_change/min_turnover/exclude_st）
+        prefilter = data.get('prefilter')
+        # 只返回评分最高的前K只股票，默认读取 SCAN_CONFIG['top_k']，为0时不限数量
+        top_k = data.get('top_k')
+        if top_k is not None:
+            try:
+                if isinstance(top_k, bool):
+                    raise ValueError
+                top_k = max(0, int(top_k))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'top_k 必须是非负整数'}), 400
 
         if not stock_list:
             return jsonify({'error': '请提供股票列表'}), 400
@@ -910,79 +703,23 @@ def start_market_scan():
             app.logger.warning(f"股票列表过长 ({len(stock_list)}只)，截取前{maxstocknum}只")
             stock_list = stock_list[:maxstocknum]
 
-        # 创建新任务
-        task_id = generate_task_id()
-        task = {
-            'id': task_id,
-            'status': TASK_PENDING,
-            'progress': 0,
-            'total': len(stock_list),
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'params': {
+        # 提交到任务队列，由工作进程执行
+        task, _ = task_queue.submit(
+            'market_scan',
+            {
                 'stock_list': stock_list,
                 'min_score': min_score,
-                'market_type': market_type
-            }
-        }
-
-        with task_lock:
-            scan_tasks[task_id] = task
-
-        # 启动后台线程执行扫描
-        def run_scan():
-            try:
-                start_market_scan_task_status(task_id, TASK_RUNNING)
-
-                # 执行分批处理
-                results = []
-                total = len(stock_list)
-                batch_size = 10
-
-                for i in range(0, total, batch_size):
-                    if task_id not in scan_tasks or scan_tasks[task_id]['status'] != TASK_RUNNING:
-                        # 任务被取消
-                        app.logger.info(f"扫描任务 {task_id} 被取消")
-                        return
-
-                    batch = stock_list[i:i + batch_size]
-                    batch_results = []
-
-                    for stock_code in batch:
-                        try:
-                            report = analyzer.quick_analyze_stock(stock_code, market_type)
-                            if report['score'] >= min_score:
-                                batch_results.append(report)
-                        except Exception as e:
-                            app.logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
-                            continue
-
-                    results.extend(batch_results)
-
-                    # 更新进度
-                    progress = min(100, int((i + len(batch)) / total * 100))
-                    start_market_scan_task_status(task_id, TASK_RUNNING, progress=progress)
-
-                # 按得分排序
-                results.sort(key=lambda x: x['score'], reverse=True)
-
-                # 更新任务状态为完成
-                start_market_scan_task_status(task_id, TASK_COMPLETED, progress=100, result=results)
-                app.logger.info(f"扫描任务 {task_id} 完成，找到 {len(results)} 只符合条件的股票")
-
-            except Exception as e:
-                app.logger.error(f"扫描任务 {task_id} 失败: {str(e)}")
-                app.logger.error(traceback.format_exc())
-                start_market_scan_task_status(task_id, TASK_FAILED, error=str(e))
-
-        # 启动后台线程
-        thread = threading.Thread(target=run_scan)
-        thread.daemon = True
-        thread.start()
+                'market_type': market_type,
+                'prefilter': prefilter,
+                'top_k': top_k
+            },
+            priority=data.get('priority'),
+            total=len(stock_list)
+        )
 
         return jsonify({
-            'task_id': task_id,
-            'status': 'pending',
+            'task_id': task['id'],
+            'status': task['status'],
             'message': f'已启动扫描任务，正在处理 {len(stock_list)} 只股票'
         })
 
@@ -994,51 +731,23 @@ def start_market_scan():
 @app.route('/api/scan_status/<task_id>', methods=['GET'])
 def get_scan_status(task_id):
     """获取扫描任务状态"""
-    with task_lock:
-        if task_id not in scan_tasks:
-            return jsonify({'error': '找不到指定的扫描任务'}), 404
-
-        task = scan_tasks[task_id]
-
-        # 基本状态信息
-        status = {
-            'id': task['id'],
-            'status': task['status'],
-            'progress': task.get('progress', 0),
-            'total': task.get('total', 0),
-            'created_at': task['created_at'],
-            'updated_at': task['updated_at']
-        }
-
-        # 如果任务完成，包含结果
-        if task['status'] == TASK_COMPLETED and 'result' in task:
-            status['result'] = task['result']
+    task = task_queue.get(task_id, 'market_scan')
+    if task is None:
+        return jsonify({'error': '找不到指定的扫描任务'}), 404
 
-        # 如果任务失败，包含错误信息
-        if task['status'] == TASK_FAILED and 'error' in task:
-            status['error'] = task['error']
-
-        return custom_jsonify(status)
+    return custom_jsonify(task_status_response(task, with_total=True))
 
 
 @app.route('/api/cancel_scan/<task_id>', methods=['POST'])
 def cancel_scan(task_id):
     """取消扫描任务"""
-    with task_lock:
-        if task_id not in scan_tasks:
-            return jsonify({'error': '找不到指定的扫描任务'}), 404
-
-        task = scan_tasks[task_id]
+    if task_queue.get(task_id, 'market_scan') is None:
+        return jsonify({'error': '找不到指定的扫描任务'}), 404
 
-        if task['status'] in [TASK_COMPLETED, TASK_FAILED]:
-            return jsonify({'message': '任务已完成或失败，无法取消'})
+    if not task_queue.cancel(task_id):
+        return jsonify({'message': '任务已完成或失败，无法取消'})
 
-        # 更新状态为失败
-        task['status'] = TASK_FAILED
-        task['error'] = '用户取消任务'
-        task['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        return jsonify({'message': '任务已取消'})
+    return jsonify({'message': '任务已取消'})
 
 
 @app.route('/api/index_stocks', methods=['GET'])
@@ -1099,31 +808,22 @@ def get_industry_stocks():
         return jsonify({'error': str(e)}), 500
 
 
+def submit_eod_materialization():
+    """提交收盘后预计算任务（由任务工作进程执行，同一交易日只执行一次）"""
+    if not EOD_CONFIG['enabled']:
+        return None
+    run_date = datetime.now().strftime('%Y-%m-%d')
+    task, is_new = task_queue.submit('eod_materialize', {'market_type': EOD_CONFIG['market_type']},
+                                     key=f"eod_materialize_{run_date}")
+    if is_new:
+        app.logger.info(f"已提交收盘后预计算任务 {task['id']}")
+    return task
+
+
 # 添加到web_server.py
 def clean_old_tasks():
     """清理旧的扫描任务"""
-    with task_lock:
-        now = datetime.now()
-        to_delete = []
-
-        for task_id, task in scan_tasks.items():
-            # 解析更新时间
-            try:
-                updated_at = datetime.strptime(task['updated_at'], '%Y-%m-%d %H:%M:%S')
-                # 如果任务完成或失败且超过1小时，或者任务状态异常且超过3小时，清理它
-                if ((task['status'] in [TASK_COMPLETED, TASK_FAILED] and
-                     (now - updated_at).total_seconds() > 3600) or
-                        ((now - updated_at).total_seconds() > 10800)):
-                    to_delete.append(task_id)
-            except:
-                # 日期解析错误，添加到删除列表
-                to_delete.append(task_id)
-
-        # 删除旧任务
-        for task_id in to_delete:
-            del scan_tasks[task_id]
-
-        return len(to_delete)
+    return task_queue.cleanup('market_scan')
 
 
 # 修改 run_task_cleaner 函数，使其每 5 分钟运行一次并在 16:30 左右清理所有缓存
@@ -1139,23 +839,20 @@ def run_task_cleaner():
 
             # 如果是收盘时间，清理所有缓存
             if is_market_close_time:
-                # 清理分析器的数据缓存
-                analyzer.data_cache.clear()
+                # 清理所有分析器共用的数据缓存
+                cache_service.clear()
 
                 # 清理 Flask 缓存
                 cache.clear()
 
-                # 清理任务存储
-                with task_lock:
-                    for task_type in tasks:
-                        task_store = tasks[task_type]
-                        completed_tasks = [task_id for task_id, task in task_store.items()
-                                           if task['status'] == TASK_COMPLETED]
-                        for task_id in completed_tasks:
-                            del task_store[task_id]
+                # 清理已完成的任务，收盘后重新分析
+                task_queue.clear_completed()
 
                 app.logger.info("市场收盘时间检测到，已清理所有缓存数据")
 
+                # 清理后预计算常用股票的分析结果
+                submit_eod_materialization()
+
             if cleaned > 0:
                 app.logger.info(f"清理了 {cleaned} 个旧的扫描任务")
         except Exception as e:
@@ -1571,6 +1268,12 @@ def get_latest_news():
         only_important = request.args.get('important', '0') == '1'  # 是否只看重要新闻
         news_type = request.args.get('type', 'all')  # 新闻类型，可选值: all, hotspot
 
+        # 新闻文件未更新时返回304
+        version, last_modified = news_fetcher.get_news_version(days)
+        response = http_cache.not_modified(version, last_modified)
+        if response is not None:
+            return response
+
         # 从news_fetcher模块获取新闻数据
         news_data = news_fetcher.get_latest_news(days=days, limit=limit)
 
@@ -1690,67 +1393,13 @@ def get_latest_news():
 
                 news_data = [news for news in news_data if has_keyword(news)]
 
-        return jsonify({'success': True, 'news': news_data})
+        return http_cache.set_version(jsonify({'success': True, 'news': news_data}), version, last_modified)
     except Exception as e:
         app.logger.error(f"获取最新新闻数据时出错: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== 数据库保存功能 ====================
 
-def save_analysis_result_to_db(stock_code, market_type, analysis_result):
-    """保存分析结果到数据库"""
-    if not USE_DATABASE:
-        app.logger.info("数据库功能未启用，跳过保存")
-        return
-    
-    app.logger.info(f"开始保存分析结果到数据库: {stock_code}, {market_type}")
-    
-    session = get_session()
-    try:
-        # 提取基本信息
-        scores = analysis_result.get('scores', {})
-        # 兼容两种字段名：total_score 和 total
-        total_score = scores.get('total_score', scores.get('total', 0))
-        recommendation = analysis_result.get('recommendation', {}).get('action', '')
-        
-        app.logger.info(f"提取的信息 - 评分: {total_score}, 建议: {recommendation}")
-        
-        # 删除同一只股票的旧记录，只保留最新的
-        existing_records = session.query(AnalysisResult).filter(
-            AnalysisResult.stock_code == stock_code,
-            AnalysisResult.market_type == market_type
-        ).all()
-        
-        if existing_records:
-            app.logger.info(f"删除股票 {stock_code} 的 {len(existing_records)} 条旧记录")
-            for record in existing_records:
-                session.delete(record)
-            session.flush()  # 立即执行删除，但不提交
-        
-        # 创建新的分析记录
-        analysis_record = AnalysisResult(
-            stock_code=stock_code,
-            market_type=market_type,
-            total_score=total_score,
-            recommendation=recommendation,
-            analysis_data=json.dumps(analysis_result, ensure_ascii=False, default=str),
-            analysis_date=datetime.now()
-        )
-        
-        session.add(analysis_record)
-        session.commit()
-        
-        app.logger.info(f"分析结果已成功保存到数据库: {stock_code}, ID: {analysis_record.id}")
-        
-    except Exception as e:
-        session.rollback()
-        app.logger.error(f"保存分析结果到数据库失败: {str(e)}")
-        app.logger.error(f"错误详情: {traceback.format_exc()}")
-        raise
-    finally:
-        session.close()
-
-
 # ==================== 历史分析记录API ====================
 
 @app.route('/api/analysis_history', methods=['GET'])
@@ -1802,6 +1451,15 @@ def get_analysis_history():
             total_count = query.count()
             total_pages = (total_count + page_size - 1) // page_size
 
+            # 记录未变化时返回304，不再解析分析数据：保存时先删除旧记录再插入，
+            # 记录数、最大ID和最后更新时间可以反映表的变化，总数反映日期范围内记录的变化
+            table_version = session.query(func.count(AnalysisResult.id), func.max(AnalysisResult.id),
+                                          func.max(AnalysisResult.updated_at)).one()
+            version = (tuple(str(value) for value in table_version), total_count)
+            response = http_cache.not_modified(version)
+            if response is not None:
+                return response
+
             # 分页
             offset = (page - 1) * page_size
             records = query.offset(offset).limit(page_size).all()
@@ -1836,14 +1494,14 @@ def get_analysis_history():
                     app.logger.error(f"解析历史记录数据时出错: {str(e)}")
                     continue
 
-            return jsonify({
+            return http_cache.set_version(jsonify({
                 'success': True,
                 'data': history_data,
                 'total_count': total_count,
                 'total_pages': total_pages,
                 'current_page': page,
                 'page_size': page_size
-            })
+            }), version)
 
         finally:
             session.close()
@@ -1983,5 +1641,10 @@ cleaner_thread.daemon = True
 cleaner_thread.start()
 
 if __name__ == '__main__':
+    # 启动任务工作进程（使用gunicorn等部署时关闭，单独运行 python task_worker.py）
+    if TASK_QUEUE_CONFIG['embedded_worker']:
+        from task_worker import start_worker_process
+        start_worker_process()
+
     # 将 host 设置为 '0.0.0.0' 使其支持所有网络接口访问
     app.run(host='0.0.0.0', port=8899, debug=False)
\ No newline at end of file